@@ -1,21 +1,32 @@
+import functools
 import math
+import time
 
 import pydeck as pdk
 import streamlit as st
-from streamlit_autorefresh import st_autorefresh
 
 from streamlit_helpers import (
+    DATA_LAYER,
+    MAP_GEOMETRY,
+    STATION_SEARCH,
+    SECTION_TIMINGS,
+    ActivityFrame,
     activity_ranking,
     citywide_trend_chart,
     capacity_donut_chart,
     critical_split_donut,
     compute_capacity_metrics,
     compute_most_active,
-    filter_by_time,
     detect_static_bikes,
-    get_latest_snapshot,
+    forecast_risk_table,
+    load_citywide_rollup,
+    load_od_flows,
+    load_open_alerts,
+    load_station_clusters,
+    load_station_forecasts,
     load_station_data,
     net_change_chart,
+    OccupancyHistogram,
     prepare_snapshot_table,
     station_activity_table,
     station_health_scatter,
@@ -25,10 +36,9 @@ from streamlit_helpers import (
     utilization_distribution_chart,
     weekday_hour_heatmap,
 )
-
-
-# Auto-refresh every 45 seconds
-st_autorefresh(interval=45000, key="auto_refresh")
+from utils.downsampling import CHART_WIDTH_PX, point_budget
+from utils.map_layers import CLUSTER_PALETTE, MAP_HEX_ABOVE
+from utils.rebalancing import RebalancingPlanner, plan_summary
 
 
 st.set_page_config(
@@ -47,110 +57,207 @@ st.caption(
 with open("styles.css") as f:
     st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
-# Load DB data
-df = load_station_data()
-snapshot = get_latest_snapshot(df)
 
-# Sidebar controls
-with st.sidebar:
-    st.header("Paramètres d'analyse")
-    window_selection = st.selectbox(
-        "Fenêtre historique",
-        (
-            "Dernière heure",
-            "Dernières 3 heures",
-            "Dernières 6 heures",
-            "Dernières 12 heures",
-            "Dernières 24 heures",
-            "Toutes les données",
-        ),
+# Charts in a two-column row get half the point budget of full-width ones
+HALF_WIDTH_POINTS = point_budget(CHART_WIDTH_PX // 2)
+
+
+# ------------- Shared data -------------
+# Loaded once per new snapshot by the shared refresher, for every session;
+# everything derived is cached on (data version, name, parameters). Sections
+# call these on each of their own runs, so a fragment refreshing on its own
+# picks up the latest published data.
+def get_snapshot():
+    return DATA_LAYER.current()["snapshot"]
+
+
+def get_snapshot_table():
+    return DATA_LAYER.cached("snapshot_table", compute=lambda: prepare_snapshot_table(get_snapshot()))
+
+
+def get_snapshot_levels():
+    # Cumulated once per level: the threshold slider only does lookups
+    return DATA_LAYER.cached(
+        "snapshot_levels", compute=lambda: OccupancyHistogram.from_snapshot(get_snapshot_table())
     )
-    window_hours = {
-        "Dernière heure": 1,
-        "Dernières 3 heures": 3,
-        "Dernières 6 heures": 6,
-        "Dernières 12 heures": 12,
-        "Dernières 24 heures": 24,
-        "Toutes les données": None,
-    }[window_selection]
 
-    top_n = st.slider("Nombre de stations à afficher", 5, 25, 10)
-    critical_threshold = st.slider("Seuil critique (≤ vélos disponibles)", 0, 15, 3)
 
+def get_history(window_hours):
+    return DATA_LAYER.cached("history", window_hours, compute=lambda: load_station_data(hours=window_hours))
+
+
+def get_activity(window_hours):
+    # Sorted once, movement computed once: shared by every activity helper
+    return DATA_LAYER.cached("activity", window_hours, compute=lambda: ActivityFrame(get_history(window_hours)))
+
+
+# Beyond a few hours, city-wide charts read precomputed rollups
+ROLLUP_MIN_HOURS = 3
+
+
+def get_rollup(window_hours, grain):
+    """City-wide rollup of the window, or None to aggregate the raw history.
+
+    Rollups that do not reach back to the window's first sample (not yet
+    backfilled, or a grain finer than the compacted days) are not used.
+    """
+    if window_hours is not None and window_hours <= ROLLUP_MIN_HOURS:
+        return None
+    rollup = DATA_LAYER.cached(
+        "rollup", window_hours, grain, compute=lambda: load_citywide_rollup(window_hours, grain=grain)
+    )
+    history = get_history(window_hours)
+    if rollup.empty or (not history.empty and rollup["timestamp"].iloc[0] > history["timestamp"].min().floor(grain)):
+        return None
+    return rollup
 
-history_df = filter_by_time(df, window_hours)
-snapshot_table = prepare_snapshot_table(snapshot)
-full_snapshot = snapshot_table.copy()
 
 ANOMALY_WINDOW_MINUTES = 15
 ANOMALY_ACTIVITY_THRESHOLD = 5
 ANOMALY_STATIC_THRESHOLD = 1
 
-if history_df.empty:
-    anomalies_df = None
-else:
-    anomalies_df = detect_static_bikes(
-        history_df,
-        window_minutes=ANOMALY_WINDOW_MINUTES,
-        activity_threshold=ANOMALY_ACTIVITY_THRESHOLD,
-        static_threshold=ANOMALY_STATIC_THRESHOLD,
-    )
-
-# ------------- KPIs -------------
-metrics = compute_capacity_metrics(snapshot_table)
-top_station, movement = compute_most_active(history_df)
-critical_count = int((snapshot_table["free_bikes"] <= critical_threshold).sum())
-
-col1, col2, col3, col4 = st.columns(4)
-col1.metric("Stations actives", len(snapshot_table))
-col2.metric("Vélos disponibles", f"{metrics['total_bikes']:,}")
-col3.metric("Bornes libres", f"{metrics['total_docks']:,}")
-col4.metric("Disponibilité globale", f"{metrics['utilization']:.0%}")
-
-col5, col6 = st.columns(2)
-if top_station:
-    col5.metric("Station la plus active (30 min)", top_station, f"{int(movement)} mouvements")
-else:
-    col5.metric("Station la plus active (30 min)", "—", "0 mouvement")
-col6.metric(
-    "Stations sous le seuil",
-    critical_count,
-    help="Nombre de stations au niveau du seuil critique choisi",
-)
 
-if not snapshot_table.empty:
-    donut_col1, donut_col2 = st.columns(2)
-    donut_col1.plotly_chart(
-        capacity_donut_chart(snapshot_table),
-        width="stretch",
+def get_anomalies(window_hours):
+    def find_anomalies():
+        # Precomputed by the tracker's online detector when it runs; else from history
+        anomalies = load_open_alerts()
+        if anomalies is None and not get_history(window_hours).empty:
+            anomalies = detect_static_bikes(
+                get_activity(window_hours),
+                window_minutes=ANOMALY_WINDOW_MINUTES,
+                activity_threshold=ANOMALY_ACTIVITY_THRESHOLD,
+                static_threshold=ANOMALY_STATIC_THRESHOLD,
+            )
+        return anomalies
+
+    return DATA_LAYER.cached("anomalies", window_hours, compute=find_anomalies)
+
+
+# ------------- Sections -------------
+# Each section is a fragment: its own widgets and its own `run_every` rerun
+# only that section, never the whole page. Cadences in seconds (None: only
+# with the page).
+SECTION_CADENCES = {
+    "Indicateurs clés": 45,
+    "Carte": 45,
+    "Indicateurs globaux": 300,
+    "Carte de chaleur": 3600,
+    "Stations en direct": 45,
+    "Recherche de station": 60,
+    "Visualisations complémentaires": 300,
+    "Prévisions": 300,
+    "Rééquilibrage": None,
+    "Vélos défectueux": 60,
+    "Inventaire": 45,
+    "Analyse de l'activité": 300,
+}
+
+
+def section(name):
+    """Render as a fragment on the section's cadence, timed on every run."""
+
+    def decorate(render):
+        @st.fragment(run_every=SECTION_CADENCES[name])
+        @functools.wraps(render)
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return render(*args, **kwargs)
+            finally:
+                SECTION_TIMINGS.record(name, time.perf_counter() - started)
+
+        return run
+
+    return decorate
+
+
+@section("Indicateurs clés")
+def kpi_section(window_hours, critical_threshold):
+    snapshot_table = get_snapshot_table()
+    activity = get_activity(window_hours)
+    snapshot_levels = get_snapshot_levels()
+
+    metrics = DATA_LAYER.cached("capacity_metrics", compute=lambda: compute_capacity_metrics(snapshot_table))
+    top_station, movement = DATA_LAYER.cached(
+        "most_active", window_hours, compute=lambda: compute_most_active(activity)
     )
-    donut_col2.plotly_chart(
-        critical_split_donut(snapshot_table, critical_threshold),
-        width="stretch",
+    critical_count = int(snapshot_levels.weight_below(critical_threshold))
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Stations actives", len(snapshot_table))
+    col2.metric("Vélos disponibles", f"{metrics['total_bikes']:,}")
+    col3.metric("Bornes libres", f"{metrics['total_docks']:,}")
+    col4.metric("Disponibilité globale", f"{metrics['utilization']:.0%}")
+
+    col5, col6 = st.columns(2)
+    if top_station:
+        col5.metric("Station la plus active (30 min)", top_station, f"{int(movement)} mouvements")
+    else:
+        col5.metric("Station la plus active (30 min)", "—", "0 mouvement")
+    col6.metric(
+        "Stations sous le seuil",
+        critical_count,
+        help="Nombre de stations au niveau du seuil critique choisi",
     )
 
-st.divider()
+    if not snapshot_table.empty:
+        donut_col1, donut_col2 = st.columns(2)
+        donut_col1.plotly_chart(
+            DATA_LAYER.cached("capacity_donut", compute=lambda: capacity_donut_chart(snapshot_table)),
+            width="stretch",
+        )
+        donut_col2.plotly_chart(
+            DATA_LAYER.cached(
+                "critical_donut", critical_threshold,
+                compute=lambda: critical_split_donut(snapshot_levels, critical_threshold),
+            ),
+            width="stretch",
+        )
 
-# ------------- Map -------------
-st.subheader("🗺️ Carte interactive des stations")
-if snapshot_table.empty:
-    st.info("Aucune donnée de localisation disponible pour ce snapshot.")
-else:
-    map_df = snapshot_table.copy()
-    map_df["capacity"] = (map_df["free_bikes"] + map_df["empty_slots"]).replace(0, 1)
-    map_df["utilization_pct"] = map_df["free_bikes"] / map_df["capacity"]
-    map_df["radius"] = map_df["capacity"].clip(1, 20) * 1.0
 
-    def color_from_util(pct):
-        pct = max(0, min(1, pct))
-        r = int(220 - 150 * pct)
-        g = int(60 + 150 * pct)
-        b = int(50 + 80 * pct)
-        return [r, g, b, 230]
+def arc_frame():
+    flows = load_od_flows(get_snapshot())
+    if not flows.empty:
+        flows["width"] = 1 + 7 * flows["flow"] / flows["flow"].max()
+        flows["name"] = flows["origin_name"] + " → " + flows["destination_name"]
+        flows["details"] = "≈ " + flows["flow"].round(1).astype(str) + " trajets estimés"
+    return flows
+
+
+@section("Carte")
+def map_section(map_colouring, show_flows, map_detail):
+    st.subheader("🗺️ Carte interactive des stations")
+    snapshot_table = get_snapshot_table()
+    if snapshot_table.empty:
+        st.info("Aucune donnée de localisation disponible pour ce snapshot.")
+        return
+
+    hexagons = map_detail == "Hexagones" or (map_detail == "Auto" and len(snapshot_table) > MAP_HEX_ABOVE)
+    cluster_legend = None
+    if hexagons:
+        if map_colouring == "Profil d'usage" and map_detail == "Auto":
+            st.caption(
+                f"Plus de {MAP_HEX_ABOVE} stations : carte en hexagones, colorés par remplissage. "
+                "Choisissez « Stations » pour voir les profils d'usage."
+            )
+        layer_data = DATA_LAYER.cached("map_hexagons", compute=lambda: MAP_GEOMETRY.hexagon_records(snapshot_table))
+    else:
+        clusters = None
+        if map_colouring == "Profil d'usage":
+            clusters = load_station_clusters()
+            if clusters.empty:
+                st.caption("Profils d'usage indisponibles : les agrégats horaires sont encore vides.")
+                clusters = None
+            else:
+                cluster_legend = (
+                    clusters.drop_duplicates("cluster").sort_values("cluster")[["cluster", "cluster_label"]]
+                )
+        layer_data = DATA_LAYER.cached(
+            "map_stations", map_colouring if clusters is not None else "Disponibilité",
+            compute=lambda: MAP_GEOMETRY.station_records(snapshot_table, clusters),
+        )
 
-    map_df["color"] = map_df["utilization_pct"].apply(color_from_util)
-    center_lat = float(map_df["latitude"].mean())
-    center_lon = float(map_df["longitude"].mean())
+    center_lat, center_lon = MAP_GEOMETRY.center(snapshot_table)
 
     tile_layer = pdk.Layer(
         "TileLayer",
@@ -159,246 +266,415 @@ else:
         tile_size=256,
     )
 
-    stations_layer = pdk.Layer(
-        "ScatterplotLayer",
-        data=map_df,
-        get_position=["longitude", "latitude"],
-        get_radius="radius",
-        get_fill_color="color",
-        pickable=True,
-        radius_units="meters",
-        stroked=True,
-        get_line_color=[255, 255, 255],
-        line_width_min_pixels=1,
-        opacity=0.85,
-    )
+    if hexagons:
+        stations_layer = pdk.Layer(
+            "ColumnLayer",
+            data=layer_data,
+            get_position="position",
+            get_fill_color="color",
+            get_elevation="elevation",
+            elevation_scale=4,
+            radius=MAP_GEOMETRY.hex_radius_m,
+            disk_resolution=6,
+            extruded=True,
+            pickable=True,
+            opacity=0.7,
+        )
+    else:
+        stations_layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=layer_data,
+            get_position="position",
+            get_radius="radius",
+            get_fill_color="color",
+            pickable=True,
+            radius_units="meters",
+            stroked=True,
+            get_line_color=[255, 255, 255],
+            line_width_min_pixels=1,
+            opacity=0.85,
+        )
 
+    layers = [tile_layer, stations_layer]
     tooltip = {
-        "html": "Station: <b>{name}</b><br/>Vélos: {free_bikes}<br/>Bornes: {empty_slots}",
+        "html": "<b>{name}</b><br/>{details}",
         "style": {"color": "white", "font-size": "13px"},
     }
 
+    if show_flows:
+        flows_df = DATA_LAYER.cached("od_flows", compute=arc_frame)
+        if flows_df.empty:
+            st.caption("Aucun flux estimé : lancez `python -m scripts.estimate_od_flows`.")
+        else:
+            layers.append(
+                pdk.Layer(
+                    "ArcLayer",
+                    data=flows_df,
+                    get_source_position=["origin_lon", "origin_lat"],
+                    get_target_position=["destination_lon", "destination_lat"],
+                    get_source_color=[230, 120, 40, 200],
+                    get_target_color=[40, 120, 230, 200],
+                    get_width="width",
+                    pickable=True,
+                )
+            )
+
     st.pydeck_chart(
         pdk.Deck(
-            layers=[tile_layer, stations_layer],
+            layers=layers,
             initial_view_state=pdk.ViewState(
                 latitude=center_lat,
                 longitude=center_lon,
-                zoom=12.5,
+                zoom=10.5 if hexagons else 12.5,
                 pitch=45,
             ),
             tooltip=tooltip,
         )
     )
 
-    st.markdown(
-        """
-        <div class="map-legend">
-            <span class="legend-title">Disponibilité</span>
-            <div class="legend-scale">
-                <span><i style="background: rgb(220,60,50);"></i>Faible</span>
-                <span><i style="background: rgb(135,135,85);"></i>Moyenne</span>
-                <span><i style="background: rgb(70,210,130);"></i>Confort</span>
+    if cluster_legend is not None:
+        items = "".join(
+            f'<span><i style="background: rgb{tuple(CLUSTER_PALETTE[int(c) % len(CLUSTER_PALETTE)][:3].tolist())};"></i>{label}</span>'
+            for c, label in cluster_legend.itertuples(index=False, name=None)
+        )
+        st.markdown(
+            f"""
+            <div class="map-legend">
+                <span class="legend-title">Profil d'usage</span>
+                <div class="legend-scale">{items}</div>
             </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-st.divider()
+            """,
+            unsafe_allow_html=True,
+        )
+    else:
+        st.markdown(
+            """
+            <div class="map-legend">
+                <span class="legend-title">Disponibilité</span>
+                <div class="legend-scale">
+                    <span><i style="background: rgb(220,60,50);"></i>Faible</span>
+                    <span><i style="background: rgb(135,135,85);"></i>Moyenne</span>
+                    <span><i style="background: rgb(70,210,130);"></i>Confort</span>
+                </div>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
 
-# ------------- Citywide monitoring -------------
-st.subheader("📈 Indicateurs globaux")
-if history_df.empty:
-    st.info("Aucune donnée historique dans la fenêtre sélectionnée.")
-else:
-    trend_col, change_col = st.columns(2)
-    trend_col.plotly_chart(citywide_trend_chart(history_df), width="stretch")
-    change_col.plotly_chart(net_change_chart(history_df), width="stretch")
 
-dist_col, heat_col = st.columns(2)
-dist_col.plotly_chart(
-    utilization_distribution_chart(snapshot_table), width="stretch"
-)
-if history_df.empty:
-    heat_col.info("La carte de chaleur nécessite des données historiques.")
-else:
-    heat_col.plotly_chart(weekday_hour_heatmap(history_df), width="stretch")
+@section("Indicateurs globaux")
+def citywide_section(window_hours, top_n):
+    st.subheader("📈 Indicateurs globaux")
+    history_df = get_history(window_hours)
+    trend_rollup = get_rollup(window_hours, "15min")
+    if history_df.empty:
+        st.info("Aucune donnée historique dans la fenêtre sélectionnée.")
+    else:
+        trend_col, change_col = st.columns(2)
+        trend_col.plotly_chart(
+            DATA_LAYER.cached(
+                "citywide_trend", window_hours,
+                compute=lambda: citywide_trend_chart(history_df, rollup=trend_rollup, max_points=HALF_WIDTH_POINTS),
+            ),
+            width="stretch",
+        )
+        change_col.plotly_chart(
+            DATA_LAYER.cached(
+                "net_change", window_hours, compute=lambda: net_change_chart(history_df, rollup=trend_rollup)
+            ),
+            width="stretch",
+        )
 
-if not history_df.empty:
+    snapshot_table = get_snapshot_table()
     st.plotly_chart(
-        top_station_trend_chart(history_df, limit=min(5, top_n)),
+        DATA_LAYER.cached("utilization_distribution", compute=lambda: utilization_distribution_chart(snapshot_table)),
         width="stretch",
     )
 
-st.divider()
+    if not history_df.empty:
+        activity = get_activity(window_hours)
+        st.plotly_chart(
+            DATA_LAYER.cached(
+                "top_station_trend", window_hours, top_n,
+                compute=lambda: top_station_trend_chart(activity, limit=min(5, top_n)),
+            ),
+            width="stretch",
+        )
 
-# ------------- Real-time snapshot tables -------------
-st.subheader("🛰️ Stations en direct")
-sorted_snapshot = snapshot_table.sort_values("free_bikes", ascending=False)
-top_available = sorted_snapshot.sort_values("utilization_pct", ascending=False).head(
-    top_n
-)
-critical_table = (
-    sorted_snapshot[sorted_snapshot["free_bikes"] <= critical_threshold]
-    .sort_values("free_bikes")
-    .head(top_n)
-)
 
-col_a, col_b = st.columns(2)
-col_a.markdown("##### Stations sous le seuil")
-if critical_table.empty:
-    col_a.success("Toutes les stations sont au-dessus du seuil critique.")
-else:
-    col_a.dataframe(
-        critical_table[
-            [
-                "station_id",
-                "name",
-                "free_bikes",
-                "empty_slots",
-                "utilization_pct",
-            ]
-        ].set_index("station_id"),
-        height=360,
-    )
+@section("Carte de chaleur")
+def heatmap_section(window_hours):
+    history_df = get_history(window_hours)
+    heatmap_rollup = get_rollup(window_hours, "1h")
+    if history_df.empty:
+        st.info("La carte de chaleur nécessite des données historiques.")
+    else:
+        st.plotly_chart(
+            DATA_LAYER.cached(
+                "weekday_hour_heatmap", window_hours,
+                compute=lambda: weekday_hour_heatmap(history_df, rollup=heatmap_rollup),
+            ),
+            width="stretch",
+        )
 
-col_b.markdown("##### Stations les plus disponibles")
-if top_available.empty:
-    col_b.info("Aucune donnée instantanée disponible.")
-else:
-    col_b.dataframe(
-        top_available[
-            [
-                "station_id",
-                "name",
-                "free_bikes",
-                "empty_slots",
-                "utilization_pct",
-            ]
-        ].set_index("station_id"),
-        height=360,
+
+@section("Stations en direct")
+def live_stations_section(top_n, critical_threshold):
+    st.subheader("🛰️ Stations en direct")
+    snapshot_table = get_snapshot_table()
+    sorted_snapshot = snapshot_table.sort_values("free_bikes", ascending=False)
+    top_available = sorted_snapshot.sort_values("utilization_pct", ascending=False).head(
+        top_n
+    )
+    critical_table = (
+        sorted_snapshot[sorted_snapshot["free_bikes"] <= critical_threshold]
+        .sort_values("free_bikes")
+        .head(top_n)
     )
 
-st.divider()
+    col_a, col_b = st.columns(2)
+    col_a.markdown("##### Stations sous le seuil")
+    if critical_table.empty:
+        col_a.success("Toutes les stations sont au-dessus du seuil critique.")
+    else:
+        col_a.dataframe(
+            critical_table[
+                [
+                    "station_id",
+                    "name",
+                    "free_bikes",
+                    "empty_slots",
+                    "utilization_pct",
+                ]
+            ].set_index("station_id"),
+            height=360,
+        )
 
-# ------------- Station search -------------
-st.subheader("🔎 Recherche de station")
-if snapshot_table.empty:
-    st.info("Aucune station disponible dans le snapshot actuel.")
-else:
-    station_names = sorted(snapshot_table["name"].unique())
-    search_query = st.text_input("Rechercher une station par nom", "")
+    col_b.markdown("##### Stations les plus disponibles")
+    if top_available.empty:
+        col_b.info("Aucune donnée instantanée disponible.")
+    else:
+        col_b.dataframe(
+            top_available[
+                [
+                    "station_id",
+                    "name",
+                    "free_bikes",
+                    "empty_slots",
+                    "utilization_pct",
+                ]
+            ].set_index("station_id"),
+            height=360,
+        )
+
+
+@section("Recherche de station")
+def station_search_section(window_hours, critical_threshold):
+    st.subheader("🔎 Recherche de station")
+    snapshot_table = get_snapshot_table()
+    if snapshot_table.empty:
+        st.info("Aucune station disponible dans le snapshot actuel.")
+        return
+
+    search_index = DATA_LAYER.cached(
+        "station_search_index",
+        compute=lambda: STATION_SEARCH.index(snapshot_table[["station_id", "name"]].itertuples(index=False, name=None)),
+    )
+    search_query = st.text_input(
+        "Rechercher une station par nom", "", help="Sans accents ni abréviations : « gare st jean » trouve « Gare Saint-Jean »."
+    )
     if search_query:
-        filtered_names = [n for n in station_names if search_query.lower() in n.lower()]
+        filtered_names = list(dict.fromkeys(match.name for match in search_index.search(search_query, limit=50)))
     else:
-        filtered_names = station_names
+        filtered_names = sorted(snapshot_table["name"].unique())
 
     if not filtered_names:
         st.warning("Aucune station ne correspond à cette recherche.")
-    else:
-        selected_station = st.selectbox(
-            "Sélectionnez une station",
-            filtered_names,
-            key="station_search_select",
-        )
-        station_snapshot = snapshot_table[snapshot_table["name"] == selected_station].iloc[0]
-        station_id = station_snapshot["station_id"]
-        if (
-            anomalies_df is not None
-            and not anomalies_df.empty
-            and station_id in anomalies_df["station_id"].values
-        ):
-            st.markdown(
-                "<div class='badge-alert'>🛠️ Station signalée : vélos potentiellement bloqués</div>",
-                unsafe_allow_html=True,
-            )
-        capacity = station_snapshot["free_bikes"] + station_snapshot["empty_slots"]
-        util_pct = (
-            station_snapshot["free_bikes"] / capacity if capacity else 0
+        return
+
+    selected_station = st.selectbox(
+        "Sélectionnez une station",
+        filtered_names,
+        key="station_search_select",
+    )
+    station_snapshot = snapshot_table[snapshot_table["name"] == selected_station].iloc[0]
+    station_id = station_snapshot["station_id"]
+    anomalies_df = get_anomalies(window_hours)
+    if (
+        anomalies_df is not None
+        and not anomalies_df.empty
+        and station_id in anomalies_df["station_id"].values
+    ):
+        st.markdown(
+            "<div class='badge-alert'>🛠️ Station signalée : vélos potentiellement bloqués</div>",
+            unsafe_allow_html=True,
         )
+    capacity = station_snapshot["free_bikes"] + station_snapshot["empty_slots"]
+    util_pct = (
+        station_snapshot["free_bikes"] / capacity if capacity else 0
+    )
 
-        info_cols = st.columns(4)
-        info_cols[0].metric("Vélos disponibles", int(station_snapshot["free_bikes"]))
-        info_cols[1].metric("Bornes libres", int(station_snapshot["empty_slots"]))
-        info_cols[2].metric("Capacité", int(capacity))
-        info_cols[3].metric("Disponibilité", f"{util_pct:.0%}")
+    info_cols = st.columns(4)
+    info_cols[0].metric("Vélos disponibles", int(station_snapshot["free_bikes"]))
+    info_cols[1].metric("Bornes libres", int(station_snapshot["empty_slots"]))
+    info_cols[2].metric("Capacité", int(capacity))
+    info_cols[3].metric("Disponibilité", f"{util_pct:.0%}")
 
-        if history_df.empty:
-            st.info("Aucun historique pour la fenêtre choisie.")
-        else:
-            history_station = (
-                history_df[history_df["name"] == selected_station]
-                .sort_values("timestamp")
-            )
-            if history_station.empty:
-                st.info(
-                    "Pas de mesures enregistrées pour cette station sur la période sélectionnée."
-                )
-            else:
-                below_share = float(
-                    (history_station["free_bikes"] <= critical_threshold).mean()
-                )
-                above_share = max(0.0, 1 - below_share)
-                share_cols = st.columns(2)
-                share_cols[0].metric(
-                    "Temps sous le seuil",
-                    f"{below_share * 100:.0f}%",
-                )
-                share_cols[1].metric(
-                    "Temps au-dessus du seuil",
-                    f"{above_share * 100:.0f}%",
-                )
+    history_df = get_history(window_hours)
+    if history_df.empty:
+        st.info("Aucun historique pour la fenêtre choisie.")
+        return
 
-                st.plotly_chart(
-                    station_history_chart(history_station, selected_station),
-                    width="stretch",
-                )
-                recent_history = (
-                    history_station.sort_values("timestamp", ascending=False).head(20)
-                )
-                st.dataframe(
-                    recent_history[
-                        ["timestamp", "free_bikes", "empty_slots"]
-                    ].set_index("timestamp"),
-                    height=300,
-                )
-
-st.divider()
+    history_station = (
+        history_df[history_df["name"] == selected_station]
+        .sort_values("timestamp")
+    )
+    if history_station.empty:
+        st.info(
+            "Pas de mesures enregistrées pour cette station sur la période sélectionnée."
+        )
+        return
+
+    # Time-weighted: polling gaps do not skew the share
+    below_share = get_activity(window_hours).occupancy.station_share_below(station_id, critical_threshold) or 0.0
+    above_share = max(0.0, 1 - below_share)
+    share_cols = st.columns(2)
+    share_cols[0].metric(
+        "Temps sous le seuil",
+        f"{below_share * 100:.0f}%",
+    )
+    share_cols[1].metric(
+        "Temps au-dessus du seuil",
+        f"{above_share * 100:.0f}%",
+    )
 
-# ------------- Additional visuals -------------
-st.subheader("🎨 Visualisations complémentaires")
-vis_col1, vis_col2 = st.columns(2)
-if snapshot_table.empty:
-    vis_col1.info("Aucune donnée de snapshot pour afficher la santé des stations.")
-else:
-    vis_col1.plotly_chart(
-        station_health_scatter(snapshot_table, critical_threshold),
+    st.plotly_chart(
+        DATA_LAYER.cached(
+            "station_history", window_hours, selected_station,
+            compute=lambda: station_history_chart(history_station, selected_station),
+        ),
         width="stretch",
     )
+    recent_history = (
+        history_station.sort_values("timestamp", ascending=False).head(20)
+    )
+    st.dataframe(
+        recent_history[
+            ["timestamp", "free_bikes", "empty_slots"]
+        ].set_index("timestamp"),
+        height=300,
+    )
 
-if history_df.empty:
-    vis_col2.info("Le graphique de turn-over nécessite un historique.")
-else:
-    vis_col2.plotly_chart(
-        turnover_vs_capacity_chart(history_df, limit=max(10, top_n)),
-        width="stretch",
+
+@section("Visualisations complémentaires")
+def extra_visuals_section(window_hours, top_n, critical_threshold):
+    st.subheader("🎨 Visualisations complémentaires")
+    snapshot_table = get_snapshot_table()
+    history_df = get_history(window_hours)
+    vis_col1, vis_col2 = st.columns(2)
+    if snapshot_table.empty:
+        vis_col1.info("Aucune donnée de snapshot pour afficher la santé des stations.")
+    else:
+        vis_col1.plotly_chart(
+            DATA_LAYER.cached(
+                "station_health", critical_threshold,
+                compute=lambda: station_health_scatter(snapshot_table, critical_threshold),
+            ),
+            width="stretch",
+        )
+
+    if history_df.empty:
+        vis_col2.info("Le graphique de turn-over nécessite un historique.")
+    else:
+        activity = get_activity(window_hours)
+        vis_col2.plotly_chart(
+            DATA_LAYER.cached(
+                "turnover_vs_capacity", window_hours, top_n,
+                compute=lambda: turnover_vs_capacity_chart(activity, limit=max(10, top_n)),
+            ),
+            width="stretch",
+        )
+
+
+@section("Prévisions")
+def forecast_section(critical_threshold):
+    st.subheader("🔮 Risque de rupture dans l'heure")
+    # Independent of the window: forecasts always fit on FORECAST_HISTORY_DAYS
+    forecasts_df = DATA_LAYER.cached("forecasts", compute=load_station_forecasts)
+    risk_df = forecast_risk_table(forecasts_df, get_snapshot_table(), critical_threshold)
+    if forecasts_df.empty:
+        st.info("Pas encore assez d'historique pour prévoir la disponibilité.")
+    elif risk_df.empty:
+        st.success(f"Aucune station ne devrait passer sous {critical_threshold} vélos dans l'heure.")
+    else:
+        st.warning(
+            f"{len(risk_df)} station(s) devraient passer sous le seuil critique : à réapprovisionner en priorité."
+        )
+        st.dataframe(
+            risk_df.rename(
+                columns={"free_bikes": "Vélos actuels", "empty_slots": "Bornes actuelles"}
+            ).set_index("station_id"),
+            height=320,
+        )
+
+
+@section("Rééquilibrage")
+def rebalancing_section():
+    st.subheader("🚚 Plan de rééquilibrage")
+    st.caption("Tournées de camions calculées sur le dernier relevé pour ramener chaque station vers le taux de remplissage cible.")
+    plan_col1, plan_col2, plan_col3 = st.columns(3)
+    plan_trucks = plan_col1.number_input("Camions", 1, 20, 2)
+    plan_capacity = plan_col2.number_input("Capacité par camion", 5, 60, 20)
+    plan_fill = plan_col3.slider("Remplissage cible", 0.2, 0.8, 0.5, 0.05)
+
+    snapshot = get_snapshot()
+    if snapshot.empty:
+        st.info("Aucune capture disponible pour planifier des tournées.")
+        return
+
+    planner = RebalancingPlanner(trucks=plan_trucks, truck_capacity=plan_capacity)
+    plan_df = DATA_LAYER.cached(
+        "rebalancing_plan", plan_trucks, plan_capacity, plan_fill,
+        compute=lambda: planner.plan(snapshot, target_fill=plan_fill),
+    )
+    if plan_df.empty:
+        st.success("Aucune station ne s'écarte suffisamment de la cible.")
+        return
+
+    summary = plan_summary(plan_df)
+    sum_col1, sum_col2, sum_col3 = st.columns(3)
+    sum_col1.metric("Arrêts", summary["stops"])
+    sum_col2.metric("Vélos déplacés", summary["bikes_moved"])
+    sum_col3.metric("Distance totale", f"{summary['km']:.1f} km")
+    st.dataframe(
+        plan_df.drop(columns=["latitude", "longitude"]).rename(
+            columns={
+                "truck": "Camion",
+                "stop": "Arrêt",
+                "action": "Action",
+                "bikes": "Vélos",
+                "load": "Charge",
+                "leg_km": "Trajet (km)",
+            }
+        ),
+        height=320,
+        hide_index=True,
     )
 
-st.divider()
 
-# ------------- Broken bike detection -------------
-st.subheader("🚨 Suspicion de vélos défectueux")
-if anomalies_df is None:
-    st.info("Sélectionnez une fenêtre historique plus large pour activer l'analyse.")
-else:
-    if anomalies_df.empty:
+@section("Vélos défectueux")
+def anomalies_section(window_hours):
+    st.subheader("🚨 Suspicion de vélos défectueux")
+    anomalies_df = get_anomalies(window_hours)
+    if anomalies_df is None:
+        st.info("Sélectionnez une fenêtre historique plus large pour activer l'analyse.")
+    elif anomalies_df.empty:
         st.success("Aucune station active ne présente de vélos potentiellement bloqués.")
     else:
         st.warning(
             "Certaines stations restent actives mais leur stock ne bouge plus : vigilance maintenance."
         )
-        anomaly_snapshot = snapshot_table[["station_id", "free_bikes", "empty_slots"]]
+        anomaly_snapshot = get_snapshot_table()[["station_id", "free_bikes", "empty_slots"]]
         anomalies = anomalies_df.merge(
             anomaly_snapshot, on="station_id", how="left"
         )
@@ -419,14 +695,16 @@ else:
             height=320,
         )
 
-st.divider()
 
-# ------------- All stations overview -------------
-st.subheader("📋 Toutes les stations VCUB")
-st.caption("Visualisez l'inventaire complet issu du dernier relevé.")
-if full_snapshot.empty:
-    st.warning("Aucune capture n'a encore été enregistrée.")
-else:
+@section("Inventaire")
+def inventory_section():
+    st.subheader("📋 Toutes les stations VCUB")
+    st.caption("Visualisez l'inventaire complet issu du dernier relevé.")
+    full_snapshot = get_snapshot_table()
+    if full_snapshot.empty:
+        st.warning("Aucune capture n'a encore été enregistrée.")
+        return
+
     page_size = st.selectbox(
         "Taille de page",
         options=[10, 20, 50, 100],
@@ -464,20 +742,158 @@ else:
     )
     st.caption(f"Page {page}/{total_pages} – {total_rows} stations au total.")
 
-st.divider()
 
-# ------------- Activity insights -------------
-st.subheader("⚡ Analyse de l'activité")
-if history_df.empty:
-    st.info("Sélectionnez une fenêtre historique pour calculer les classements.")
-else:
-    leaderboard_df = station_activity_table(history_df, limit=top_n)
+@section("Analyse de l'activité")
+def activity_section(window_hours, top_n):
+    st.subheader("⚡ Analyse de l'activité")
+    if get_history(window_hours).empty:
+        st.info("Sélectionnez une fenêtre historique pour calculer les classements.")
+        return
+
+    activity = get_activity(window_hours)
+    leaderboard_df = DATA_LAYER.cached(
+        "activity_table", window_hours, top_n, compute=lambda: station_activity_table(activity, limit=top_n)
+    )
     chart_col, table_col = st.columns(2)
-    chart_col.plotly_chart(activity_ranking(history_df), width="stretch")
+    chart_col.plotly_chart(
+        DATA_LAYER.cached("activity_ranking", window_hours, compute=lambda: activity_ranking(activity)),
+        width="stretch",
+    )
     table_col.markdown("##### Tableau des mouvements")
     table_col.dataframe(
         leaderboard_df.set_index("station_id"),
         height=420,
     )
 
+
+@st.fragment(run_every=45)
+def runtime_panel():
+    cache_stats = DATA_LAYER.stats()
+    if cache_stats["published_at"] is None:
+        st.caption("Cache partagé : vide")
+    else:
+        st.caption(
+            f"Cache partagé : {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']}/{cache_stats['maxsize']} entrées, "
+            f"{cache_stats['evictions']} évictions · "
+            f"version {cache_stats['version']} publiée à {cache_stats['published_at']:%H:%M:%S}"
+        )
+    with st.expander("⏱️ Temps de rendu par section"):
+        timings = SECTION_TIMINGS.table()
+        if timings.empty:
+            st.caption("Aucune section rendue pour l'instant.")
+        else:
+            st.dataframe(
+                timings.drop(columns=["last_run"]).round(1).set_index("section"),
+                height=280,
+            )
+
+
+# Sidebar controls
+with st.sidebar:
+    st.header("Paramètres d'analyse")
+    window_selection = st.selectbox(
+        "Fenêtre historique",
+        (
+            "Dernière heure",
+            "Dernières 3 heures",
+            "Dernières 6 heures",
+            "Dernières 12 heures",
+            "Dernières 24 heures",
+            "Toutes les données",
+        ),
+    )
+    window_hours = {
+        "Dernière heure": 1,
+        "Dernières 3 heures": 3,
+        "Dernières 6 heures": 6,
+        "Dernières 12 heures": 12,
+        "Dernières 24 heures": 24,
+        "Toutes les données": None,
+    }[window_selection]
+
+    top_n = st.slider("Nombre de stations à afficher", 5, 25, 10)
+    critical_threshold = st.slider("Seuil critique (≤ vélos disponibles)", 0, 15, 3)
+    map_detail = st.radio(
+        "Détail de la carte",
+        ("Auto", "Stations", "Hexagones"),
+        horizontal=True,
+        help="Les hexagones regroupent les stations proches pour les vues d'ensemble ; « Auto » les utilise au-delà de "
+        f"{MAP_HEX_ABOVE} stations.",
+    )
+    # Hexagons mix stations of several profiles: they are always coloured by fill
+    map_colouring = st.radio(
+        "Couleur de la carte",
+        ("Disponibilité", "Profil d'usage"),
+        horizontal=True,
+        disabled=map_detail == "Hexagones",
+        help="Le profil d'usage regroupe les stations selon leur remplissage heure par heure sur la semaine. "
+        "Les hexagones sont toujours colorés par remplissage.",
+    )
+    show_flows = st.checkbox(
+        "Flux estimés entre stations",
+        help="Trajets probables déduits des variations simultanées de stock (7 derniers jours).",
+    )
+    # Hidden sections are not computed at all
+    visible = st.multiselect(
+        "Sections affichées",
+        list(SECTION_CADENCES),
+        default=list(SECTION_CADENCES),
+    )
+
+
+def show(name):
+    return name in visible
+
+
+# ------------- Page -------------
+if show("Indicateurs clés"):
+    kpi_section(window_hours, critical_threshold)
+    st.divider()
+
+if show("Carte"):
+    map_section(map_colouring, show_flows, map_detail)
+    st.divider()
+
+if show("Indicateurs globaux"):
+    citywide_section(window_hours, top_n)
+if show("Carte de chaleur"):
+    heatmap_section(window_hours)
+if show("Indicateurs globaux") or show("Carte de chaleur"):
+    st.divider()
+
+if show("Stations en direct"):
+    live_stations_section(top_n, critical_threshold)
+    st.divider()
+
+if show("Recherche de station"):
+    station_search_section(window_hours, critical_threshold)
+    st.divider()
+
+if show("Visualisations complémentaires"):
+    extra_visuals_section(window_hours, top_n, critical_threshold)
+    st.divider()
+
+if show("Prévisions"):
+    forecast_section(critical_threshold)
+    st.divider()
+
+if show("Rééquilibrage"):
+    rebalancing_section()
+    st.divider()
+
+if show("Vélos défectueux"):
+    anomalies_section(window_hours)
+    st.divider()
+
+if show("Inventaire"):
+    inventory_section()
+    st.divider()
+
+if show("Analyse de l'activité"):
+    activity_section(window_hours, top_n)
+
 st.success("Tableau de bord mis à jour ✔")
+
+with st.sidebar:
+    runtime_panel()
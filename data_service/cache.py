@@ -0,0 +1,125 @@
+"""Response cache with ETag revalidation for the data service."""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+# One cheap aggregate per table family: any write the endpoints could see
+# moves at least one of these values
+VERSION_QUERIES = {
+    "stations": text("SELECT max(updated_at), count(*) FROM stations"),
+    "events": text("SELECT max(id) FROM events"),
+    "alerts": text("SELECT max(id), count(*) FILTER (WHERE NOT resolved) FROM alerts"),
+    "forecasts": text("SELECT max(issued_at), count(*) FROM station_forecasts"),
+}
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored."""
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in (tag.removeprefix("W/") for tag in candidates)
+
+
+class ResponseCache:
+    """Serialized JSON bodies per (path, query), valid for one data version.
+
+    The data version of an endpoint is the tuple of its sources'
+    watermarks, each re-read at most every `version_ttl` seconds, so
+    clients polling faster than that cost no query at all. A hit returns
+    the stored bytes; a client sending the matching ETag gets a bodyless
+    304. Entries are evicted least recently used first, past `maxsize`
+    entries or `max_bytes` of bodies.
+    """
+
+    def __init__(self, maxsize=settings.response_cache_entries, max_bytes=settings.response_cache_bytes,
+                 version_ttl=settings.response_cache_version_ttl):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.version_queries = 0
+
+    async def version(self, db: AsyncSession, sources):
+        now = time.monotonic()
+        values = []
+        for source in sources:
+            cached = self._versions.get(source)
+            if cached is None or now - cached[1] >= self.version_ttl:
+                row = (await db.execute(VERSION_QUERIES[source])).one()
+                self.version_queries += 1
+                cached = (tuple(str(value) for value in row), now)
+                self._versions[source] = cached
+            values.append(cached[0])
+        return tuple(values)
+
+    def _store(self, key, entry):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous[1])
+        self._entries[key] = entry
+        self._bytes += len(entry[1])
+        while self._entries and (len(self._entries) > self.maxsize or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted[1])
+            self.evictions += 1
+
+    async def respond(self, request: Request, db: AsyncSession, sources, build):
+        """Response for `request`, calling `build()` only when the data moved.
+
+        `build` is an async callable returning the response model(s).
+        """
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+        version = await self.version(db, sources)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            cache_status = "HIT"
+        else:
+            payload = jsonable_encoder(await build())
+            body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+            entry = (version, body, strong_etag(body))
+            self._store(key, entry)
+            self.misses += 1
+            cache_status = "MISS"
+
+        _, body, etag = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Cache": cache_status}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "version_queries": self.version_queries,
+        }
@@ -1,27 +1,49 @@
 """Database session helpers for the data service."""
 
-from contextlib import contextmanager
+import asyncio
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from .config import settings
 
-engine = create_engine(settings.database_url, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+# Endpoints run on the event loop through asyncpg. The pool is sized
+# explicitly (a request waits at most pool_timeout for a connection),
+# connections are pinged before use, and Postgres cancels any statement
+# running past statement_timeout, so one slow query cannot hold a
+# connection indefinitely.
+#
+# The asyncpg dialect also registers binary json/jsonb codecs on every new
+# connection, so JSONB columns come back decoded even from text() queries;
+# `.columns(...=JSONB)` in the endpoints only declares the result type.
+async_engine = create_async_engine(
+    settings.asyncpg_url,
+    pool_size=settings.pool_size,
+    max_overflow=settings.max_overflow,
+    pool_timeout=settings.pool_timeout,
+    pool_recycle=settings.pool_recycle,
+    pool_pre_ping=True,
+    connect_args={
+        "server_settings": {"statement_timeout": str(settings.statement_timeout_ms)},
+        # Client-side guard in case the server never answers
+        "command_timeout": settings.statement_timeout_ms / 1000 * 2,
+    },
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    """FastAPI dependency that yields an async session."""
+    async with AsyncSessionLocal() as session:
+        yield session
 
 
-@contextmanager
-def session_scope():
-    """Provide a transactional scope for raw SQL statements."""
-    session = SessionLocal()
-    try:
-        yield session
-    finally:
-        session.close()
+async def warm_up(connections=settings.warmup_connections):
+    """Open `connections` pooled connections up front so the first requests
+    do not pay for TCP, auth and type introspection."""
 
+    async def ping():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
 
-def get_db():
-    """FastAPI dependency that yields a session."""
-    with session_scope() as session:
-        yield session
+    await asyncio.gather(*(ping() for _ in range(min(connections, settings.pool_size))))
@@ -1,28 +1,124 @@
 """FastAPI data service exposing station analytics endpoints."""
 
-from typing import List
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Path, status
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Path, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from slowapi import Limiter
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.util import get_remote_address
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.logging_config import setup_logger
+from utils.station_search import StationSearchCache
 
 from .auth import require_admin, require_user
+from .cache import ResponseCache
 from .config import settings
-from .db import get_db
-from .models import Alert, Station, StationDetail, StationEvent, TopStation
+from .db import AsyncSessionLocal, async_engine, get_async_db, warm_up
+from .models import (
+    Alert,
+    Station,
+    StationDetail,
+    StationEvent,
+    StationForecast,
+    StationSearchResult,
+    TopStation,
+)
 
 limiter = Limiter(key_func=get_remote_address, default_limits=[settings.rate_limit])
 
-app = FastAPI(title="Bike Data Service", version="0.2.0")
+# Postgres SQLSTATEs: statement cancelled by statement_timeout, missing table
+QUERY_CANCELED = "57014"
+UNDEFINED_TABLE = "42P01"
+
+logger = setup_logger("data_service_logger")
+
+STATION_NAMES_QUERY = text("SELECT id, name FROM stations")
+
+# Serialized bodies of the read endpoints, revalidated with ETags
+response_cache = ResponseCache()
+
+# Shared with the dashboard's search box; re-reads station names at most every SEARCH_INDEX_TTL
+station_search = StationSearchCache()
+
+
+async def refresh_station_search(db: AsyncSession):
+    rows = (await db.execute(STATION_NAMES_QUERY)).all()
+    # Building the index is CPU work: keep it off the event loop
+    return await run_in_threadpool(station_search.refresh, rows)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Fill the connection pool and the search index before serving.
+
+    Postgres being down does not stop the API from starting: requests then
+    fail (or recover) on their own, and the search index loads on first use.
+    """
+    try:
+        await warm_up()
+        async with AsyncSessionLocal() as db:
+            await refresh_station_search(db)
+    except Exception as exc:
+        logger.warning(f"Database not ready at start-up, serving anyway: {exc}")
+    yield
+    await async_engine.dispose()
+
+
+app = FastAPI(title="Bike Data Service", version="0.3.0", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
 protected_router = APIRouter(dependencies=[Depends(require_user)], tags=["Protected"])
 
 
+def sqlstate(exc: DBAPIError):
+    return getattr(exc.orig, "sqlstate", None) or getattr(exc.orig, "pgcode", None)
+
+
+@app.exception_handler(DBAPIError)
+async def database_error(request: Request, exc: DBAPIError):
+    """Statements cancelled by the statement timeout become a 503; any other
+    database error is logged and answered with a plain 500."""
+    if sqlstate(exc) == QUERY_CANCELED:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Database query timed out."},
+        )
+    logger.error(f"Database error on {request.method} {request.url.path}: {exc}", exc_info=exc)
+    return JSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"detail": "Database error."},
+    )
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_exhausted(request: Request, exc: PoolTimeoutError):
+    """No pooled connection freed up within pool_timeout: ask the client to retry."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database busy, retry shortly."},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(OSError)
+async def database_unreachable(request: Request, exc: OSError):
+    """asyncpg raises socket errors as is when Postgres cannot be reached."""
+    logger.error(f"Database unreachable on {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database unavailable."},
+        headers={"Retry-After": "5"},
+    )
+
+
 @app.get("/", tags=["Public"], description="Public endpoint, no authentication required")
 def public_root():
     """Simple greeting exposed without authentication."""
@@ -36,120 +132,196 @@ def protected_secret():
 
 
 @app.get("/stations", response_model=List[Station], tags=["Protected"])
-def list_stations(
-    db: Session = Depends(get_db),
+async def list_stations(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(require_user),
 ):
     """Return the latest status for every station."""
-    query = text(
-        """
-        SELECT id,
-               name,
-               capacity,
-               available_bikes,
-               broken_bikes,
-               updated_at,
-               location
-        FROM stations
-        ORDER BY name
-        """
-    )
-    rows = db.execute(query).mappings().all()
-    return [Station(**row) for row in rows]
+
+    async def build():
+        query = text(
+            """
+            SELECT id,
+                   name,
+                   capacity,
+                   available_bikes,
+                   broken_bikes,
+                   updated_at,
+                   location
+            FROM stations
+            ORDER BY name
+            """
+        ).columns(location=JSONB)
+        rows = (await db.execute(query)).mappings().all()
+        return [Station(**row) for row in rows]
+
+    return await response_cache.respond(request, db, ("stations",), build)
 
 
 @app.get("/stations/top10", response_model=List[TopStation], tags=["Protected"])
-def most_active_stations(
-    db: Session = Depends(get_db),
+async def most_active_stations(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(require_user),
 ):
     """Return the ten stations with the highest average hourly movement."""
-    query = text(
-        """
-        WITH hourly AS (
+
+    async def build():
+        query = text(
+            """
+            WITH hourly AS (
+                SELECT station_id,
+                       date_trunc('hour', occurred_at) AS hour_bucket,
+                       COUNT(*) AS events
+                FROM events
+                GROUP BY station_id, hour_bucket
+            )
+            SELECT s.id,
+                   s.name,
+                   COALESCE(AVG(hourly.events), 0) AS avg_events_per_hour
+            FROM stations s
+            LEFT JOIN hourly ON hourly.station_id = s.id
+            GROUP BY s.id, s.name
+            ORDER BY avg_events_per_hour DESC
+            LIMIT 10
+            """
+        )
+        rows = (await db.execute(query)).mappings().all()
+        return [TopStation(**row) for row in rows]
+
+    return await response_cache.respond(request, db, ("stations", "events"), build)
+
+
+@app.get("/stations/forecast", response_model=List[StationForecast], tags=["Protected"])
+async def station_forecasts(
+    request: Request,
+    horizon: Optional[int] = Query(None, description="Only this horizon, in minutes (15, 30, 60)"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(require_user),
+):
+    """Return the latest predicted bike availability per station and horizon."""
+
+    async def build():
+        query = text(
+            """
             SELECT station_id,
-                   date_trunc('hour', occurred_at) AS hour_bucket,
-                   COUNT(*) AS events
-            FROM events
-            GROUP BY station_id, hour_bucket
+                   horizon_minutes,
+                   issued_at,
+                   predicted_bikes,
+                   capacity
+            FROM station_forecasts
+            WHERE CAST(:horizon AS INTEGER) IS NULL OR horizon_minutes = :horizon
+            ORDER BY station_id, horizon_minutes
+            """
         )
-        SELECT s.id,
-               s.name,
-               COALESCE(AVG(hourly.events), 0) AS avg_events_per_hour
-        FROM stations s
-        LEFT JOIN hourly ON hourly.station_id = s.id
-        GROUP BY s.id, s.name
-        ORDER BY avg_events_per_hour DESC
-        LIMIT 10
-        """
-    )
-    rows = db.execute(query).mappings().all()
-    return [TopStation(**row) for row in rows]
+        rows = (await db.execute(query, {"horizon": horizon})).mappings().all()
+        return [StationForecast(**row) for row in rows]
+
+    try:
+        return await response_cache.respond(request, db, ("forecasts",), build)
+    except DBAPIError as exc:
+        # Deployments without a forecast publisher never create the table
+        if sqlstate(exc) != UNDEFINED_TABLE:
+            raise
+        await db.rollback()
+        return []
+
+
+@app.get("/stations/search", response_model=List[StationSearchResult], tags=["Protected"])
+async def search_stations(
+    q: str = Query(..., min_length=1, description="Station name, accents and abbreviations optional"),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(require_user),
+):
+    """Return the stations best matching a name: prefix matches first, then fuzzy ones."""
+    index = await refresh_station_search(db) if station_search.expired() else station_search.current
+    return [
+        StationSearchResult(id=match.station_id, name=match.name, score=match.score, prefix=match.prefix)
+        for match in index.search(q, limit=limit)
+    ]
 
 
 @app.get("/stations/{station_id}", response_model=StationDetail, tags=["Protected"])
-def station_detail(
+async def station_detail(
+    request: Request,
     station_id: str = Path(..., description="Station identifier"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(require_user),
 ):
     """Return station status plus recent event history."""
-    station_query = text(
-        """
-        SELECT id,
-               name,
-               capacity,
-               available_bikes,
-               broken_bikes,
-               updated_at,
-               location
-        FROM stations
-        WHERE id = :station_id
-        """
-    )
-    station_row = db.execute(station_query, {"station_id": station_id}).mappings().one_or_none()
-    if not station_row:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found.")
-
-    events_query = text(
-        """
-        SELECT id,
-               station_id,
-               event_type,
-               data,
-               occurred_at
-        FROM events
-        WHERE station_id = :station_id
-        ORDER BY occurred_at DESC
-        LIMIT 50
-        """
-    )
-    event_rows = db.execute(events_query, {"station_id": station_id}).mappings().all()
-    events = [StationEvent(**row) for row in event_rows]
-    return StationDetail(**station_row, events=events)
+
+    async def build():
+        station_query = text(
+            """
+            SELECT id,
+                   name,
+                   capacity,
+                   available_bikes,
+                   broken_bikes,
+                   updated_at,
+                   location
+            FROM stations
+            WHERE id = :station_id
+            """
+        ).columns(location=JSONB)
+        station_row = (await db.execute(station_query, {"station_id": station_id})).mappings().one_or_none()
+        if not station_row:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found.")
+
+        events_query = text(
+            """
+            SELECT id,
+                   station_id,
+                   event_type,
+                   data,
+                   occurred_at
+            FROM events
+            WHERE station_id = :station_id
+            ORDER BY occurred_at DESC
+            LIMIT 50
+            """
+        ).columns(data=JSONB)
+        event_rows = (await db.execute(events_query, {"station_id": station_id})).mappings().all()
+        events = [StationEvent(**row) for row in event_rows]
+        return StationDetail(**station_row, events=events)
+
+    return await response_cache.respond(request, db, ("stations", "events"), build)
 
 
 @app.get("/alerts", response_model=List[Alert], tags=["Protected"])
-def list_alerts(
-    db: Session = Depends(get_db),
+async def list_alerts(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(require_admin),
 ):
     """Return active alerts (admin only)."""
-    query = text(
-        """
-        SELECT id,
-               station_id,
-               issue_type,
-               reported_at,
-               data,
-               resolved
-        FROM alerts
-        WHERE resolved = FALSE
-        ORDER BY reported_at DESC
-        """
-    )
-    rows = db.execute(query).mappings().all()
-    return [Alert(**row) for row in rows]
+
+    async def build():
+        query = text(
+            """
+            SELECT id,
+                   station_id,
+                   issue_type,
+                   reported_at,
+                   data,
+                   resolved
+            FROM alerts
+            WHERE resolved = FALSE
+            ORDER BY reported_at DESC
+            """
+        ).columns(data=JSONB)
+        rows = (await db.execute(query)).mappings().all()
+        return [Alert(**row) for row in rows]
+
+    return await response_cache.respond(request, db, ("alerts",), build)
+
+
+@app.get("/cache/stats", tags=["Protected"])
+def cache_stats(user=Depends(require_admin)):
+    """Response cache size and hit / miss / 304 counters (admin only)."""
+    return response_cache.stats()
 
 
 app.include_router(protected_router)
@@ -44,3 +44,18 @@ class Alert(BaseModel):
     reported_at: datetime
     data: Optional[dict[str, Any]] = None
     resolved: bool
+
+
+class StationForecast(BaseModel):
+    station_id: str
+    horizon_minutes: int
+    issued_at: datetime
+    predicted_bikes: float
+    capacity: int
+
+
+class StationSearchResult(BaseModel):
+    id: str
+    name: str
+    score: float
+    prefix: bool
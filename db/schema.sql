@@ -33,6 +33,15 @@ CREATE TABLE IF NOT EXISTS alerts (
 CREATE INDEX IF NOT EXISTS idx_alerts_station_resolved
     ON alerts (station_id, resolved);
 
+CREATE TABLE IF NOT EXISTS station_forecasts (
+    station_id TEXT NOT NULL,
+    horizon_minutes INTEGER NOT NULL,
+    issued_at TIMESTAMPTZ NOT NULL,
+    predicted_bikes REAL NOT NULL CHECK (predicted_bikes >= 0),
+    capacity INTEGER NOT NULL CHECK (capacity >= 0),
+    PRIMARY KEY (station_id, horizon_minutes)
+);
+
 CREATE TABLE IF NOT EXISTS service_clients (
     client_id TEXT PRIMARY KEY,
     secret_hash TEXT NOT NULL,
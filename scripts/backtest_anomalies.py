@@ -0,0 +1,66 @@
+"""Replay the static-bike rule over the full history and sweep its thresholds.
+
+    python -m scripts.backtest_anomalies --intervals data/static_intervals.csv
+    python -m scripts.backtest_anomalies --window 10 15 30 --activity 3 5 10 --static 0 1 2
+
+With one value per parameter the flagged intervals are written out; with
+several, every combination is scored (in parallel) and the table printed.
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from utils.alerts import (
+    ANOMALY_ACTIVITY_HOURS,
+    ANOMALY_ACTIVITY_THRESHOLD,
+    ANOMALY_STATIC_THRESHOLD,
+    ANOMALY_WINDOW_MINUTES,
+)
+from utils.anomaly_backtest import BacktestData, backtest, sweep
+from utils.logging_config import setup_logger
+from utils.parquet_store import load_full_history
+
+logger = setup_logger("backtest_logger")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--window", type=float, nargs="+", default=[ANOMALY_WINDOW_MINUTES], help="Recent window (minutes).")
+    parser.add_argument("--activity", type=int, nargs="+", default=[ANOMALY_ACTIVITY_THRESHOLD], help="Minimum movement.")
+    parser.add_argument("--static", type=int, nargs="+", default=[ANOMALY_STATIC_THRESHOLD], help="Maximum recent range.")
+    parser.add_argument("--activity-hours", type=float, nargs="+", default=[ANOMALY_ACTIVITY_HOURS])
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--intervals", default=None, help="CSV path for the flagged intervals (single combination).")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = BacktestData(load_full_history(columns=["station_id", "name", "free_bikes", "timestamp"]))
+    logger.info(f"Loaded {len(data)} samples in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    results = sweep(
+        data,
+        window_minutes=args.window,
+        activity_threshold=args.activity,
+        static_threshold=args.static,
+        activity_hours=args.activity_hours,
+        processes=args.processes,
+    )
+    logger.info(f"Scored {len(results)} combination(s) in {time.perf_counter() - started:.2f}s")
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        print(results.to_string(index=False))
+
+    if args.intervals:
+        if len(results) > 1:
+            parser.error("--intervals needs a single value per parameter")
+        intervals = backtest(
+            data,
+            window_minutes=args.window[0],
+            activity_threshold=args.activity[0],
+            static_threshold=args.static[0],
+            activity_hours=args.activity_hours[0],
+        )
+        intervals.to_csv(args.intervals, index=False)
+        logger.info(f"Wrote {len(intervals)} intervals to {args.intervals}")
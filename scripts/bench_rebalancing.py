@@ -0,0 +1,61 @@
+"""Rebalancing planner solve time against network size, on synthetic networks.
+
+    python -m scripts.bench_rebalancing --sizes 200 1000 2000 5000 --trucks 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.rebalancing import RebalancingPlanner, haversine_matrix, plan_summary
+
+
+def synthetic_network(size, seed=0):
+    """Stations scattered over a ~20 km city, with random stock levels."""
+    rng = np.random.default_rng(seed)
+    capacity = rng.integers(10, 40, size)
+    free_bikes = rng.binomial(capacity, rng.beta(0.8, 0.8, size))
+    return pd.DataFrame({
+        "station_id": [f"st-{i:05d}" for i in range(size)],
+        "name": [f"Station {i}" for i in range(size)],
+        "latitude": 44.84 + rng.normal(0, 0.05, size),
+        "longitude": -0.58 + rng.normal(0, 0.07, size),
+        "free_bikes": free_bikes,
+        "empty_slots": capacity - free_bikes,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 1000, 2000, 5000])
+    parser.add_argument("--trucks", type=int, default=10)
+    parser.add_argument("--capacity", type=int, default=20)
+    parser.add_argument("--max-stops", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=10.0, help="Solver time budget (s).")
+    args = parser.parse_args()
+
+    planner = RebalancingPlanner(
+        trucks=args.trucks,
+        truck_capacity=args.capacity,
+        max_stops=args.max_stops,
+        time_budget=args.budget,
+    )
+    print(f"{'stations':>8} {'matrix':>9} {'solve':>9} {'trucks':>6} {'stops':>6} {'bikes':>6} {'km':>8}")
+    for size in args.sizes:
+        network = synthetic_network(size)
+
+        started = time.perf_counter()
+        haversine_matrix(network["latitude"], network["longitude"])
+        matrix_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        stops = planner.plan(network)
+        solve_seconds = time.perf_counter() - started
+
+        summary = plan_summary(stops)
+        print(
+            f"{size:>8} {matrix_seconds * 1000:>7.1f}ms {solve_seconds * 1000:>7.1f}ms "
+            f"{summary['trucks']:>6} {summary['stops']:>6} {summary['bikes_moved']:>6} {summary['km']:>8.1f}"
+        )
@@ -0,0 +1,193 @@
+"""Read latency while the tracker ingests: one writer thread, N reader threads.
+
+    python -m scripts.bench_sqlite_concurrency --readers 8 --seconds 10
+
+Runs the same workload twice on a scratch copy of the schema: first with
+the historical setup (rollback journal, a fresh connection per query),
+then through utils.connections (WAL, pooled read-only readers, retrying
+writer).
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from scripts.fetch_stations import INSERT_SQL, normalize_snapshot, snapshot_rows, store_snapshot
+from utils.connections import ConnectionManager
+from utils.queries import window_query
+from utils.rollups import create_rollup_tables
+
+SCHEMA = """
+    CREATE TABLE station_activity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station_id TEXT,
+        name TEXT,
+        free_bikes INTEGER,
+        empty_slots INTEGER,
+        latitude REAL,
+        longitude REAL,
+        timestamp TEXT
+    );
+    CREATE INDEX idx_station_activity_timestamp ON station_activity (timestamp);
+    CREATE INDEX idx_station_activity_station_ts ON station_activity (station_id, timestamp);
+"""
+
+
+def synthetic_stations(count):
+    return [
+        {
+            "id": f"st-{i:05d}",
+            "name": f"Station {i}",
+            "free_bikes": i % 20,
+            "empty_slots": 20 - i % 20,
+            "latitude": 44.8 + i * 1e-4,
+            "longitude": -0.6 + i * 1e-4,
+        }
+        for i in range(count)
+    ]
+
+
+def seed(db_path, stations, snapshots):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    # store_snapshot folds every batch into the rollups
+    create_rollup_tables(conn)
+    start = datetime.now(timezone.utc) - timedelta(minutes=5 * snapshots)
+    for i in range(snapshots):
+        store_snapshot(conn, normalize_snapshot(stations, start + timedelta(minutes=5 * i)))
+    conn.close()
+
+
+class LegacyConnections:
+    """What the code did before: default journal, one connection per use."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def read(self, sql, params):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def write(self, fn, *args):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return fn(conn, *args)
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+class PooledConnections:
+    def __init__(self, db_path, readers):
+        self.db_path = db_path
+        self.manager = ConnectionManager(db_path, readers=readers)
+
+    def read(self, sql, params):
+        with self.manager.reader() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def write(self, fn, *args):
+        return self.manager.write(fn, *args)
+
+    def close(self):
+        self.manager.close()
+
+
+def store_slowly(conn, batch, hold):
+    """Bulk insert that keeps its write transaction open for `hold` seconds."""
+    with conn:
+        conn.executemany(INSERT_SQL, snapshot_rows(batch))
+        time.sleep(hold)
+    return len(batch["station_id"])
+
+
+def run(label, connections, stations, readers, seconds, write_every, hold):
+    stop = threading.Event()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    writes = [0]
+
+    sql_conn = sqlite3.connect(connections.db_path)
+    sql, params = window_query(sql_conn, since=datetime.now(timezone.utc) - timedelta(hours=1))
+    sql_conn.close()
+
+    def writer():
+        while not stop.is_set():
+            batch = normalize_snapshot(stations)
+            try:
+                connections.write(store_slowly, batch, hold)
+                writes[0] += 1
+            except sqlite3.OperationalError as exc:
+                with lock:
+                    errors.append(f"write: {exc}")
+            stop.wait(write_every)
+
+    def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                connections.read(sql, params)
+            except sqlite3.OperationalError as exc:
+                with lock:
+                    errors.append(f"read: {exc}")
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    connections.close()
+
+    latencies.sort()
+    if latencies:
+        def pct(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        print(
+            f"{label:<8} reads={len(latencies):>6}  p50={pct(0.50):7.2f}ms  "
+            f"p95={pct(0.95):7.2f}ms  p99={pct(0.99):7.2f}ms  max={latencies[-1] * 1000:7.2f}ms  "
+            f"mean={statistics.mean(latencies) * 1000:6.2f}ms  writes={writes[0]}  errors={len(errors)}"
+        )
+    else:
+        print(f"{label:<8} no successful reads, errors={len(errors)}")
+    for message in sorted(set(errors))[:3]:
+        print(f"         {message}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--snapshots", type=int, default=288, help="History to seed (5-minute snapshots).")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-every", type=float, default=0.2, help="Pause between snapshots.")
+    parser.add_argument("--hold", type=float, default=0.05, help="Seconds each write transaction stays open.")
+    args = parser.parse_args()
+
+    stations = synthetic_stations(args.stations)
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("legacy", "wal"):
+            db_path = os.path.join(tmp, f"{label}.db")
+            seed(db_path, stations, args.snapshots)
+            if label == "legacy":
+                connections = LegacyConnections(db_path)
+            else:
+                connections = PooledConnections(db_path, args.readers)
+            run(label, connections, stations, args.readers, args.seconds, args.write_every, args.hold)
@@ -0,0 +1,30 @@
+"""Rebuild the station × time cube from the full history.
+
+    python -m scripts.build_cube --slot 300
+
+Run the tracker with STATION_CUBE=1 to keep the cube up to date afterwards.
+"""
+
+import argparse
+import time
+
+from utils.logging_config import setup_logger
+from utils.parquet_store import load_full_history
+from utils.station_cube import CUBE_ROOT, CUBE_SLOT_SECONDS, build_cube
+
+logger = setup_logger("cube_logger")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=CUBE_ROOT)
+    parser.add_argument("--slot", type=int, default=CUBE_SLOT_SECONDS, help="Slot width in seconds.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cube = build_cube(load_full_history(), root=args.root, slot_seconds=args.slot)
+    stations, slots = cube.shape
+    logger.info(
+        f"Built {stations} stations × {slots} slots of {args.slot}s "
+        f"({int(cube.mask.sum())} samples) in {args.root} in {time.perf_counter() - started:.2f}s"
+    )
@@ -0,0 +1,231 @@
+"""Retention job: keep recent raw snapshots, downsample older ones.
+
+    python -m scripts.compact_history --keep-days 14 --bucket 3600
+    python -m scripts.compact_history --archive data/bike_archive.db
+
+Raw rows older than the retention period are folded, one bucket at a time,
+into station_history_compact (min / max / last / sums / movement per
+station and bucket) and then removed from station_activity, optionally
+after being copied to an archive database. Only days already written to
+the Parquet export are compacted (run scripts.export_parquet first), so
+full-resolution history is never lost. Each bucket is its own short transaction on
+the shared writer connection, so a running tracker is only ever held up
+for one bucket's worth of work.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from utils.compaction import INSERT_COMPACT, create_compact_tables
+from utils.connections import get_manager
+from utils.db import DB_PATH, is_warehouse
+from utils.logging_config import setup_logger
+from utils.parquet_store import PARQUET_ROOT, exported_until
+from utils.queries import ACTIVITY_COLUMNS, window_query
+
+load_dotenv()
+
+RAW_RETENTION_DAYS = float(os.getenv("RAW_RETENTION_DAYS", 14))
+COMPACT_BUCKET_SECONDS = int(os.getenv("COMPACT_BUCKET_SECONDS", 3600))
+COMPACT_PAUSE_SECONDS = float(os.getenv("COMPACT_PAUSE_SECONDS", 0.05))
+
+logger = setup_logger("compaction_logger")
+
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive.station_activity (
+        station_id TEXT,
+        name TEXT,
+        free_bikes INTEGER,
+        empty_slots INTEGER,
+        latitude REAL,
+        longitude REAL,
+        timestamp TEXT
+    )
+"""
+
+def _epoch(dt):
+    return int(dt.timestamp())
+
+
+def _from_epoch(ts):
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+def oldest_raw_epoch(conn, not_before=None):
+    if is_warehouse(conn):
+        sql, params = "SELECT MIN(ts) FROM station_facts", []
+        if not_before is not None:
+            sql, params = sql + " WHERE ts >= ?", [not_before]
+        (value,) = conn.execute(sql, params).fetchone()
+        return value
+
+    sql, params = "SELECT MIN(timestamp) FROM station_activity", []
+    if not_before is not None:
+        sql, params = sql + " WHERE timestamp >= ?", [_from_epoch(not_before).isoformat()]
+    (value,) = conn.execute(sql, params).fetchone()
+    return None if value is None else _epoch(datetime.fromisoformat(value))
+
+
+def last_compacted(conn):
+    rows = conn.execute(
+        """
+        SELECT c.station_id, c.last_bikes
+        FROM station_history_compact c
+        JOIN (
+            SELECT station_id, MAX(bucket) AS bucket
+            FROM station_history_compact
+            GROUP BY station_id
+        ) latest USING (station_id, bucket)
+        """
+    )
+    return dict(rows.fetchall())
+
+
+def summarize(rows, previous):
+    """Per-station min/max/last/movement for one bucket of raw rows.
+
+    `previous` maps station_id to the last free_bikes value before this
+    bucket, so movement across bucket boundaries is not lost.
+    """
+    rows = rows.sort_values(["station_id", "timestamp"])
+    prior = rows.groupby("station_id")["free_bikes"].shift()
+    first = prior.isna()
+    prior[first] = rows.loc[first, "station_id"].map(previous)
+    rows = rows.assign(movement=(rows["free_bikes"] - prior).abs().fillna(0))
+
+    return rows.groupby("station_id").agg(
+        name=("name", "last"),
+        latitude=("latitude", "last"),
+        longitude=("longitude", "last"),
+        samples=("free_bikes", "count"),
+        min_bikes=("free_bikes", "min"),
+        max_bikes=("free_bikes", "max"),
+        last_bikes=("free_bikes", "last"),
+        last_empty=("empty_slots", "last"),
+        movement=("movement", "sum"),
+        sum_bikes=("free_bikes", "sum"),
+        sum_empty=("empty_slots", "sum"),
+    ).reset_index()
+
+
+def compact_bucket(conn, lo, hi, previous, archive):
+    since, until = _from_epoch(lo), _from_epoch(hi)
+    sql, params = window_query(conn, since=since, until=until)
+    rows = pd.read_sql(sql, conn, params=params)
+    if rows.empty:
+        return 0
+
+    rows["timestamp"] = pd.to_datetime(rows["timestamp"], format="ISO8601")
+    summary = summarize(rows, previous)
+
+    with conn:
+        conn.executemany(
+            INSERT_COMPACT,
+            (
+                (
+                    r.station_id, lo, hi - lo, r.name, r.latitude, r.longitude,
+                    int(r.samples), int(r.min_bikes), int(r.max_bikes),
+                    int(r.last_bikes), int(r.last_empty), int(r.movement),
+                    int(r.sum_bikes), int(r.sum_empty),
+                )
+                for r in summary.itertuples(index=False)
+            ),
+        )
+        if archive:
+            conn.execute(
+                f"INSERT INTO archive.station_activity ({ACTIVITY_COLUMNS}) {sql}", params
+            )
+        if is_warehouse(conn):
+            conn.execute("DELETE FROM station_facts WHERE ts >= ? AND ts < ?", (lo, hi))
+        else:
+            conn.execute(
+                "DELETE FROM station_activity WHERE timestamp >= ? AND timestamp < ?",
+                (since.isoformat(), until.isoformat()),
+            )
+
+    previous.update(zip(summary["station_id"], summary["last_bikes"]))
+    return len(rows)
+
+
+def compact(
+    db_path=DB_PATH,
+    keep_days=RAW_RETENTION_DAYS,
+    bucket_seconds=COMPACT_BUCKET_SECONDS,
+    archive_path=None,
+    pause=COMPACT_PAUSE_SECONDS,
+    max_buckets=None,
+    parquet_root=PARQUET_ROOT,
+):
+    """Compact every whole bucket older than `keep_days` and already exported
+    to Parquet; returns rows removed."""
+    manager = get_manager(db_path)
+    cutoff = _epoch(datetime.now(timezone.utc) - timedelta(days=keep_days))
+    exported = exported_until(parquet_root)
+    if exported is None:
+        logger.warning("Nothing compacted: no day has been exported to Parquet yet")
+        return 0
+    if _epoch(exported) < cutoff:
+        logger.info(f"Compaction stops at the Parquet export boundary {exported.isoformat()}")
+        cutoff = _epoch(exported)
+    cutoff -= cutoff % bucket_seconds
+
+    def prepare(conn):
+        create_compact_tables(conn)
+        if archive_path:
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+            conn.execute(ARCHIVE_SCHEMA)
+        return last_compacted(conn)
+
+    previous = manager.write(prepare)
+    started = time.perf_counter()
+    removed = buckets = 0
+    try:
+        cursor = None
+        while max_buckets is None or buckets < max_buckets:
+            oldest = manager.write(oldest_raw_epoch, cursor)
+            if oldest is None or oldest >= cutoff:
+                break
+            lo = oldest - oldest % bucket_seconds
+            hi = lo + bucket_seconds
+            removed += manager.write(compact_bucket, lo, hi, previous, bool(archive_path))
+            buckets += 1
+            cursor = hi
+            if pause:
+                time.sleep(pause)
+    finally:
+        if archive_path:
+            manager.write(lambda conn: conn.execute("DETACH DATABASE archive"))
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Compacted {removed} raw rows into {buckets} buckets of {bucket_seconds}s "
+        f"before {_from_epoch(cutoff).isoformat()} in {elapsed:.1f}s"
+    )
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--keep-days", type=float, default=RAW_RETENTION_DAYS)
+    parser.add_argument("--bucket", type=int, default=COMPACT_BUCKET_SECONDS, help="Bucket width in seconds.")
+    parser.add_argument("--archive", default=None, help="Copy raw rows to this SQLite file before deleting them.")
+    parser.add_argument("--pause", type=float, default=COMPACT_PAUSE_SECONDS, help="Pause between buckets (s).")
+    parser.add_argument("--max-buckets", type=int, default=None)
+    parser.add_argument("--parquet-root", default=PARQUET_ROOT, help="Only days exported here are compacted.")
+    args = parser.parse_args()
+
+    compact(
+        args.db,
+        keep_days=args.keep_days,
+        bucket_seconds=args.bucket,
+        archive_path=args.archive,
+        pause=args.pause,
+        max_buckets=args.max_buckets,
+        parquet_root=args.parquet_root,
+    )
@@ -0,0 +1,36 @@
+"""Estimate station-to-station flows from concurrent stock changes.
+
+    python -m scripts.estimate_od_flows            # new slots since the last run
+    python -m scripts.estimate_od_flows --rebuild  # recompute the whole history
+
+Each run only folds the slots closed since the previous one into
+station_od_flows, so it can be scheduled as often as wanted.
+"""
+
+import argparse
+import time
+
+from utils.connections import get_manager
+from utils.logging_config import setup_logger
+from utils.od_flows import OD_DECAY_KM, OD_MAX_KM, OD_MIN_FLOW, OD_SLOT_SECONDS, FlowEstimator, process_history
+
+logger = setup_logger("od_flows_logger")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="Drop stored flows and start over.")
+    parser.add_argument("--decay-km", type=float, default=OD_DECAY_KM)
+    parser.add_argument("--max-km", type=float, default=OD_MAX_KM)
+    parser.add_argument("--slot", type=int, default=OD_SLOT_SECONDS, help="Snapshot grid in seconds.")
+    parser.add_argument("--min-flow", type=float, default=OD_MIN_FLOW, help="Smallest pair kept per day.")
+    args = parser.parse_args()
+
+    estimator = FlowEstimator(
+        decay_km=args.decay_km, max_km=args.max_km, slot_seconds=args.slot, min_flow=args.min_flow
+    )
+    started = time.perf_counter()
+    written = process_history(get_manager(), estimator, rebuild=args.rebuild)
+    for day, pairs in written.items():
+        logger.info(f"{day}: {pairs} origin-destination pairs")
+    logger.info(f"Processed {len(written)} day(s) in {time.perf_counter() - started:.2f}s")
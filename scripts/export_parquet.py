@@ -0,0 +1,27 @@
+import argparse
+import time
+
+from utils.db import DB_PATH
+from utils.logging_config import setup_logger
+from utils.parquet_store import PARQUET_ROOT, export_closed_days
+
+logger = setup_logger("parquet_logger")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export closed UTC days of station_activity to a date-partitioned Parquet dataset."
+    )
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--root", default=PARQUET_ROOT)
+    parser.add_argument("--overwrite", action="store_true", help="Rewrite days already exported.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = export_closed_days(args.db, root=args.root, overwrite=args.overwrite)
+    for day, rows in written.items():
+        logger.info(f"{day.isoformat()}: {rows} rows")
+    logger.info(
+        f"Exported {len(written)} day(s), {sum(written.values())} rows to {args.root} "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
@@ -1,8 +1,13 @@
+import argparse
 import os
-import requests
+import time
 from datetime import datetime, timezone
+from itertools import repeat
+
+import requests
 from utils.db import create_table, get_connection
 from utils.logging_config import setup_logger
+from utils.rollups import update_rollups
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,14 +17,30 @@ NETWORK_ID = os.getenv("NETWORK_ID")
 
 API_URL = f"{BASE_URL}/v2/networks/{NETWORK_ID}"
 
+INSERT_SQL = """
+    INSERT INTO station_activity
+    (station_id, name, free_bikes, empty_slots, latitude, longitude, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Payload keys, in INSERT_SQL order (the timestamp is added per snapshot)
+SNAPSHOT_FIELDS = (
+    ("station_id", "id"),
+    ("name", "name"),
+    ("free_bikes", "free_bikes"),
+    ("empty_slots", "empty_slots"),
+    ("latitude", "latitude"),
+    ("longitude", "longitude"),
+)
+
 logger = setup_logger("fetch_logger")
 
 logger.info(f"Fetching VCUB station data from {API_URL}...")
 
 
-def fetch_and_store(return_count=False):
+def fetch_network(api_url=API_URL):
     try:
-        response = requests.get(API_URL)
+        response = requests.get(api_url)
         response.raise_for_status()
     except Exception as e:
         logger.error(f"API Request failed: {e}")
@@ -27,17 +48,53 @@ def fetch_and_store(return_count=False):
 
     stations = response.json()["network"]["stations"]
     logger.info(f"API returned {len(stations)} stations")
+    return stations
 
-    conn = get_connection()
+
+# -------------------------
+# Bulk ingestion
+# -------------------------
+def normalize_snapshot(stations, captured_at=None):
+    """Turn a CityBikes station list into one columnar batch.
+
+    The whole snapshot shares a single capture timestamp so that
+    `groupby().tail(1)` sees it as one coherent state of the network.
+    """
+    if captured_at is None:
+        captured_at = datetime.now(timezone.utc)
+
+    batch = {column: [] for column, _ in SNAPSHOT_FIELDS}
+    for st in stations:
+        for column, key in SNAPSHOT_FIELDS:
+            batch[column].append(st[key])
+
+    batch["timestamp"] = captured_at.isoformat()
+    return batch
+
+
+def snapshot_rows(batch):
+    columns = [batch[column] for column, _ in SNAPSHOT_FIELDS]
+    return zip(*columns, repeat(batch["timestamp"]))
+
+
+def store_snapshot(conn, batch):
+    """Write a normalized batch with one prepared statement in one transaction.
+
+    The hourly/daily rollups are folded in by the same transaction.
+    """
+    with conn:
+        conn.executemany(INSERT_SQL, snapshot_rows(batch))
+        update_rollups(conn, batch)
+
+    return len(batch["station_id"])
+
+
+def store_rowwise(conn, stations):
     cur = conn.cursor()
 
     inserted = 0
     for st in stations:
-        cur.execute("""
-            INSERT INTO station_activity
-            (station_id, name, free_bikes, empty_slots, latitude, longitude, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+        cur.execute(INSERT_SQL, (
             st["id"],
             st["name"],
             st["free_bikes"],
@@ -48,15 +105,43 @@ def fetch_and_store(return_count=False):
         ))
         inserted += 1
 
+    update_rollups(conn, normalize_snapshot(stations))
     conn.commit()
-    conn.close()
+    return inserted
 
-    logger.info(f"Inserted {inserted} rows into SQLite")
+
+def fetch_and_store(return_count=False, bulk=True):
+    stations = fetch_network()
+
+    conn = get_connection()
+    started = time.perf_counter()
+    try:
+        if bulk:
+            inserted = store_snapshot(conn, normalize_snapshot(stations))
+        else:
+            inserted = store_rowwise(conn, stations)
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+
+    rate = inserted / elapsed if elapsed > 0 else float("inf")
+    mode = "bulk" if bulk else "row-by-row"
+    logger.info(
+        f"Inserted {inserted} rows into SQLite ({mode}, {elapsed * 1000:.1f} ms, {rate:,.0f} rows/s)"
+    )
 
     if return_count:
         return inserted
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch one CityBikes snapshot into SQLite.")
+    parser.add_argument(
+        "--rowwise",
+        action="store_true",
+        help="Use the legacy one-INSERT-per-station loop (for rows/s comparison).",
+    )
+    args = parser.parse_args()
+
     create_table()
-    fetch_and_store()
+    fetch_and_store(bulk=not args.rowwise)
@@ -0,0 +1,92 @@
+"""Latency and throughput of the data service under concurrent clients.
+
+    DATA_RATE_LIMIT=100000/minute uvicorn data_service.main:app --port 8002 --workers 1
+    python -m scripts.load_test_data_service --token "$TOKEN" --concurrency 200 --seconds 20
+
+Each client loops over /stations, /stations/top10 and /stations/{id} (ids
+taken from /stations) until time runs out. Pass several --url to compare
+deployments side by side against the same Postgres, e.g. the current
+service on 8002 and a checkout of the previous synchronous version on 8003.
+Raise DATA_RATE_LIMIT first, or SlowAPI answers 429 to most requests.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import time
+
+import httpx
+
+ENDPOINTS = ("/stations", "/stations/top10", "/stations/{id}")
+
+
+async def station_ids(client):
+    response = await client.get("/stations")
+    response.raise_for_status()
+    return [station["id"] for station in response.json()] or ["unknown"]
+
+
+async def run(url, token, concurrency, seconds, admin):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies = {endpoint: [] for endpoint in ENDPOINTS + (("/alerts",) if admin else ())}
+    errors = {}
+
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=30) as client:
+        ids = await station_ids(client)
+        deadline = time.perf_counter() + seconds
+
+        async def worker(offset):
+            cycle = itertools.islice(itertools.cycle(latencies), offset, None)
+            for endpoint in cycle:
+                if time.perf_counter() >= deadline:
+                    return
+                path = endpoint.replace("{id}", random.choice(ids))
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    failed = response.status_code >= 400 and f"HTTP {response.status_code}"
+                except httpx.HTTPError as exc:
+                    failed = type(exc).__name__
+                if failed:
+                    errors[failed] = errors.get(failed, 0) + 1
+                else:
+                    latencies[endpoint].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{url}  concurrency={concurrency}  ok={total}  {total / elapsed:8.1f} req/s  errors={errors or 0}")
+    for endpoint, values in latencies.items():
+        if not values:
+            print(f"  {endpoint:<16} no successful requests")
+            continue
+        values.sort()
+
+        def pct(q):
+            return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+        print(
+            f"  {endpoint:<16} n={len(values):>6}  p50={pct(0.50):8.2f}ms  p95={pct(0.95):8.2f}ms  "
+            f"p99={pct(0.99):8.2f}ms  max={values[-1] * 1000:8.2f}ms  mean={statistics.mean(values) * 1000:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", action="append", help="Service base URL; repeat to compare (default: localhost:8002).")
+    parser.add_argument("--token", default=os.getenv("DATA_TOKEN"), help="Bearer token (or DATA_TOKEN).")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--admin", action="store_true", help="Include /alerts (admin token required).")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("a token is required: --token or DATA_TOKEN")
+
+    for url in args.url or ["http://localhost:8002"]:
+        asyncio.run(run(url, args.token, args.concurrency, args.seconds, args.admin))
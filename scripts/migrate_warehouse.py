@@ -0,0 +1,149 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from utils.db import COMPAT_VIEW, DB_PATH, WAREHOUSE_SCHEMA, create_indexes, is_warehouse
+from utils.logging_config import setup_logger
+
+logger = setup_logger("migrate_logger")
+
+LEGACY_TABLE = "station_activity_legacy"
+
+# One dimension row per run of identical (name, latitude, longitude) values
+BUILD_STATIONS = f"""
+    INSERT INTO stations (station_id, name, latitude, longitude, valid_from, valid_to)
+    WITH typed AS (
+        SELECT station_id, name, latitude, longitude,
+               CAST(strftime('%s', timestamp) AS INTEGER) AS ts
+        FROM {LEGACY_TABLE}
+        WHERE station_id IS NOT NULL AND timestamp IS NOT NULL
+    ),
+    changes AS (
+        SELECT *,
+               ROW_NUMBER() OVER w AS rn,
+               LAG(name) OVER w AS prev_name,
+               LAG(latitude) OVER w AS prev_lat,
+               LAG(longitude) OVER w AS prev_lon
+        FROM typed
+        WINDOW w AS (PARTITION BY station_id ORDER BY ts)
+    ),
+    versions AS (
+        SELECT station_id, name, latitude, longitude, ts AS valid_from
+        FROM changes
+        WHERE rn = 1
+           OR name IS NOT prev_name
+           OR latitude IS NOT prev_lat
+           OR longitude IS NOT prev_lon
+    )
+    SELECT station_id, name, latitude, longitude, valid_from,
+           LEAD(valid_from) OVER (PARTITION BY station_id ORDER BY valid_from)
+    FROM versions
+    ORDER BY station_id, valid_from
+"""
+
+BUILD_FACTS = f"""
+    INSERT OR REPLACE INTO station_facts (station_key, ts, free_bikes, empty_slots)
+    SELECT s.station_key, t.ts, t.free_bikes, t.empty_slots
+    FROM (
+        SELECT id, station_id, free_bikes, empty_slots,
+               CAST(strftime('%s', timestamp) AS INTEGER) AS ts
+        FROM {LEGACY_TABLE}
+        WHERE station_id IS NOT NULL AND timestamp IS NOT NULL
+    ) t
+    JOIN stations s
+      ON s.station_id = t.station_id
+     AND t.ts >= s.valid_from
+     AND (s.valid_to IS NULL OR t.ts < s.valid_to)
+    ORDER BY t.id
+"""
+
+
+def full_scan_seconds(conn, relation, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(f"SELECT * FROM {relation}").fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def backup(db_path, backup_path):
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(backup_path)
+    with dst:
+        src.backup(dst)
+    dst.close()
+    src.close()
+
+
+def migrate(db_path=DB_PATH, backup_path=None, keep_legacy=False):
+    conn = sqlite3.connect(db_path)
+    if is_warehouse(conn):
+        # Bring the view and indexes of an earlier migration up to date
+        conn.executescript("DROP VIEW IF EXISTS station_activity;" + COMPAT_VIEW)
+        create_indexes(conn)
+        conn.close()
+        logger.info(f"{db_path} is already migrated, refreshed the compatibility view and indexes")
+        return
+
+    if backup_path:
+        backup(db_path, backup_path)
+        logger.info(f"Backup written to {backup_path}")
+
+    size_before = os.path.getsize(db_path)
+    scan_before = full_scan_seconds(conn, "station_activity")
+    (legacy_rows,) = conn.execute("SELECT COUNT(*) FROM station_activity").fetchone()
+
+    with conn:
+        # Explicit BEGIN so the DDL is rolled back together with the copy
+        conn.execute("BEGIN")
+        conn.execute(f"ALTER TABLE station_activity RENAME TO {LEGACY_TABLE}")
+        for statement in WAREHOUSE_SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute(BUILD_STATIONS)
+        conn.execute(BUILD_FACTS)
+        if not keep_legacy:
+            conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+
+    # The trigger body contains semicolons, so the view script goes through
+    # executescript (which commits on its own).
+    conn.executescript(COMPAT_VIEW)
+    create_indexes(conn)
+    conn.execute("VACUUM")
+
+    (stations,) = conn.execute("SELECT COUNT(*) FROM stations").fetchone()
+    (facts,) = conn.execute("SELECT COUNT(*) FROM station_facts").fetchone()
+    scan_facts = full_scan_seconds(conn, "station_facts")
+    scan_view = full_scan_seconds(conn, "station_activity")
+    conn.close()
+    size_after = os.path.getsize(db_path)
+
+    logger.info(
+        f"Migrated {legacy_rows} rows into {stations} station versions and {facts} facts"
+    )
+    logger.info(
+        f"File size: {size_before / 1e6:.2f} MB -> {size_after / 1e6:.2f} MB "
+        f"({size_before / max(size_after, 1):.1f}x smaller)"
+    )
+    logger.info(
+        f"Full scan: legacy table {scan_before * 1000:.1f} ms -> station_facts "
+        f"{scan_facts * 1000:.1f} ms (compatibility view: {scan_view * 1000:.1f} ms)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert station_activity into the stations/station_facts warehouse schema."
+    )
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--backup", default=None, help="Copy the database here before migrating.")
+    parser.add_argument(
+        "--keep-legacy",
+        action="store_true",
+        help=f"Keep the original rows in {LEGACY_TABLE} instead of dropping them.",
+    )
+    args = parser.parse_args()
+
+    migrate(args.db, backup_path=args.backup, keep_legacy=args.keep_legacy)
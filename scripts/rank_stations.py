@@ -1,20 +1,12 @@
-import sqlite3
 import pandas as pd
-from utils.db import DB_PATH
+from utils.parquet_store import load_full_history
 
-# 1. Load Data
-conn = sqlite3.connect(DB_PATH)
-
-df = pd.read_sql_query("""
-    SELECT station_id, name, free_bikes, timestamp
-    FROM station_activity
-    ORDER BY station_id, timestamp
-""", conn)
-
-conn.close()
+# 1. Load Data (Parquet archive for closed days, SQLite for the rest)
+df = load_full_history(columns=["station_id", "name", "free_bikes", "timestamp"])
 
 # 2. Clean and Convert Timestamp
 df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+df = df.sort_values(["station_id", "timestamp"])
 
 # 3. Remove any corrupted rows (rare, but safe)
 df = df.dropna(subset=["timestamp"])
@@ -0,0 +1,21 @@
+import time
+
+from utils.db import get_connection
+from utils.logging_config import setup_logger
+from utils.rollups import rebuild_rollups
+
+logger = setup_logger("rollup_logger")
+
+
+if __name__ == "__main__":
+    conn = get_connection()
+    started = time.perf_counter()
+    rebuild_rollups(conn)
+    (station_rows,) = conn.execute("SELECT COUNT(*) FROM station_rollup").fetchone()
+    (citywide_rows,) = conn.execute("SELECT COUNT(*) FROM citywide_rollup").fetchone()
+    conn.close()
+
+    logger.info(
+        f"Rebuilt {station_rows} station and {citywide_rows} citywide rollup rows "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
@@ -0,0 +1,87 @@
+"""Local stand-in for the CityBikes API, used to exercise the tracker offline.
+
+    python -m scripts.stub_citybikes --port 8765 --stations 200 --delay 0.5
+    python -m scripts.track_activity --base-url http://127.0.0.1:8765 \
+        --networks alpha,beta,flaky --interval 10 --cycles 3
+
+Every network id is served; ids starting with "flaky" fail with HTTP 503.
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def synthetic_stations(network_id, count, rng):
+    stations = []
+    for i in range(count):
+        capacity = 10 + (i * 7) % 25
+        free_bikes = rng.randint(0, capacity)
+        stations.append({
+            "id": f"{network_id}-{i:05d}",
+            "name": f"{network_id.title()} station {i}",
+            "latitude": 44.80 + (i % 50) * 0.002,
+            "longitude": -0.62 + (i // 50) * 0.002,
+            "free_bikes": free_bikes,
+            "empty_slots": capacity - free_bikes,
+        })
+    return stations
+
+
+def make_handler(station_count, delay, fail_rate):
+    rng = random.Random()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) != 3 or parts[:2] != ["v2", "networks"]:
+                self.send_error(404)
+                return
+
+            network_id = parts[2]
+            if delay:
+                time.sleep(delay)
+            if network_id.startswith("flaky") or rng.random() < fail_rate:
+                self.send_error(503)
+                return
+
+            body = json.dumps({
+                "network": {
+                    "id": network_id,
+                    "stations": synthetic_stations(network_id, station_count, rng),
+                }
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, stations=200, delay=0.0, fail_rate=0.0):
+    server = ThreadingHTTPServer((host, port), make_handler(stations, delay, fail_rate))
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503.")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.stations, args.delay, args.fail_rate)
+    print(f"CityBikes stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,34 +1,300 @@
+import argparse
+import asyncio
+import math
 import os
+import statistics
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import requests
 from dotenv import load_dotenv
-from scripts.fetch_stations import fetch_and_store
+from requests.adapters import HTTPAdapter
+
+from scripts.compact_history import compact
+from scripts.fetch_stations import BASE_URL, normalize_snapshot, store_snapshot
+from utils.alerts import PostgresAlertSink, StaticBikeDetector, record_transitions
+from utils.connections import get_manager
+from utils.db import create_table
+from utils.forecasting import (
+    FORECAST_HISTORY_DAYS,
+    PostgresForecastSink,
+    StationForecaster,
+    store_forecasts,
+)
 from utils.logging_config import setup_logger
+from utils.queries import window_query
+from utils.station_cube import CUBE_ROOT, open_for_append
 
 load_dotenv()
 
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", 300))
+NETWORK_IDS = os.getenv("NETWORK_IDS", os.getenv("NETWORK_ID", ""))
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 4))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 30))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", 30))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", 1800))
+# Seconds between retention/compaction passes; 0 leaves it to the standalone job
+COMPACT_INTERVAL = float(os.getenv("COMPACT_INTERVAL", 0))
+# Also append every snapshot to the memory-mapped station × time cube, an
+# analysis store for scripts and notebooks (opt-in: the dashboard never reads it)
+STATION_CUBE = os.getenv("STATION_CUBE", "0").lower() not in ("0", "false", "no")
+# Online static-bike detection; transitions also go to Postgres `alerts` if set
+STATIC_DETECTOR = os.getenv("STATIC_DETECTOR", "1").lower() not in ("0", "false", "no")
+ALERTS_DATABASE_URL = os.getenv("ALERTS_DATABASE_URL")
+# Per-station availability forecasts refreshed after every snapshot
+STATION_FORECASTS = os.getenv("STATION_FORECASTS", "1").lower() not in ("0", "false", "no")
+FORECAST_DATABASE_URL = os.getenv("FORECAST_DATABASE_URL", ALERTS_DATABASE_URL)
+
 logger = setup_logger("tracker_logger")
 
-def pretty_time():
-    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
 
+def parse_networks(value):
+    return [n.strip() for n in value.split(",") if n.strip()]
 
-if __name__ == "__main__":
-    logger.info(f"VCUB Tracker Started — interval = {POLL_INTERVAL}s")
 
-    while True:
-        start_time = time.time()
-        logger.info(f"Fetching new snapshot at {pretty_time()}")
+def next_boundary(now, interval):
+    """First wall-clock multiple of `interval` strictly after `now`."""
+    return (math.floor(now / interval) + 1) * interval
+
+
+def pooled_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class NetworkState:
+    """Consecutive failures and back-off deadline for one network."""
+
+    def __init__(self, network_id):
+        self.network_id = network_id
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def record_success(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def record_failure(self, now):
+        self.failures += 1
+        delay = min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+        self.retry_at = now + delay
+        return delay
+
+
+# -------------------------
+# Async poller
+# -------------------------
+class Poller:
+    def __init__(self, networks, base_url=BASE_URL, interval=POLL_INTERVAL,
+                 concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT,
+                 compact_interval=COMPACT_INTERVAL, cube_root=CUBE_ROOT if STATION_CUBE else None):
+        self.base_url = base_url.rstrip("/")
+        self.interval = interval
+        self.timeout = timeout
+        self.compact_interval = compact_interval
+        self.compacted_at = time.monotonic()
+        self.compaction = None
+        self.states = {network_id: NetworkState(network_id) for network_id in networks}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = pooled_session(max(concurrency, 1))
+        self.queue = asyncio.Queue()
+        self.cube_root = cube_root
+        self.cube = None
+        self.detector = StaticBikeDetector() if STATIC_DETECTOR else None
+        self.primed = False
+        self.alert_sink = PostgresAlertSink(ALERTS_DATABASE_URL) if ALERTS_DATABASE_URL else None
+        self.forecaster = StationForecaster() if STATION_FORECASTS else None
+        self.forecast_sink = PostgresForecastSink(FORECAST_DATABASE_URL) if FORECAST_DATABASE_URL else None
+
+    def url_for(self, network_id):
+        return f"{self.base_url}/v2/networks/{network_id}"
+
+    async def fetch(self, state):
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                response = await asyncio.to_thread(
+                    self.session.get, self.url_for(state.network_id), timeout=self.timeout
+                )
+                response.raise_for_status()
+                stations = response.json()["network"]["stations"]
+            except Exception as e:
+                delay = state.record_failure(time.time())
+                logger.error(
+                    f"[{state.network_id}] fetch failed ({state.failures}x): {e} — backing off {delay:.0f}s"
+                )
+                return None
+            latency = time.perf_counter() - started
+
+        state.record_success()
+        captured_at = datetime.now(timezone.utc)
+        await self.queue.put((state.network_id, normalize_snapshot(stations, captured_at)))
+        return latency
+
+    async def run_cycle(self, scheduled):
+        now = time.time()
+        due = [s for s in self.states.values() if s.retry_at <= now]
+        skipped = len(self.states) - len(due)
+
+        latencies = await asyncio.gather(*(self.fetch(state) for state in due))
+        ok = [lat for lat in latencies if lat is not None]
+
+        summary = f"fetched {len(ok)}/{len(due)} networks"
+        if skipped:
+            summary += f", {skipped} backing off"
+        if ok:
+            summary += (
+                f", latency p50={statistics.median(ok) * 1000:.0f}ms"
+                f" max={max(ok) * 1000:.0f}ms"
+            )
+        tick = datetime.fromtimestamp(scheduled, timezone.utc).strftime("%H:%M:%S")
+        logger.info(f"Cycle {tick} UTC: {summary}")
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        if not self.compact_interval:
+            return
+        if self.compaction is not None and not self.compaction.done():
+            return
+        if time.monotonic() - self.compacted_at < self.compact_interval:
+            return
+
+        # Runs bucket by bucket on the shared writer, interleaved with snapshots
+        self.compacted_at = time.monotonic()
+        self.compaction = asyncio.create_task(asyncio.to_thread(compact))
+
+    async def writer(self):
+        while True:
+            network_id, batch = await self.queue.get()
+            try:
+                inserted = await asyncio.to_thread(self._write, batch, network_id)
+                logger.info(f"[{network_id}] inserted {inserted} rows")
+            except Exception as e:
+                logger.error(f"[{network_id}] write failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _prime(self):
+        # Replay history before the first snapshot lands, so it is counted once
+        with get_manager().reader() as conn:
+            if self.detector is not None:
+                stations = self.detector.prime(conn)
+                logger.info(f"Static-bike detector primed with {stations} stations")
+            if self.forecaster is not None:
+                since = datetime.now(timezone.utc) - timedelta(days=FORECAST_HISTORY_DAYS)
+                sql, params = window_query(conn, since=since)
+                self.forecaster.fit(pd.read_sql(sql, conn, params=params))
+                logger.info(f"Forecaster fitted on {len(self.forecaster)} stations")
+        self.primed = True
+
+    def _write(self, batch, network_id=None):
+        if not self.primed:
+            self._prime()
+
+        inserted = get_manager().write(store_snapshot, batch)
+        if self.cube_root:
+            # SQLite stays the source of truth: a cube failure only loses cube cells
+            try:
+                if self.cube is None:
+                    self.cube = open_for_append(self.cube_root)
+                self.cube.append(batch)
+            except Exception as e:
+                logger.error(f"station cube append failed: {e}")
+                self.cube = None
+        if self.detector is not None:
+            self._detect(batch, network_id)
+        if self.forecaster is not None:
+            self._forecast(batch)
+        return inserted
+
+    def _forecast(self, batch):
+        self.forecaster.update(batch)
+        forecasts = self.forecaster.predict()
+        forecasts = forecasts[forecasts["station_id"].isin(batch["station_id"])]
+        get_manager().write(store_forecasts, forecasts)
+        if self.forecast_sink is not None:
+            try:
+                self.forecast_sink.publish(forecasts)
+            except Exception as e:
+                logger.error(f"forecast publish to Postgres failed: {e}")
+
+    def _detect(self, batch, network_id=None):
+        transitions = self.detector.update(batch, network_id)
+        heartbeat = (batch["timestamp"], len(self.detector.stations), len(self.detector.open))
+        get_manager().write(record_transitions, transitions, heartbeat)
+        if not transitions:
+            return
+        opened = sum(1 for t in transitions if t[0] == "open")
+        logger.info(
+            f"Static-bike alerts: {opened} opened, {len(transitions) - opened} resolved, "
+            f"{len(self.detector.open)} open"
+        )
+        if self.alert_sink is not None:
+            try:
+                self.alert_sink.publish(transitions, batch)
+            except Exception as e:
+                logger.error(f"alert publish to Postgres failed: {e}")
+
+    async def run(self, max_cycles=None):
+        writer = asyncio.create_task(self.writer())
+        cycle = None
+        scheduled = next_boundary(time.time(), self.interval)
+        done_cycles = 0
 
         try:
-            count = fetch_and_store(return_count=True)
-            logger.info(f"Inserted {count} rows")
-        except Exception as e:
-            logger.error(f"Error fetching data: {e}")
+            while max_cycles is None or done_cycles < max_cycles:
+                await asyncio.sleep(max(0.0, scheduled - time.time()))
+                lag = time.time() - scheduled
+
+                if cycle is not None and not cycle.done():
+                    logger.warning("Previous cycle still running — skipping this tick")
+                else:
+                    logger.info(f"Cycle lag: {lag * 1000:.0f}ms")
+                    cycle = asyncio.create_task(self.run_cycle(scheduled))
+                    done_cycles += 1
+
+                # Fixed-rate: realign on the next boundary if we fell behind
+                scheduled += self.interval
+                if scheduled <= time.time():
+                    scheduled = next_boundary(time.time(), self.interval)
+
+            if cycle is not None:
+                await cycle
+            await self.queue.join()
+            if self.compaction is not None:
+                await self.compaction
+        finally:
+            writer.cancel()
+            self.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll CityBikes networks on a fixed schedule.")
+    parser.add_argument("--networks", default=NETWORK_IDS, help="Comma-separated network ids.")
+    parser.add_argument("--base-url", default=BASE_URL, help="CityBikes API root (or a local stub).")
+    parser.add_argument("--interval", type=int, default=POLL_INTERVAL)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--cycles", type=int, default=None, help="Stop after N cycles.")
+    args = parser.parse_args()
 
-        duration = round(time.time() - start_time, 2)
-        logger.info(f"Fetch duration: {duration}s")
+    networks = parse_networks(args.networks)
+    if not networks:
+        parser.error("no network configured (set NETWORK_IDS or NETWORK_ID)")
+    if not args.base_url:
+        parser.error("no API root configured (set CITYBIKES_BASE_URL)")
 
-        logger.info(f"Sleeping for {POLL_INTERVAL} seconds...\n")
-        time.sleep(POLL_INTERVAL)
+    create_table()
+    logger.info(
+        f"VCUB Tracker Started — networks = {', '.join(networks)}, interval = {args.interval}s"
+    )
+    poller = Poller(
+        networks,
+        base_url=args.base_url,
+        interval=args.interval,
+        concurrency=args.concurrency,
+    )
+    asyncio.run(poller.run(max_cycles=args.cycles))
@@ -1,27 +1,461 @@
+import json
+import logging
+import os
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import cached_property
 
 import numpy as np
 import pandas as pd
 import plotly.express as px
+from dotenv import load_dotenv
 from sklearn.cluster import KMeans
 
-from utils.db import DB_PATH
+from utils.alerts import detector_alive, open_alerts_query
+from utils.connections import get_manager
+from utils.downsampling import downsample, downsample_columns, figure_payload_bytes, point_budget, trace_mode
+from utils.forecasting import (
+    FORECAST_COLUMNS,
+    FORECAST_HISTORY_DAYS,
+    FORECAST_HORIZONS,
+    StationForecaster,
+    forecast_table,
+)
+from utils.logging_config import setup_logger
+from utils.map_layers import StationGeometry
+from utils.od_flows import od_flows_query
+from utils.parquet_store import load_full_history
+from utils.queries import (
+    data_version_query,
+    increment_query,
+    latest_snapshot_query,
+    watermark_column,
+    window_query,
+)
+from utils.rollups import citywide_rollup_query
+from utils.station_profiles import CLUSTER_COLUMNS, BehaviourClusters
+from utils.station_search import StationSearchCache
+
+load_dotenv()
+
+logger = setup_logger("dashboard_logger")
+
+# Shared cache entries. Sized for one data version (older ones are dropped
+# when a new one is published): ~25 cached sections × 6 history windows,
+# × 4 for station lookups and the slider values of concurrent sessions.
+DASHBOARD_CACHE_ENTRIES = int(os.getenv("DASHBOARD_CACHE_ENTRIES", 25 * 6 * 4))
 
 
 
 # -------------------------
 # Load station activity
 # -------------------------
-def load_station_data():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql("SELECT * FROM station_activity", conn)
-    conn.close()
+def load_station_data(hours=None, station_ids=None):
+    """Load the last `hours` of history (all of it if None).
+
+    Windows that fit in the process-wide history cache are served from
+    memory, the full history combines the Parquet archive with SQLite, and
+    anything else is filtered in SQL.
+    """
+    if hours is not None and station_ids is None and hours <= HISTORY_CACHE.retention_hours:
+        return HISTORY_CACHE.window(hours)
+    if hours is None:
+        # Closed days come from the partitioned Parquet archive when exported
+        return load_full_history(station_ids=station_ids)
+
+    return query_station_data(hours, station_ids)
+
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+def query_station_data(hours=None, station_ids=None):
+    since = None
+    if hours is not None:
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+
+    with get_manager().reader() as conn:
+        sql, params = window_query(conn, since=since, station_ids=station_ids)
+        df = pd.read_sql(sql, conn, params=params)
+
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
     return df
 
 
+# -------------------------
+# Incremental history cache
+# -------------------------
+class StationHistoryCache:
+    """Process-wide, append-only copy of the recent station history.
+
+    Module state outlives Streamlit reruns and is shared by every session
+    of the server process, so each refresh only reads the rows appended
+    since the last watermark instead of the whole table.
+    """
+
+    # Re-read window for the warehouse `ts` watermark (see increment_query)
+    OVERLAP_SECONDS = 600
+
+    def __init__(self, retention_hours=24, min_refresh_seconds=5):
+        self.retention_hours = retention_hours
+        self.min_refresh_seconds = min_refresh_seconds
+        self._lock = threading.Lock()
+        self._frame = None
+        self._watermark = None
+        self._refreshed_at = 0.0
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.min_refresh_seconds:
+                return self._frame
+
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=self.retention_hours)
+            with get_manager().reader() as conn:
+                key = watermark_column(conn)
+                sql, params = increment_query(
+                    conn,
+                    after=self._watermark,
+                    since=cutoff,
+                    overlap_seconds=self.OVERLAP_SECONDS,
+                )
+                new_rows = pd.read_sql(sql, conn, params=params)
+
+            new_rows["timestamp"] = pd.to_datetime(new_rows["timestamp"], format="ISO8601", utc=True)
+            if not new_rows.empty:
+                self._watermark = int(new_rows[key].max())
+            new_rows = new_rows.drop(columns=[key])
+
+            if self._frame is None or self._frame.empty:
+                frame = new_rows
+            elif new_rows.empty:
+                frame = self._frame
+            else:
+                frame = pd.concat([self._frame, new_rows], ignore_index=True)
+                if key == "ts":
+                    frame = frame.drop_duplicates(["station_id", "timestamp"], keep="last")
+
+            frame = frame[frame["timestamp"] >= cutoff]
+            self._frame = frame.reset_index(drop=True)
+            self._refreshed_at = time.monotonic()
+            return self._frame
+
+    def window(self, hours):
+        frame = self.refresh()
+        cutoff = pd.Timestamp.now(tz="UTC") - timedelta(hours=hours)
+        return frame[frame["timestamp"] >= cutoff]
+
+    def clear(self):
+        with self._lock:
+            self._frame = None
+            self._watermark = None
+            self._refreshed_at = 0.0
+
+
+# Largest bounded window offered by the dashboard sidebar
+HISTORY_CACHE = StationHistoryCache(retention_hours=24)
+
+
+def load_latest_snapshot():
+    with get_manager().reader() as conn:
+        sql, params = latest_snapshot_query(conn)
+        df = pd.read_sql(sql, conn, params=params)
+
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    df = df.sort_values(["station_id", "timestamp"]).drop_duplicates("station_id", keep="last")
+    return df.reset_index(drop=True)
+
+
+def load_open_alerts():
+    """Static-bike alerts kept by the tracker's online detector.
+
+    Returns None when no detector has sent a recent heartbeat, so the caller
+    can fall back to detect_static_bikes on the history window. A running
+    detector with no open alert gives an empty frame.
+    """
+    columns = ["station_id", "name", "total_movement", "recent_min",
+               "recent_max", "recent_range", "sample_count"]
+    with get_manager().reader() as conn:
+        if not detector_alive(conn):
+            return None
+        sql, params = open_alerts_query()
+        rows = conn.execute(sql, params).fetchall()
+
+    records = [{"station_id": row[1], **json.loads(row[4])} for row in rows]
+    return pd.DataFrame(records, columns=columns)
+
+
+def load_station_forecasts():
+    """Latest per-station forecasts written by the tracker.
+
+    When the tracker has not written any (or they are older than the longest
+    horizon), they are fitted on the spot from the same FORECAST_HISTORY_DAYS
+    of history the tracker uses, whatever window the dashboard shows.
+    """
+    with get_manager().reader() as conn:
+        try:
+            forecasts = pd.read_sql(
+                f"SELECT {', '.join(FORECAST_COLUMNS)} FROM station_forecasts", conn
+            )
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            forecasts = pd.DataFrame(columns=FORECAST_COLUMNS)
+
+    if not forecasts.empty:
+        issued = pd.to_datetime(forecasts["issued_at"], format="ISO8601", utc=True).max()
+        if pd.Timestamp.now(tz="UTC") - issued <= timedelta(minutes=max(FORECAST_HORIZONS)):
+            return forecasts
+
+    history_df = load_station_data(hours=FORECAST_HISTORY_DAYS * 24)
+    if history_df.empty:
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+    return StationForecaster().fit(history_df).predict()
+
+
+def load_od_flows(snapshot, days=7, limit=150):
+    """Strongest estimated origin → destination pairs over the last `days`,
+    with both ends' coordinates for an arc layer (empty until
+    scripts.estimate_od_flows has run)."""
+    columns = ["origin_id", "destination_id", "flow", "origin_name", "destination_name",
+               "origin_lat", "origin_lon", "destination_lat", "destination_lon"]
+    since_day = (datetime.now(timezone.utc) - timedelta(days=days)).date().isoformat()
+    with get_manager().reader() as conn:
+        sql, params = od_flows_query(since_day=since_day, limit=limit)
+        try:
+            flows = pd.read_sql(sql, conn, params=params)
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            return pd.DataFrame(columns=columns)
+
+    stations = snapshot.set_index("station_id")[["name", "latitude", "longitude"]]
+    origin = stations.reindex(flows["origin_id"]).to_numpy()
+    destination = stations.reindex(flows["destination_id"]).to_numpy()
+    flows["origin_name"], flows["origin_lat"], flows["origin_lon"] = origin.T
+    flows["destination_name"], flows["destination_lat"], flows["destination_lon"] = destination.T
+    return flows.dropna(subset=["origin_lat", "destination_lat"])[columns].reset_index(drop=True)
+
+
+# -------------------------
+# Shared data layer
+# -------------------------
+class TTLCache:
+    """Thread-safe LRU whose entries also expire `ttl` seconds after being computed.
+
+    Concurrent misses on one key compute it once: the other callers wait on
+    that key's lock, then read the stored value. `evictions` counts entries
+    pushed out by `maxsize` (the cache is too small when it keeps growing);
+    `expired` counts those that outlived `ttl` or were discarded.
+    """
+
+    def __init__(self, maxsize=DASHBOARD_CACHE_ENTRIES, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._computing = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            key_lock = self._computing.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+            try:
+                value = compute()
+                with self._lock:
+                    self._entries[key] = (time.monotonic(), value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            finally:
+                # Also when compute() raises: the next caller retries with a fresh lock
+                with self._lock:
+                    self._computing.pop(key, None)
+            return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches `predicate`; returns how many."""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self.expired += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DashboardDataLayer:
+    """Loads new data once per server process and publishes it to every session.
+
+    One daemon thread polls the data version every `refresh_seconds` (an
+    index lookup); when it moves, it refreshes HISTORY_CACHE and the latest
+    snapshot once and publishes them. Sessions only read the published
+    state, and everything derived from it goes through `cached(name,
+    *params)`, keyed on (data version, name, params): twenty open tabs on
+    the same window share one computation per new snapshot.
+    """
+
+    def __init__(self, refresh_seconds=15, cache=None):
+        self.refresh_seconds = refresh_seconds
+        self.cache = cache or TTLCache()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = None
+        self.refreshes = 0
+
+    def read_version(self):
+        with get_manager().reader() as conn:
+            sql, params = data_version_query(conn)
+            return conn.execute(sql, params).fetchone()[0]
+
+    def refresh(self):
+        """Publish new data if the version moved; True when it did."""
+        with self._lock:
+            version = self.read_version()
+            if self._state is not None and self._state["version"] == version:
+                return False
+            started = time.perf_counter()
+            HISTORY_CACHE.refresh(force=True)
+            self._state = {
+                "version": version,
+                "snapshot": load_latest_snapshot(),
+                "published_at": datetime.now(timezone.utc),
+            }
+            self.refreshes += 1
+            # Keys carry the version: entries of older ones can never be hit again
+            dropped = self.cache.discard(lambda key: key[0] != version)
+            logger.info(
+                f"Published data version {version} in {time.perf_counter() - started:.2f}s "
+                f"({dropped} stale cache entries dropped)"
+            )
+            return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.refresh()
+            except Exception as exc:
+                # Keep serving the last published state; retry next tick
+                logger.warning(f"Dashboard data refresh failed: {exc}")
+
+    def current(self):
+        """Published state, loaded synchronously on the very first call."""
+        if self._state is None:
+            self.refresh()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="dashboard-refresher", daemon=True)
+                self._thread.start()
+        return self._state
+
+    def cached(self, name, *params, compute):
+        """`compute()` once per (data version, name, params) across sessions.
+
+        Cached values are shared: callers must not mutate them in place.
+        """
+        return self.cache.get_or_compute((self.current()["version"], name, params), compute)
+
+    def stats(self):
+        state = self._state or {}
+        return {
+            **self.cache.stats(),
+            "refreshes": self.refreshes,
+            "version": state.get("version"),
+            "published_at": state.get("published_at"),
+        }
+
+
+DATA_LAYER = DashboardDataLayer()
+
+
+class SectionTimings:
+    """Process-wide render times of the dashboard sections."""
+
+    # Renders slower than this are logged
+    SLOW_SECONDS = 2.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sections = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            runs, total, slowest, _, _ = self._sections.get(name, (0, 0.0, 0.0, 0.0, None))
+            self._sections[name] = (runs + 1, total + seconds, max(slowest, seconds), seconds,
+                                    datetime.now(timezone.utc))
+        if seconds > self.SLOW_SECONDS:
+            logger.warning(f"Dashboard section '{name}' took {seconds:.2f}s")
+
+    def table(self):
+        with self._lock:
+            rows = [
+                (name, runs, last * 1000, total / runs * 1000, slowest * 1000, at)
+                for name, (runs, total, slowest, last, at) in self._sections.items()
+            ]
+        table = pd.DataFrame(rows, columns=["section", "runs", "last_ms", "mean_ms", "max_ms", "last_run"])
+        return table.sort_values("mean_ms", ascending=False).reset_index(drop=True)
+
+
+SECTION_TIMINGS = SectionTimings()
+
+
+# -------------------------
+# Pre-aggregated rollups
+# -------------------------
+def load_citywide_rollup(hours=None, grain="15min"):
+    """City-wide sums per bucket, shaped like a resampled raw frame."""
+    since = None
+    if hours is not None:
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+
+    with get_manager().reader() as conn:
+        sql, params = citywide_rollup_query(grain, since=since)
+        rollup = pd.read_sql(sql, conn, params=params)
+
+    rollup["timestamp"] = pd.to_datetime(rollup["bucket"], unit="s", utc=True)
+    return rollup.drop(columns=["bucket"])
+
+
 # -------------------------
 # Latest snapshot
 # -------------------------
@@ -34,6 +468,175 @@ def get_latest_snapshot(df):
     return snapshot.reset_index(drop=True)
 
 
+# -------------------------
+# Shared activity frame
+# -------------------------
+class ActivityFrame:
+    """A history window sorted once by (station_id, timestamp).
+
+    Movement (|Δ free_bikes| between consecutive samples of a station) and
+    the station group boundaries are computed on construction; per-station
+    aggregates are built on first use. Build one per refresh and hand it to
+    every activity helper instead of the raw frame.
+    """
+
+    def __init__(self, df):
+        ordered = df.sort_values(["station_id", "timestamp"], kind="stable")
+        ordered = ordered.reset_index(drop=True)
+
+        station_ids = ordered["station_id"].to_numpy()
+        is_start = np.ones(len(ordered), dtype=bool)
+        if len(ordered):
+            is_start[1:] = station_ids[1:] != station_ids[:-1]
+
+        movement = np.abs(np.diff(ordered["free_bikes"].to_numpy(dtype=float), prepend=0.0))
+        movement[is_start] = 0.0
+        ordered["movement"] = movement
+
+        self.frame = ordered
+        self.is_start = is_start
+        self.starts = np.flatnonzero(is_start)
+        self.ends = np.r_[self.starts[1:], len(ordered)]
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    @cached_property
+    def occupancy(self):
+        return OccupancyHistogram.from_history(self)
+
+    @cached_property
+    def station_summary(self):
+        return (
+            self.frame.groupby(["station_id", "name"])
+            .agg(
+                records=("timestamp", "count"),
+                avg_bikes=("free_bikes", "mean"),
+                avg_empty_slots=("empty_slots", "mean"),
+                total_moves=("movement", "sum"),
+            )
+            .reset_index()
+        )
+
+    def movement_since(self, cutoff):
+        """Per-station movement counted only between samples at/after cutoff."""
+        in_window = (self.frame["timestamp"] >= cutoff).to_numpy()
+        if not in_window.any():
+            return pd.Series(dtype=float)
+
+        # A station's first sample inside the window has no in-window predecessor
+        has_prev = np.zeros_like(in_window)
+        has_prev[1:] = in_window[:-1] & ~self.is_start[1:]
+        moves = np.where(has_prev, self.frame["movement"].to_numpy(), 0.0)
+
+        window = self.frame.loc[in_window, "station_id"]
+        return pd.Series(moves[in_window], index=window.index).groupby(window).sum()
+
+
+def as_activity(data):
+    return data if isinstance(data, ActivityFrame) else ActivityFrame(data)
+
+
+# -------------------------
+# Occupancy histograms
+# -------------------------
+class OccupancyHistogram:
+    """Weight spent at each free_bikes level, as a stations × (0..max) array.
+
+    Rows are cumulated once on construction, so "share of time at or below
+    a threshold" is a column lookup for any threshold, whatever the number
+    of samples behind it.
+    """
+
+    def __init__(self, station_ids, weights):
+        self.station_ids = pd.Index(station_ids)
+        self.weights = weights
+        cumulative = np.cumsum(weights, axis=1)
+        self.totals = cumulative[:, -1]
+        self._cumulative = cumulative
+        self._column_totals = cumulative.sum(axis=0)
+
+    @property
+    def max_bikes(self):
+        return self.weights.shape[1] - 1
+
+    @classmethod
+    def from_history(cls, df, max_gap_seconds=1800, until=None):
+        """Time-weighted: each sample counts until the next one of its station.
+
+        Durations are capped at `max_gap_seconds` so a polling outage does not
+        count as time spent at the last level seen; a station's last sample
+        runs until `until` (by default the newest sample of the window), and
+        for at least the median polling interval, so a window holding a
+        single snapshot still weighs each station at its current level.
+        """
+        activity = as_activity(df)
+        frame = activity.frame
+        if activity.empty:
+            return cls([], np.zeros((0, 1), dtype=np.float32))
+
+        seconds = (frame["timestamp"] - frame["timestamp"].min()).dt.total_seconds().to_numpy()
+        end = seconds.max() if until is None else (pd.Timestamp(until) - frame["timestamp"].min()).total_seconds()
+        last = activity.ends - 1
+        following = np.r_[seconds[1:], end]
+        following[last] = end
+        durations = following - seconds
+
+        inner = np.ones(len(durations), dtype=bool)
+        inner[last] = False
+        steps = durations[inner & (durations > 0)]
+        interval = np.median(steps) if len(steps) else max_gap_seconds
+        durations[last] = np.maximum(durations[last], interval)
+        durations = np.clip(durations, 0, max_gap_seconds)
+
+        codes = np.repeat(np.arange(len(activity.starts)), activity.ends - activity.starts)
+        bikes = frame["free_bikes"].to_numpy(dtype=np.int64).clip(0)
+        weights = np.zeros((len(activity.starts), bikes.max() + 1), dtype=np.float32)
+        np.add.at(weights, (codes, bikes), durations)
+        return cls(frame["station_id"].to_numpy()[activity.starts], weights)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """One unit per station at its current level."""
+        if snapshot.empty:
+            return cls([], np.zeros((0, 1), dtype=np.float32))
+        bikes = snapshot["free_bikes"].to_numpy(dtype=np.int64).clip(0)
+        weights = np.zeros((len(snapshot), bikes.max() + 1), dtype=np.float32)
+        weights[np.arange(len(snapshot)), bikes] = 1
+        return cls(snapshot["station_id"].to_numpy(), weights)
+
+    def _column(self, threshold):
+        return min(max(int(threshold), -1), self.max_bikes)
+
+    def share_below(self, threshold):
+        """Per-station share of weight at or below `threshold`."""
+        column = self._column(threshold)
+        if column < 0:
+            return pd.Series(0.0, index=self.station_ids)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(self.totals > 0, self._cumulative[:, column] / self.totals, 0.0)
+        return pd.Series(share, index=self.station_ids)
+
+    def station_share_below(self, station_id, threshold):
+        if station_id not in self.station_ids:
+            return None
+        row = self.station_ids.get_loc(station_id)
+        column = self._column(threshold)
+        if column < 0 or self.totals[row] <= 0:
+            return 0.0
+        return float(self._cumulative[row, column] / self.totals[row])
+
+    def weight_below(self, threshold):
+        """Total weight at or below `threshold` (stations, for a snapshot)."""
+        column = self._column(threshold)
+        return 0.0 if column < 0 else float(self._column_totals[column])
+
+    def split(self, threshold):
+        below = self.weight_below(threshold)
+        return below, float(self._column_totals[-1]) - below
+
+
 # -------------------------
 # K-Means clustering for map
 # -------------------------
@@ -57,33 +660,45 @@ def compute_clusters(df, n_clusters=None):
     return df, centers
 
 
+# -------------------------
+# Behavioural clusters for map
+# -------------------------
+# Like HISTORY_CACHE, shared by every session; refits once per closed hour
+STATION_CLUSTERS = BehaviourClusters()
+# Station positions and hexagon membership, shared by every session
+MAP_GEOMETRY = StationGeometry()
+# Station name index, rebuilt only when stations are added or renamed
+STATION_SEARCH = StationSearchCache()
+
+
+def load_station_clusters():
+    """Usage profile cluster of each station (empty without hourly rollups)."""
+    with get_manager().reader() as conn:
+        try:
+            return STATION_CLUSTERS.refresh(conn)
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            return pd.DataFrame(columns=CLUSTER_COLUMNS)
+
+
 # -------------------------
 # KPI: Most active station (last 30 min)
 # -------------------------
 def compute_most_active(df):
-    if df.empty:
+    activity = as_activity(df)
+    if activity.empty:
         return None, 0
 
     cutoff = pd.Timestamp.now(tz="UTC") - timedelta(minutes=30)
-    last30 = df[df["timestamp"] >= cutoff]
-    if last30.empty:
-        return None, 0
-
-    activity = (
-        last30.sort_values(["station_id", "timestamp"])
-        .groupby("station_id")["free_bikes"]
-        .diff()
-        .abs()
-        .fillna(0)
-    )
-
-    total = activity.groupby(last30["station_id"]).sum().sort_values(ascending=False)
+    total = activity.movement_since(cutoff).sort_values(ascending=False)
 
     if total.empty:
         return None, 0
 
     top_station_id = total.index[0]
-    station_names = last30.loc[last30["station_id"] == top_station_id, "name"]
+    frame = activity.frame
+    station_names = frame.loc[
+        (frame["station_id"] == top_station_id) & (frame["timestamp"] >= cutoff), "name"
+    ]
     top_station_name = station_names.mode().iloc[0] if not station_names.empty else str(top_station_id)
     movement = total.iloc[0]
     return top_station_name, movement
@@ -128,17 +743,33 @@ def compute_capacity_metrics(snapshot):
 # -------------------------
 # Charts
 # -------------------------
-def citywide_trend_chart(df, freq="15min"):
-    if df.empty:
+def log_chart(name, raw_points, kept_points, started, fig=None):
+    """Log what a time-series figure costs to ship: points and build time,
+    plus its JSON size at debug level (serializing the figure is not free)."""
+    message = f"Chart {name}: {raw_points} -> {kept_points} points"
+    if fig is not None and logger.isEnabledFor(logging.DEBUG):
+        message += f", {figure_payload_bytes(fig) / 1024:.1f} KiB"
+    logger.info(f"{message}, built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def citywide_trend_chart(df, freq="15min", rollup=None, max_points=None):
+    """`max_points` bounds the points per chart (by default one per pixel of
+    the widest chart); a min/max envelope keeps peaks and troughs."""
+    started = time.perf_counter()
+    source = df if rollup is None else rollup
+    if source.empty:
         return px.line(title="No data available")
 
+    # Rollup buckets hold sums, so re-bucketing them matches resampling raw rows
     trend = (
-        df.set_index("timestamp")
+        source.set_index("timestamp")
         .sort_index()
         .resample(freq)[["free_bikes", "empty_slots"]]
         .sum()
         .reset_index()
     )
+    raw_points = len(trend) * 2
+    trend = downsample_columns(trend, ["free_bikes", "empty_slots"], max_points or point_budget())
 
     melted = trend.melt(id_vars="timestamp", var_name="metric", value_name="value")
     fig = px.line(
@@ -153,12 +784,13 @@ def citywide_trend_chart(df, freq="15min"):
             "empty_slots": "#aac9e6",
         },
     )
-    fig.update_traces(mode="lines+markers")
+    fig.update_traces(mode=trace_mode(len(trend)))
     fig.update_layout(
         legend_title_text="",
         margin=dict(l=10, r=10, t=50, b=20),
         hovermode="x unified",
     )
+    log_chart("citywide_trend", raw_points, len(melted), started, fig)
     return fig
 
 
@@ -216,20 +848,30 @@ def station_utilization_chart(snapshot, limit=10):
     return fig
 
 
-def weekday_hour_heatmap(df):
-    if df.empty:
+def weekday_hour_heatmap(df, rollup=None):
+    source = df if rollup is None else rollup
+    if source.empty:
         return px.imshow([[0]], title="🕒 Chaleur disponibilité (jour × heure) – aucune donnée")
 
-    enriched = df.copy()
+    enriched = source.copy()
     enriched["weekday"] = enriched["timestamp"].dt.day_name()
     enriched["weekday_order"] = enriched["timestamp"].dt.weekday
     enriched["hour"] = enriched["timestamp"].dt.hour
 
-    heat = (
-        enriched.groupby(["weekday", "weekday_order", "hour"])["free_bikes"]
-        .mean()
-        .reset_index()
-    )
+    if rollup is None:
+        heat = (
+            enriched.groupby(["weekday", "weekday_order", "hour"])["free_bikes"]
+            .mean()
+            .reset_index()
+        )
+    else:
+        # Hourly rollups: mean over raw rows = Σ sums / Σ sample counts
+        heat = (
+            enriched.groupby(["weekday", "weekday_order", "hour"])[["free_bikes", "samples"]]
+            .sum()
+            .reset_index()
+        )
+        heat["free_bikes"] = heat["free_bikes"] / heat["samples"].clip(lower=1)
 
     ordered_days = (
         heat[["weekday", "weekday_order"]]
@@ -279,12 +921,10 @@ def capacity_donut_chart(snapshot):
 
 
 def critical_split_donut(snapshot, critical_threshold=3):
-    if snapshot.empty:
-        values = [0, 0]
-    else:
-        under = int((snapshot["free_bikes"] <= critical_threshold).sum())
-        over = int((snapshot["free_bikes"] > critical_threshold).sum())
-        values = [under, over]
+    """`snapshot` may be the table itself or its OccupancyHistogram.from_snapshot."""
+    if not isinstance(snapshot, OccupancyHistogram):
+        snapshot = OccupancyHistogram.from_snapshot(snapshot)
+    values = [int(v) for v in snapshot.split(critical_threshold)]
 
     fig = px.pie(
         names=["Sous seuil", "Confort"],
@@ -302,12 +942,13 @@ def critical_split_donut(snapshot, critical_threshold=3):
 # -------------------------
 # Additional tables & charts
 # -------------------------
-def net_change_chart(df, freq="30min"):
-    if df.empty:
+def net_change_chart(df, freq="30min", rollup=None):
+    source = df if rollup is None else rollup
+    if source.empty:
         return px.bar(title="📉 Variation nette des vélos (aucune donnée)")
 
     totals = (
-        df.set_index("timestamp")
+        source.set_index("timestamp")
         .sort_index()
         .resample(freq)["free_bikes"]
         .sum()
@@ -338,7 +979,8 @@ def net_change_chart(df, freq="30min"):
 
 
 def station_activity_table(df, limit=15):
-    if df.empty:
+    activity = as_activity(df)
+    if activity.empty:
         return pd.DataFrame(
             columns=[
                 "station_id",
@@ -351,21 +993,7 @@ def station_activity_table(df, limit=15):
             ]
         )
 
-    ordered = df.sort_values(["station_id", "timestamp"])
-    ordered["movement"] = ordered.groupby("station_id")["free_bikes"].diff().abs()
-    ordered["movement"] = ordered["movement"].fillna(0)
-
-    summary = (
-        ordered.groupby(["station_id", "name"])
-        .agg(
-            records=("timestamp", "count"),
-            avg_bikes=("free_bikes", "mean"),
-            avg_empty_slots=("empty_slots", "mean"),
-            total_moves=("movement", "sum"),
-        )
-        .reset_index()
-    )
-
+    summary = activity.station_summary.copy()
     summary["turnover_rate"] = summary["total_moves"] / summary["records"].clip(lower=1)
     summary = summary.sort_values("total_moves", ascending=False)
 
@@ -386,20 +1014,23 @@ def station_activity_table(df, limit=15):
     return summary
 
 
-def top_station_trend_chart(df, limit=3):
-    if df.empty:
+def top_station_trend_chart(df, limit=3, max_points=None):
+    started = time.perf_counter()
+    activity = as_activity(df)
+    if activity.empty:
         return px.line(title="📍 Evolution des stations (aucune donnée)")
 
-    leaderboard = station_activity_table(df, limit=limit)
+    leaderboard = station_activity_table(activity, limit=limit)
     if leaderboard.empty:
         return px.line(title="📍 Evolution des stations (aucune donnée)")
 
     top_ids = leaderboard["station_id"].tolist()
-    subset = (
-        df[df["station_id"].isin(top_ids)]
-        .sort_values("timestamp")
-        .copy()
-    )
+    frame = activity.frame
+    subset = frame[frame["station_id"].isin(top_ids)]
+    raw_points = len(subset)
+    # One envelope per station, each with the whole budget like its trace
+    subset = downsample(subset, "timestamp", "free_bikes", max_points or point_budget(), by="station_id")
+    subset = subset.sort_values("timestamp")
 
     fig = px.line(
         subset,
@@ -407,32 +1038,37 @@ def top_station_trend_chart(df, limit=3):
         y="free_bikes",
         color="name",
         title="📍 Evolution des stations les plus actives",
-        markers=True,
     )
+    fig.update_traces(mode=trace_mode(len(subset) // max(1, len(top_ids))))
     fig.update_layout(
         legend_title_text="Station",
         margin=dict(l=10, r=10, t=50, b=20),
     )
+    log_chart("top_station_trend", raw_points, len(subset), started, fig)
     return fig
 
 
-def station_history_chart(df, station_name):
-    history = df[df["name"] == station_name].sort_values("timestamp")
+def station_history_chart(df, station_name, max_points=None):
+    started = time.perf_counter()
+    history = df[df["name"] == station_name]
     if history.empty:
         return px.line(title=f"📈 Historique – {station_name} (aucune donnée)")
+    raw_points = len(history)
+    history = downsample(history, "timestamp", "free_bikes", max_points or point_budget())
 
     fig = px.line(
         history,
         x="timestamp",
         y="free_bikes",
         title=f"📈 Historique – {station_name}",
-        markers=True,
     )
+    fig.update_traces(mode=trace_mode(len(history)))
     fig.update_layout(
         margin=dict(l=10, r=10, t=50, b=20),
         hovermode="x unified",
     )
     fig.update_yaxes(title="Vélos disponibles")
+    log_chart("station_history", raw_points, len(history), started, fig)
     return fig
 
 
@@ -452,22 +1088,17 @@ def detect_static_bikes(
         "sample_count",
     ]
 
-    if df.empty:
+    activity = as_activity(df)
+    if activity.empty:
         return pd.DataFrame(columns=columns)
 
-    df_sorted = df.sort_values(["station_id", "timestamp"]).copy()
-    df_sorted["movement"] = (
-        df_sorted.groupby("station_id")["free_bikes"].diff().abs().fillna(0)
-    )
-
-    activity = (
-        df_sorted.groupby(["station_id", "name"])["movement"]
-        .sum()
-        .reset_index(name="total_movement")
+    frame = activity.frame
+    movement = activity.station_summary[["station_id", "name", "total_moves"]].rename(
+        columns={"total_moves": "total_movement"}
     )
 
-    cutoff = df_sorted["timestamp"].max() - pd.Timedelta(minutes=window_minutes)
-    recent = df_sorted[df_sorted["timestamp"] >= cutoff]
+    cutoff = frame["timestamp"].max() - pd.Timedelta(minutes=window_minutes)
+    recent = frame[frame["timestamp"] >= cutoff]
     if recent.empty:
         return pd.DataFrame(columns=columns)
 
@@ -484,7 +1115,7 @@ def detect_static_bikes(
         recent_agg["recent_max"] - recent_agg["recent_min"]
     )
 
-    merged = recent_agg.merge(activity, on=["station_id", "name"], how="left")
+    merged = recent_agg.merge(movement, on=["station_id", "name"], how="left")
     merged["total_movement"] = merged["total_movement"].fillna(0)
 
     flagged = merged[
@@ -533,10 +1164,11 @@ def station_health_scatter(snapshot, critical_threshold=3):
 
 
 def turnover_vs_capacity_chart(df, limit=40):
-    if df.empty:
+    activity = as_activity(df)
+    if activity.empty:
         return px.scatter(title="📊 Dynamique stations (aucune donnée)")
 
-    summary = station_activity_table(df, limit=limit)
+    summary = station_activity_table(activity, limit=limit)
     if summary.empty:
         return px.scatter(title="📊 Dynamique stations (aucune donnée)")
 
@@ -596,13 +1228,9 @@ def peak_hour_analysis(df):
 # Activity Ranking
 # -------------------------
 def activity_ranking(df):
-    df_sorted = df.sort_values(["station_id", "timestamp"])
-    df_sorted["movement"] = df_sorted.groupby("station_id")["free_bikes"].diff().abs()
-
     ranking = (
-        df_sorted.groupby(["station_id", "name"])["movement"]
-        .sum()
-        .reset_index()
+        as_activity(df).station_summary[["station_id", "name", "total_moves"]]
+        .rename(columns={"total_moves": "movement"})
         .sort_values("movement", ascending=False)
     )
 
@@ -614,3 +1242,19 @@ def activity_ranking(df):
     )
 
     return fig
+
+
+# -------------------------
+# Forecasts
+# -------------------------
+def forecast_risk_table(forecasts, snapshot, critical_threshold):
+    """Stations expected at or below the critical threshold within a horizon."""
+    table = forecast_table(forecasts, snapshot)
+    if table.empty:
+        return table
+
+    horizon_columns = [c for c in table.columns if c.startswith("+")]
+    at_risk = table[horizon_columns].le(critical_threshold).any(axis=1)
+    table = table[at_risk & (table["free_bikes"] > critical_threshold)].copy()
+    table[horizon_columns] = table[horizon_columns].round(1)
+    return table.sort_values(horizon_columns[-1]).reset_index(drop=True)
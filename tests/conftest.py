@@ -0,0 +1,61 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils import connections, db
+from utils.connections import ConnectionManager
+from utils.rollups import create_rollup_tables
+
+ACTIVITY_SCHEMA = """
+    CREATE TABLE station_activity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station_id TEXT,
+        name TEXT,
+        free_bikes INTEGER,
+        empty_slots INTEGER,
+        latitude REAL,
+        longitude REAL,
+        timestamp TEXT
+    );
+"""
+
+
+def snapshot(station_bikes, captured_at, capacity=20):
+    """A normalized batch (see fetch_stations.normalize_snapshot) for
+    {station_id: free_bikes}."""
+    ids = sorted(station_bikes)
+    return {
+        "station_id": ids,
+        "name": [f"Station {station_id}" for station_id in ids],
+        "free_bikes": [station_bikes[station_id] for station_id in ids],
+        "empty_slots": [capacity - station_bikes[station_id] for station_id in ids],
+        "latitude": [44.84 + 0.01 * i for i in range(len(ids))],
+        "longitude": [-0.58 + 0.01 * i for i in range(len(ids))],
+        "timestamp": captured_at.isoformat(),
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A scratch legacy-schema database, served as the default manager."""
+    path = str(tmp_path / "bike_data.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(ACTIVITY_SCHEMA)
+    db.create_indexes(conn)
+    create_rollup_tables(conn)
+    conn.commit()
+    conn.close()
+
+    manager = ConnectionManager(path)
+    monkeypatch.setitem(connections._managers, db.DB_PATH, manager)
+    monkeypatch.setitem(connections._managers, path, manager)
+    yield path
+    manager.close()
+
+
+@pytest.fixture
+def days_ago():
+    """UTC midnight `n` days ago (whole days make export boundaries predictable)."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return lambda n: today - timedelta(days=n)
@@ -0,0 +1,106 @@
+import sqlite3
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from scripts.compact_history import compact
+from scripts.fetch_stations import store_snapshot
+from tests.conftest import snapshot
+from utils.parquet_store import export_day, load_full_history
+from utils.rollups import rebuild_rollups
+
+STATIONS = ("a", "b", "c")
+
+
+@pytest.fixture
+def history(db_path, days_ago):
+    """Three days of 10-minute snapshots, starting five days ago."""
+    conn = sqlite3.connect(db_path)
+    start = days_ago(5)
+    for step in range(3 * 24 * 6):
+        bikes = {s: (step * (i + 1) + 3 * i) % 17 for i, s in enumerate(STATIONS)}
+        store_snapshot(conn, snapshot(bikes, start + timedelta(minutes=10 * step)))
+    conn.close()
+    return start
+
+
+def rollup_rows(db_path, grain):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT station_id, bucket, samples, min_bikes, max_bikes, sum_bikes, sum_empty, movement "
+        "FROM station_rollup WHERE grain = ? ORDER BY station_id, bucket",
+        (grain,),
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def raw_bounds(db_path):
+    conn = sqlite3.connect(db_path)
+    bounds = conn.execute("SELECT MIN(timestamp), COUNT(*) FROM station_activity").fetchone()
+    conn.close()
+    return bounds
+
+
+def test_nothing_is_compacted_before_an_export(db_path, history, tmp_path):
+    before = raw_bounds(db_path)
+    assert compact(db_path, keep_days=1, pause=0, parquet_root=str(tmp_path / "parquet")) == 0
+    assert raw_bounds(db_path) == before
+
+
+def test_compaction_stops_at_the_export_boundary(db_path, history, tmp_path):
+    root = str(tmp_path / "parquet")
+    conn = sqlite3.connect(db_path)
+    export_day(conn, history.date(), root)
+    conn.close()
+
+    removed = compact(db_path, keep_days=1, pause=0, parquet_root=root)
+
+    assert removed == 24 * 6 * len(STATIONS)
+    first_raw, _ = raw_bounds(db_path)
+    assert first_raw == (history + timedelta(days=1)).isoformat()
+
+    conn = sqlite3.connect(db_path)
+    first, last, sum_bikes = conn.execute(
+        "SELECT MIN(bucket), MAX(bucket + grain), SUM(sum_bikes) FROM station_history_compact"
+    ).fetchone()
+    exported_sum = pd.read_parquet(root)["free_bikes"].sum()
+    conn.close()
+    assert first == int(history.timestamp())
+    assert last == int((history + timedelta(days=1)).timestamp())
+    assert sum_bikes == exported_sum
+
+
+def test_rollup_rebuild_after_compaction_matches_incremental_rollups(db_path, history, tmp_path):
+    root = str(tmp_path / "parquet")
+    conn = sqlite3.connect(db_path)
+    export_day(conn, history.date(), root)
+    conn.close()
+    incremental = {grain: rollup_rows(db_path, grain) for grain in (3600, 86400)}
+
+    compact(db_path, keep_days=1, pause=0, parquet_root=root)
+    conn = sqlite3.connect(db_path)
+    rebuild_rollups(conn)
+    conn.close()
+
+    for grain, rows in incremental.items():
+        assert rollup_rows(db_path, grain) == rows
+
+
+def test_full_history_reads_compacted_days_that_were_never_exported(db_path, history, tmp_path, monkeypatch):
+    # Export, compact, then lose the export: only the compact table is left
+    root = tmp_path / "parquet"
+    conn = sqlite3.connect(db_path)
+    export_day(conn, history.date(), str(root))
+    conn.close()
+    compact(db_path, keep_days=1, pause=0, parquet_root=str(root))
+    monkeypatch.setattr("utils.parquet_store.PARQUET_ROOT", str(tmp_path / "elsewhere"))
+    monkeypatch.setattr("utils.parquet_store.exported_until", lambda root=None: None)
+    monkeypatch.setattr("utils.parquet_store.exported_days", lambda root=None: [])
+
+    frame = load_full_history(columns=["station_id", "free_bikes", "timestamp"])
+
+    assert frame["timestamp"].min() == pd.Timestamp(history)
+    compacted = frame[frame["timestamp"] < pd.Timestamp(history + timedelta(days=1))]
+    assert len(compacted) == 24 * len(STATIONS)
@@ -0,0 +1,51 @@
+import sqlite3
+from datetime import timedelta
+
+import pytest
+
+from scripts.fetch_stations import store_snapshot
+from streamlit_helpers import DashboardDataLayer, TTLCache
+from tests.conftest import snapshot
+
+
+def test_stats_tell_capacity_evictions_from_expiries():
+    cache = TTLCache(maxsize=2, ttl=600)
+    for key in "abc":
+        cache.get_or_compute(key, lambda: key)
+    cache.ttl = -1
+    cache.get_or_compute("c", lambda: "c")
+
+    stats = cache.stats()
+    assert (stats["maxsize"], stats["evictions"], stats["expired"]) == (2, 1, 1)
+    assert (stats["hits"], stats["misses"]) == (0, 4)
+
+
+def test_a_failed_compute_releases_its_key():
+    cache = TTLCache(maxsize=2, ttl=600)
+
+    def fail():
+        raise RuntimeError("database locked")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("a", fail)
+    assert cache._computing == {}
+    assert cache.get_or_compute("a", lambda: 1) == 1
+    assert cache._computing == {}
+    assert cache.stats()["entries"] == 1
+
+
+def test_publishing_a_version_drops_the_older_entries(db_path, days_ago):
+    conn = sqlite3.connect(db_path)
+    store_snapshot(conn, snapshot({"a": 1, "b": 2}, days_ago(0) - timedelta(minutes=10)))
+    layer = DashboardDataLayer(cache=TTLCache(maxsize=10))
+    layer.refresh()
+    for window in (1, 3, 6):
+        layer.cached("history", window, compute=lambda: window)
+
+    store_snapshot(conn, snapshot({"a": 2, "b": 2}, days_ago(0) - timedelta(minutes=5)))
+    conn.close()
+    assert layer.refresh()
+    layer.cached("history", 1, compute=lambda: 1)
+
+    stats = layer.stats()
+    assert (stats["entries"], stats["expired"], stats["evictions"]) == (1, 3, 0)
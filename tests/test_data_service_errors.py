@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+
+from fastapi import Request  # noqa: E402
+from sqlalchemy.exc import DBAPIError  # noqa: E402
+
+from data_service import main  # noqa: E402
+
+
+class PostgresError(Exception):
+    def __init__(self, sqlstate):
+        super().__init__(f"SQLSTATE {sqlstate}")
+        self.sqlstate = sqlstate
+
+
+def db_error(sqlstate):
+    return DBAPIError("SELECT 1", {}, PostgresError(sqlstate))
+
+
+class FailingSession:
+    """Raises the same database error on every statement."""
+
+    def __init__(self, error):
+        self.error = error
+        self.rolled_back = False
+
+    async def execute(self, *args, **kwargs):
+        raise self.error
+
+    async def rollback(self):
+        self.rolled_back = True
+
+
+def request(path="/stations"):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []})
+
+
+def test_api_starts_while_postgres_is_down(monkeypatch):
+    async def refuse():
+        raise ConnectionRefusedError(111, "Connect call failed")
+
+    monkeypatch.setattr(main, "warm_up", refuse)
+
+    async def start():
+        async with main.lifespan(main.app):
+            return True
+
+    assert asyncio.run(start())
+
+
+@pytest.mark.parametrize(
+    "exc, handler, status, detail",
+    [
+        (db_error(main.QUERY_CANCELED), main.database_error, 503, "Database query timed out."),
+        (db_error(main.UNDEFINED_TABLE), main.database_error, 500, "Database error."),
+        (ConnectionRefusedError(111, "Connect call failed"), main.database_unreachable, 503, "Database unavailable."),
+    ],
+)
+def test_database_failures_are_answered_with_json(exc, handler, status, detail):
+    response = asyncio.run(handler(request(), exc))
+    assert response.status_code == status
+    assert json.loads(response.body) == {"detail": detail}
+
+
+def test_missing_forecast_table_means_no_forecasts():
+    db = FailingSession(db_error(main.UNDEFINED_TABLE))
+    forecasts = asyncio.run(main.station_forecasts(request("/stations/forecast"), horizon=None, db=db, user=None))
+    assert forecasts == []
+    assert db.rolled_back
+
+
+def test_other_forecast_errors_still_reach_the_handler():
+    db = FailingSession(db_error(main.QUERY_CANCELED))
+    with pytest.raises(DBAPIError):
+        asyncio.run(main.station_forecasts(request("/stations/forecast"), horizon=None, db=db, user=None))
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.downsampling import downsample, minmax_indices
+
+
+def buckets(n, max_points):
+    """The consecutive row ranges minmax_indices reduces to two points each."""
+    size = -(-n // ((max_points - 2) // 2))
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+@pytest.mark.parametrize("n, max_points", [(1000, 100), (1001, 37), (10_000, 1200), (50, 5)])
+def test_envelope_keeps_every_bucket_extreme_and_the_endpoints(n, max_points):
+    values = np.random.default_rng(n).normal(size=n).cumsum()
+    keep = minmax_indices(values, max_points)
+
+    assert len(keep) <= max_points
+    assert np.all(np.diff(keep) > 0)
+    assert keep[0] == 0 and keep[-1] == n - 1
+    kept = set(keep.tolist())
+    for start, end in buckets(n, max_points):
+        assert start + np.argmin(values[start:end]) in kept
+        assert start + np.argmax(values[start:end]) in kept
+
+
+def test_spikes_survive_the_envelope():
+    values = np.zeros(5000)
+    values[1234], values[4321] = 50, -50
+    keep = minmax_indices(values, 20)
+    assert {1234, 4321} <= set(keep.tolist())
+
+
+def test_nans_are_not_picked_over_real_values():
+    values = np.arange(1000, dtype=float)
+    values[::2] = np.nan
+    keep = minmax_indices(values, 50)
+    # Only the first row (always kept) may be NaN
+    assert not np.isnan(values[keep[1:]]).any()
+
+
+@pytest.mark.parametrize("n", [0, 1, 4, 100])
+def test_series_within_the_budget_come_back_unchanged(n):
+    assert np.array_equal(minmax_indices(np.random.default_rng(n).random(n), 100), np.arange(n))
+
+
+def test_each_trace_gets_its_own_envelope():
+    frame = pd.DataFrame({
+        "station_id": np.repeat(["a", "b"], 1000),
+        "timestamp": np.tile(np.arange(1000), 2),
+        "free_bikes": np.random.default_rng(0).integers(0, 20, 2000),
+    })
+    reduced = downsample(frame, "timestamp", "free_bikes", 40, by="station_id")
+
+    assert reduced.groupby("station_id").size().le(40).all()
+    for _, trace in reduced.groupby("station_id"):
+        assert trace["timestamp"].is_monotonic_increasing
+        assert trace["timestamp"].iloc[[0, -1]].tolist() == [0, 999]
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import streamlit_helpers
+from tests.conftest import snapshot
+from utils.forecasting import (
+    FORECAST_HISTORY_DAYS,
+    SLOT_SECONDS,
+    SLOTS_PER_DAY,
+    SLOTS_PER_WEEK,
+    StationForecaster,
+)
+
+# A Monday: week slot 0
+START = datetime(2026, 3, 2, tzinfo=timezone.utc)
+CAPACITY = 20
+
+
+def pattern(slot, phase=0):
+    """Free bikes of a periodic station: a daily wave shifted by weekday."""
+    slot = np.asarray(slot)
+    wave = np.sin(2 * np.pi * ((slot + phase) % SLOTS_PER_DAY) / SLOTS_PER_DAY)
+    return np.round(8 + 3 * wave) + (slot % SLOTS_PER_WEEK // SLOTS_PER_DAY) % 3
+
+
+def batches(levels, slots):
+    """One snapshot per slot after START, levels: {station_id: bikes(slot)}."""
+    return [
+        snapshot({sid: float(level(slot)) for sid, level in levels.items()},
+                 START + timedelta(seconds=int(slot) * SLOT_SECONDS), capacity=CAPACITY)
+        for slot in slots
+    ]
+
+
+def frame(snapshots):
+    columns = ["station_id", "name", "free_bikes", "empty_slots"]
+    return pd.concat(
+        [pd.DataFrame({**{c: batch[c] for c in columns}, "timestamp": batch["timestamp"]}) for batch in snapshots],
+        ignore_index=True,
+    )
+
+
+def predicted(forecaster, station_id):
+    forecasts = forecaster.predict()
+    return forecasts[forecasts["station_id"] == station_id].set_index("horizon_minutes")["predicted_bikes"]
+
+
+def test_profile_is_the_week_slot_mean_with_back_off():
+    two_weeks = frame(batches({"a": pattern}, range(2 * SLOTS_PER_WEEK)))
+    monday = frame(batches({"b": pattern}, range(SLOTS_PER_DAY)))
+    once = frame(batches({"c": lambda slot: 7}, [5]))
+    forecaster = StationForecaster().fit(pd.concat([two_weeks, monday, once], ignore_index=True))
+    profile = forecaster.profile()
+    a, b, c = (forecaster.index[s] for s in "abc")
+
+    assert np.allclose(profile[a], pattern(np.arange(SLOTS_PER_WEEK)))
+    # Seen on Mondays only: every weekday falls back to Monday's slot of the day
+    assert np.allclose(profile[b], np.tile(pattern(np.arange(SLOTS_PER_DAY)), 7))
+    # A single sample: the station mean everywhere
+    assert np.allclose(profile[c], 7)
+
+
+def test_recent_deviation_fades_with_the_horizon():
+    # Two identical weeks, except the last six samples climb one bike per slot
+    # above the usual level: half of it lands in the profile, half in the trend
+    end = 2 * SLOTS_PER_WEEK
+
+    def level(slot):
+        return pattern(slot) + max(0, slot - (end - 7))
+
+    forecaster = StationForecaster(horizons=(15, 30, 60), damping_minutes=90)
+    forecaster.fit(frame(batches({"a": level}, range(end))))
+
+    # Residual level 3 bikes, slope half a bike per 15 minutes
+    horizons = np.array([15, 30, 60])
+    anomaly = (3 + horizons / 30) * np.exp(-horizons / 90)
+    expected = pattern((end + horizons // 15) % SLOTS_PER_WEEK) + anomaly
+    assert np.allclose(predicted(forecaster, "a").loc[horizons], expected, atol=0.01)
+
+
+def test_update_after_fit_matches_a_full_fit():
+    levels = {"a": pattern, "b": lambda slot: pattern(slot, phase=30), "c": lambda slot: 12 - pattern(slot) // 2}
+    snapshots = batches(levels, range(0, 10 * SLOTS_PER_DAY, 3))
+    split = len(snapshots) * 2 // 3
+
+    full = StationForecaster().fit(frame(snapshots))
+    incremental = StationForecaster().fit(frame(snapshots[:split]))
+    for batch in snapshots[split:]:
+        incremental.update(batch)
+
+    assert incremental.station_ids == full.station_ids
+    assert np.allclose(incremental.sums, full.sums)
+    assert np.array_equal(incremental.counts, full.counts)
+    assert incremental.last_ts == full.last_ts
+    pd.testing.assert_frame_equal(incremental.predict(), full.predict())
+
+
+@pytest.mark.parametrize("direction, bound", [(1, CAPACITY), (-1, 0)])
+def test_forecasts_stay_between_empty_and_capacity(direction, bound):
+    # Flat at 10 a week ago, then ramping hard towards full (or empty) now,
+    # with no damping: the extrapolated trend overshoots the dock
+    flat = batches({"a": lambda slot: 10}, range(SLOTS_PER_DAY))
+    ramp = batches({"a": lambda slot: 10 + direction * 2 * (slot - SLOTS_PER_WEEK)},
+                   range(SLOTS_PER_WEEK, SLOTS_PER_WEEK + 6))
+    forecaster = StationForecaster(horizons=(15, 60, 240), damping_minutes=1e9)
+    forecaster.fit(frame(flat + ramp))
+
+    forecasts = predicted(forecaster, "a")
+    assert forecasts.between(0, CAPACITY).all()
+    assert forecasts.loc[240] == bound
+
+
+def test_dashboard_fallback_fits_on_the_tracker_history(db_path, monkeypatch):
+    # No tracker forecasts in the database: the dashboard fits its own, on
+    # the tracker's history length rather than the window on screen
+    requested = []
+
+    def load_station_data(hours=None, station_ids=None):
+        requested.append(hours)
+        return frame(batches({"a": pattern}, range(SLOTS_PER_DAY)))
+
+    monkeypatch.setattr(streamlit_helpers, "load_station_data", load_station_data)
+    forecasts = streamlit_helpers.load_station_forecasts()
+
+    assert requested == [FORECAST_HISTORY_DAYS * 24]
+    assert set(forecasts["station_id"]) == {"a"}
@@ -0,0 +1,50 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from utils.map_layers import METERS_PER_DEGREE, StationGeometry, hexagon_cells
+
+
+def local_meters(lat, lon, lat0):
+    return lon * METERS_PER_DEGREE * math.cos(math.radians(lat0)), lat * METERS_PER_DEGREE
+
+
+def test_every_point_falls_in_the_hexagon_of_its_nearest_centre():
+    rng = np.random.default_rng(5)
+    lat = 44.84 + rng.normal(0, 0.03, 2000)
+    lon = -0.58 + rng.normal(0, 0.04, 2000)
+
+    cells, hex_lat, hex_lon = hexagon_cells(lat, lon, radius_m=400)
+
+    lat0 = lat.mean()
+    x, y = local_meters(lat, lon, lat0)
+    cx, cy = local_meters(hex_lat, hex_lon, lat0)
+    distances = np.hypot(x[:, None] - cx[None, :], y[:, None] - cy[None, :])
+    own = distances[np.arange(len(lat)), cells]
+    # Inside the hexagon: no farther than a vertex, and no other centre is closer
+    assert own.max() <= 400 + 1e-6
+    assert np.all(own <= distances.min(axis=1) + 1e-6)
+    assert len(np.unique(cells)) == len(hex_lat)
+
+
+def test_hexagon_records_add_up_to_the_snapshot():
+    rng = np.random.default_rng(8)
+    size = 500
+    capacity = rng.integers(10, 40, size)
+    bikes = rng.integers(0, capacity + 1)
+    snapshot = pd.DataFrame({
+        "station_id": [f"st-{i:04d}" for i in range(size)],
+        "name": [f"Station {i}" for i in range(size)],
+        "latitude": 44.84 + rng.normal(0, 0.02, size),
+        "longitude": -0.58 + rng.normal(0, 0.03, size),
+        "free_bikes": bikes,
+        "empty_slots": capacity - bikes,
+    })
+
+    records = StationGeometry(hex_radius_m=400).hexagon_records(snapshot)
+
+    cells, _, _ = hexagon_cells(snapshot["latitude"].round(5), snapshot["longitude"].round(5), radius_m=400)
+    assert len(records) == len(np.unique(cells))
+    assert sum(int(r["name"].split()[0]) for r in records) == size
+    assert sum(r["elevation"] for r in records) == bikes.sum()
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from streamlit_helpers import OccupancyHistogram
+
+START = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+
+def history(samples):
+    """samples: (station_id, minutes after START, free_bikes)."""
+    return pd.DataFrame({
+        "station_id": [s for s, _, _ in samples],
+        "free_bikes": [b for _, _, b in samples],
+        "timestamp": [START + timedelta(minutes=m) for _, m, _ in samples],
+    })
+
+
+@pytest.fixture
+def histogram():
+    # "a" is polled unevenly and misses almost three hours after minute 20;
+    # "b" stops reporting after minute 5
+    df = history([
+        ("a", 0, 0), ("a", 10, 5), ("a", 20, 0), ("a", 180, 5), ("a", 190, 0),
+        ("b", 0, 2), ("b", 5, 3),
+    ])
+    return OccupancyHistogram.from_history(df, max_gap_seconds=1800)
+
+
+def test_each_sample_counts_for_the_time_until_the_next(histogram):
+    a, b = (histogram.station_ids.get_loc(s) for s in ("a", "b"))
+    # a: 10 min at 0, 10 min at 5, the outage capped at 30 min, 10 min at 5,
+    # and its newest sample counts for the median polling interval (10 min)
+    assert np.allclose(histogram.weights[a, [0, 5]], [600 + 1800 + 600, 600 + 600])
+    # b: 5 min at 2, then its last level runs to the end of the window, capped
+    assert np.allclose(histogram.weights[b, [2, 3]], [300, 1800])
+
+
+def test_shares_below_a_threshold_are_time_weighted(histogram):
+    # By sample count "a" would be empty 3 times out of 5
+    assert histogram.station_share_below("a", 0) == pytest.approx(3000 / 4200)
+    assert histogram.share_below(2).to_dict() == pytest.approx({"a": 3000 / 4200, "b": 300 / 2100})
+    assert histogram.station_share_below("missing", 0) is None
+    assert histogram.split(0) == pytest.approx((3000, 1200 + 2100))
+
+
+def test_until_extends_the_last_samples_up_to_the_cap():
+    df = history([("a", 0, 1), ("a", 10, 4)])
+
+    histogram = OccupancyHistogram.from_history(df, max_gap_seconds=1800, until=START + timedelta(minutes=25))
+    assert np.allclose(histogram.weights[0, [1, 4]], [600, 900])
+
+    histogram = OccupancyHistogram.from_history(df, max_gap_seconds=1800, until=START + timedelta(hours=5))
+    assert np.allclose(histogram.weights[0, [1, 4]], [600, 1800])
+
+
+def test_a_single_snapshot_weighs_each_station_at_its_level():
+    # No next sample and nothing after it: without a default weight every
+    # station would total zero and read as never below any threshold
+    histogram = OccupancyHistogram.from_history(history([("a", 0, 0), ("b", 0, 3)]), max_gap_seconds=1800)
+    assert np.all(histogram.totals > 0)
+    assert histogram.share_below(0).to_dict() == {"a": 1.0, "b": 0.0}
+    assert histogram.share_below(3).to_dict() == {"a": 1.0, "b": 1.0}
+
+
+def test_the_default_last_weight_is_capped_at_the_gap_cap():
+    # Polled every two hours: the newest sample weighs the cap, not two hours
+    df = history([("a", 0, 1), ("a", 120, 4), ("a", 240, 2)])
+    histogram = OccupancyHistogram.from_history(df, max_gap_seconds=1800)
+    assert np.allclose(histogram.weights[0, [1, 4, 2]], [1800, 1800, 1800])
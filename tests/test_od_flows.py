@@ -0,0 +1,98 @@
+import sqlite3
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from scripts.fetch_stations import store_snapshot
+from tests.conftest import snapshot
+from utils.connections import get_manager
+from utils import od_flows
+from utils.od_flows import FlowEstimator, decay_kernel, estimate_flows, process_history
+from utils.rebalancing import haversine_matrix
+
+
+def test_decay_kernel_keeps_exactly_the_pairs_within_max_km():
+    rng = np.random.default_rng(3)
+    lat = 44.84 + rng.normal(0, 0.04, 300)
+    lon = -0.58 + rng.normal(0, 0.06, 300)
+
+    kernel = decay_kernel(lat, lon, decay_km=1.5, max_km=4.0).toarray()
+
+    distances = haversine_matrix(lat, lon, dtype=np.float64)
+    expected = np.where(distances <= 4.0, np.exp(-distances / 1.5), 0.0)
+    np.fill_diagonal(expected, 0.0)
+    assert np.array_equal(kernel > 0, expected > 0)
+    assert np.allclose(kernel, expected, atol=1e-6)
+
+
+def test_blocked_flows_match_the_dense_formula(monkeypatch):
+    rng = np.random.default_rng(4)
+    lat = 44.84 + rng.normal(0, 0.02, 60)
+    lon = -0.58 + rng.normal(0, 0.03, 60)
+    kernel = decay_kernel(lat, lon, decay_km=1.5, max_km=3.0)
+    deltas = rng.integers(-2, 3, (60, 48)).astype(float)
+    # A few non-zeros per block, and a block boundary inside the last one
+    monkeypatch.setattr(od_flows, "OD_BLOCK_ELEMENTS", 48 * 7)
+
+    flows = estimate_flows(deltas, kernel).toarray()
+
+    dense = kernel.toarray()
+    outflow, inflow = np.clip(-deltas, 0, None), np.clip(deltas, 0, None)
+    reach = dense @ inflow
+    share = np.divide(outflow, reach, out=np.zeros_like(reach), where=reach > 0)
+    expected = dense * (share @ inflow.T)
+    assert np.allclose(flows, expected)
+    # Departures reaching any gaining neighbour are fully spread
+    assert np.allclose(flows.sum(axis=1), (outflow * (reach > 0)).sum(axis=1))
+
+
+@pytest.fixture
+def history(db_path, days_ago):
+    """Two days of 5-minute snapshots. Several bikes move between 25
+    stations in each slot, so departures split into fractional flows and
+    many pairs end the day close to the min_flow cut. The tracker is down
+    over the first midnight, so that day's last chunk reads no rows."""
+    rng = np.random.default_rng(11)
+    bikes = np.full(25, 10)
+    conn = sqlite3.connect(db_path)
+    start = days_ago(2)
+    for step in range(2 * 24 * 12):
+        for _ in range(rng.poisson(4)):
+            origin, destination = rng.choice(len(bikes), 2, replace=False)
+            if bikes[origin] > 0 and bikes[destination] < 20:
+                bikes[origin] -= 1
+                bikes[destination] += 1
+        captured_at = start + timedelta(minutes=5 * step)
+        if timedelta(hours=23) <= captured_at - start < timedelta(hours=25):
+            continue
+        stations = {f"s{i:02d}": int(b) for i, b in enumerate(bikes)}
+        store_snapshot(conn, snapshot(stations, captured_at))
+    conn.close()
+    return start
+
+
+def stored_flows(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT day, origin_id, destination_id, flow FROM station_od_flows ORDER BY 1, 2, 3"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_incremental_runs_store_the_same_flows_as_one_pass(db_path, history):
+    manager = get_manager(db_path)
+    # High enough that some daily totals fall below it
+    estimator = FlowEstimator(min_flow=0.5)
+    end = history + timedelta(days=2)
+    for hours in (5, 12, 21, 23.5, 24.5, 30, 36, 41, 47, 48):
+        process_history(manager, estimator, until=history + timedelta(hours=hours))
+    incremental = stored_flows(db_path)
+
+    process_history(manager, estimator, rebuild=True, until=end)
+    full = stored_flows(db_path)
+
+    assert [row[:3] for row in incremental] == [row[:3] for row in full]
+    assert np.allclose([row[3] for row in incremental], [row[3] for row in full], rtol=1e-9)
+    assert 0 < len(full) and min(row[3] for row in full) >= estimator.min_flow
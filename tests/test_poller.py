@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from scripts import stub_citybikes, track_activity
+from scripts.track_activity import Poller
+from utils.alerts import create_alert_tables
+from utils.forecasting import create_forecast_tables
+
+STATIONS = 20
+
+
+@pytest.fixture
+def stub():
+    """Start a CityBikes stub on an ephemeral port; returns a factory taking the reply delay."""
+    servers = []
+
+    def start(delay=0.0):
+        server = stub_citybikes.serve(port=0, stations=STATIONS, delay=delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def tracker_db(db_path):
+    conn = sqlite3.connect(db_path)
+    create_alert_tables(conn)
+    create_forecast_tables(conn)
+    conn.close()
+    return db_path
+
+
+def run_poller(poller, cycles):
+    """Run `cycles` cycles; returns the scheduled time of every cycle started."""
+    scheduled = []
+    run_cycle = poller.run_cycle
+
+    async def recording(tick):
+        scheduled.append(tick)
+        await run_cycle(tick)
+
+    poller.run_cycle = recording
+    asyncio.run(poller.run(max_cycles=cycles))
+    return scheduled
+
+
+def stored_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT substr(station_id, 1, instr(station_id, '-') - 1), COUNT(*), COUNT(DISTINCT timestamp) "
+        "FROM station_activity GROUP BY 1 ORDER BY 1"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_cycles_store_every_network_and_back_off_a_failing_one(stub, tracker_db, monkeypatch):
+    monkeypatch.setattr(track_activity, "BACKOFF_BASE", 60)
+    poller = Poller(["alpha", "beta", "flaky"], base_url=stub(), interval=1, cube_root=None)
+
+    scheduled = run_poller(poller, cycles=3)
+
+    assert stored_rows(tracker_db) == [("alpha", 3 * STATIONS, 3), ("beta", 3 * STATIONS, 3)]
+    # Failed once, then skipped for the remaining cycles
+    flaky = poller.states["flaky"]
+    assert flaky.failures == 1 and flaky.retry_at > time.time() + 50
+    assert poller.states["alpha"].failures == 0
+    # Fixed rate on wall-clock boundaries
+    assert [b - a for a, b in zip(scheduled, scheduled[1:])] == [1, 1]
+    assert all(tick % 1 == 0 for tick in scheduled)
+
+
+def test_a_tick_is_skipped_while_the_previous_cycle_runs(stub, tracker_db):
+    poller = Poller(["alpha"], base_url=stub(delay=1.4), interval=1, cube_root=None)
+
+    scheduled = run_poller(poller, cycles=2)
+
+    # The tick one interval after the first fell inside the slow cycle
+    assert scheduled[1] - scheduled[0] == 2
+    assert stored_rows(tracker_db) == [("alpha", 2 * STATIONS, 2)]
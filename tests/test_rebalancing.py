@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.rebalancing import RebalancingPlanner, station_imbalance
+
+
+def stations(bikes, lat, lon, capacity=20):
+    bikes = np.asarray(bikes)
+    return pd.DataFrame({
+        "station_id": [f"s{i:03d}" for i in range(len(bikes))],
+        "name": [f"Station {i}" for i in range(len(bikes))],
+        "latitude": lat,
+        "longitude": lon,
+        "free_bikes": bikes,
+        "empty_slots": capacity - bikes,
+    })
+
+
+def test_a_truck_stopped_early_only_picks_up_what_it_delivers():
+    # s000 has 10 spare bikes; s001 (next door) needs 4, s002 (farther) needs 6
+    snapshot = stations([20, 6, 4], lat=[44.840, 44.841, 44.850], lon=[-0.580, -0.580, -0.580])
+    planner = RebalancingPlanner(trucks=2, truck_capacity=15, max_stops=2, time_budget=5)
+
+    stops = planner.plan(snapshot, target_fill=0.5, min_move=1)
+
+    moves = [(row.truck, row.station_id, row.action, row.bikes, row.load) for row in stops.itertuples()]
+    assert moves == [
+        (1, "s000", "pickup", 4, 4), (1, "s001", "dropoff", 4, 0),
+        (2, "s000", "pickup", 6, 6), (2, "s002", "dropoff", 6, 0),
+    ]
+
+
+@pytest.mark.parametrize("trucks, truck_capacity, max_stops", [(3, 10, 4), (5, 25, 7), (2, 6, 12)])
+def test_routes_are_balanced_feasible_and_within_limits(trucks, truck_capacity, max_stops):
+    rng = np.random.default_rng(truck_capacity)
+    size = 150
+    snapshot = stations(
+        rng.integers(0, 21, size),
+        lat=44.84 + rng.normal(0, 0.02, size),
+        lon=-0.58 + rng.normal(0, 0.03, size),
+    )
+    planner = RebalancingPlanner(trucks=trucks, truck_capacity=truck_capacity, max_stops=max_stops, time_budget=5)
+
+    stops = planner.plan(snapshot, target_fill=0.5, min_move=2)
+
+    assert stops["truck"].nunique() == trucks
+    imbalance = station_imbalance(snapshot, 0.5, 2).set_index("station_id")["imbalance"]
+    for _, route in stops.groupby("truck"):
+        signed = np.where(route["action"] == "pickup", route["bikes"], -route["bikes"])
+        assert signed.sum() == 0
+        assert (route["bikes"] > 0).all()
+        assert np.array_equal(np.cumsum(signed), route["load"])
+        assert route["load"].between(0, truck_capacity).all()
+        assert len(route) <= max_stops
+    # No station is served past its own surplus or deficit
+    moved = stops.assign(signed=np.where(stops["action"] == "pickup", stops["bikes"], -stops["bikes"]))
+    per_station = moved.groupby("station_id")["signed"].sum()
+    target = imbalance.reindex(per_station.index)
+    assert (np.sign(per_station) == np.sign(target)).all()
+    assert (per_station.abs() <= target.abs()).all()
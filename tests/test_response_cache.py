@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi import Request  # noqa: E402
+
+from data_service.cache import ResponseCache, etag_matches, strong_etag  # noqa: E402
+
+
+class VersionSession:
+    """Answers the cache's version queries with a settable watermark."""
+
+    def __init__(self):
+        self.watermark = 1
+
+    async def execute(self, statement):
+        watermark = self.watermark
+
+        class Result:
+            def one(self):
+                return (watermark, 10)
+
+        return Result()
+
+
+def request(path="/stations", query=b"", if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query, "headers": headers})
+
+
+def test_if_none_match_uses_the_weak_comparison():
+    etag = strong_etag(b"[]")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_matching_etag_gets_a_bodyless_304_until_the_data_moves():
+    cache = ResponseCache(maxsize=8, max_bytes=1024, version_ttl=0)
+    db = VersionSession()
+    builds = []
+
+    async def build():
+        builds.append(db.watermark)
+        return [{"station_id": "a", "free_bikes": db.watermark}]
+
+    async def scenario():
+        first = await cache.respond(request(), db, ["stations"], build)
+        etag = first.headers["etag"]
+        revalidated = await cache.respond(request(if_none_match=etag), db, ["stations"], build)
+        db.watermark = 2
+        changed = await cache.respond(request(if_none_match=etag), db, ["stations"], build)
+        return first, etag, revalidated, changed
+
+    first, etag, revalidated, changed = asyncio.run(scenario())
+
+    assert first.status_code == 200 and first.headers["x-cache"] == "MISS"
+    assert etag == strong_etag(first.body)
+    assert revalidated.status_code == 304 and revalidated.body == b""
+    assert revalidated.headers["etag"] == etag and revalidated.headers["x-cache"] == "HIT"
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert builds == [1, 2]
+    assert cache.stats()["not_modified"] == 1
@@ -0,0 +1,90 @@
+import sqlite3
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from scripts.fetch_stations import store_snapshot
+from tests.conftest import snapshot
+from utils import db
+from utils.rollups import GRAINS, rebuild_rollups
+
+
+@pytest.fixture
+def history(db_path, days_ago):
+    """Irregular snapshots: uneven gaps, a station joining late and one
+    missing from some snapshots."""
+    conn = sqlite3.connect(db_path)
+    start = days_ago(2) + timedelta(minutes=3)
+    offset = timedelta()
+    for step in range(300):
+        offset += timedelta(minutes=4 + step % 7)
+        bikes = {"a": step % 13, "b": (3 * step) % 11}
+        if step % 5:
+            bikes["c"] = (step * step) % 9
+        if step > 120:
+            bikes["d"] = 20 - step % 20
+        store_snapshot(conn, snapshot(bikes, start + offset))
+    conn.close()
+    return start
+
+
+def table_rows(db_path, table):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3").fetchall()
+    conn.close()
+    return rows
+
+
+def test_rebuild_matches_incremental_rollups(db_path, history):
+    incremental = {table: table_rows(db_path, table)
+                   for table in ("station_rollup", "citywide_rollup", "rollup_state")}
+
+    conn = sqlite3.connect(db_path)
+    rebuild_rollups(conn)
+    conn.close()
+
+    for table, rows in incremental.items():
+        assert table_rows(db_path, table) == rows, table
+
+
+def test_create_table_backfills_rollups_of_an_older_database(db_path, history, monkeypatch):
+    built = {table: table_rows(db_path, table)
+             for table in ("station_rollup", "citywide_rollup", "rollup_state")}
+    # As before the rollup tables existed
+    conn = sqlite3.connect(db_path)
+    conn.executescript("DROP TABLE station_rollup; DROP TABLE citywide_rollup; DROP TABLE rollup_state;")
+    conn.close()
+    monkeypatch.setattr(db, "DB_PATH", db_path)
+
+    db.create_table()
+
+    for table, rows in built.items():
+        assert table_rows(db_path, table) == rows, table
+
+
+@pytest.mark.parametrize("grain", GRAINS)
+def test_rollups_match_a_resample_of_the_raw_history(db_path, history, grain):
+    conn = sqlite3.connect(db_path)
+    raw = pd.read_sql("SELECT station_id, free_bikes, timestamp FROM station_activity", conn)
+    rollup = pd.read_sql(
+        "SELECT station_id, bucket, samples, sum_bikes, movement FROM station_rollup WHERE grain = ?",
+        conn, params=(GRAINS[grain],),
+    )
+    conn.close()
+
+    raw["timestamp"] = pd.to_datetime(raw["timestamp"], format="ISO8601", utc=True)
+    raw = raw.sort_values(["station_id", "timestamp"])
+    raw["movement"] = raw.groupby("station_id")["free_bikes"].diff().abs().fillna(0)
+    expected = (
+        raw.groupby(["station_id", pd.Grouper(key="timestamp", freq=grain)])
+        .agg(samples=("free_bikes", "size"), sum_bikes=("free_bikes", "sum"), movement=("movement", "sum"))
+        .query("samples > 0")
+        .reset_index()
+    )
+    expected["bucket"] = [int(ts.timestamp()) for ts in expected.pop("timestamp")]
+
+    merged = expected.merge(rollup, on=["station_id", "bucket"], suffixes=("", "_rollup"), validate="1:1")
+    assert len(merged) == len(rollup) == len(expected)
+    for column in ("samples", "sum_bikes", "movement"):
+        assert (merged[column] == merged[f"{column}_rollup"]).all(), column
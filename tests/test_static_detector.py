@@ -0,0 +1,148 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from streamlit_helpers import detect_static_bikes, load_open_alerts
+from tests.conftest import snapshot
+from utils.alerts import StaticBikeDetector, create_alert_tables, record_transitions
+from utils.anomaly_backtest import BacktestData, backtest, evaluate
+
+START = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+
+def synthetic_history(stations=6, steps=400, seed=7):
+    """Stations that alternate between busy spells and frozen stock, sampled
+    every 4 to 11 minutes."""
+    rng = np.random.default_rng(seed)
+    ts = START + pd.to_timedelta(np.cumsum(rng.integers(4, 12, steps)), unit="min")
+    frames = []
+    for i in range(stations):
+        busy = (np.arange(steps) // rng.integers(8, 30)) % 2 == 0
+        walk = np.cumsum(np.where(busy, rng.integers(-3, 4, steps), 0))
+        bikes = np.clip(10 + walk, 0, 20)
+        frames.append(pd.DataFrame({
+            "station_id": f"s{i}",
+            "name": f"Station s{i}",
+            "free_bikes": bikes,
+            "empty_slots": 20 - bikes,
+            "timestamp": ts,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def replay(history, detector):
+    transitions = []
+    for ts, frame in history.groupby("timestamp", sort=True):
+        batch = snapshot(dict(zip(frame["station_id"], frame["free_bikes"].astype(int))), ts.to_pydatetime())
+        transitions.extend(detector.update(batch))
+    return transitions
+
+
+@pytest.mark.parametrize("window_minutes, activity_threshold", [(15, 5), (30, 8), (60, 3)])
+def test_online_detector_matches_the_batch_backtest(window_minutes, activity_threshold):
+    history = synthetic_history()
+    params = dict(window_minutes=window_minutes, activity_threshold=activity_threshold,
+                  static_threshold=1, activity_hours=6)
+
+    detector = StaticBikeDetector(**params)
+    transitions = replay(history, detector)
+    intervals = backtest(history, **params)
+
+    online_opens = sorted((t[1], pd.Timestamp(t[2])) for t in transitions if t[0] == "open")
+    online_resolves = sorted((t[1], pd.Timestamp(t[2])) for t in transitions if t[0] == "resolve")
+    assert len(online_opens) > 3
+    assert online_opens == sorted(zip(intervals["station_id"], intervals["opened_at"]))
+    closed = intervals.dropna(subset=["resolved_at"])
+    assert online_resolves == sorted(zip(closed["station_id"], closed["resolved_at"]))
+    assert detector.open == set(intervals.loc[intervals["resolved_at"].isna(), "station_id"])
+
+
+@pytest.mark.parametrize("window_minutes, activity_threshold", [(15, 5), (60, 3)])
+def test_backtest_replays_the_dashboard_rule(window_minutes, activity_threshold):
+    history = synthetic_history(steps=200)
+    data = BacktestData(history)
+    flagged, _ = evaluate(data, window_minutes=window_minutes, activity_threshold=activity_threshold,
+                          static_threshold=1, activity_hours=2)
+    by_sample = pd.Series(flagged).groupby(data.timestamps.to_numpy()).agg(
+        lambda f: set(data.station_ids[f.index[f.to_numpy()]])
+    )
+
+    # The dashboard at each snapshot: the last activity_hours of history
+    for ts, expected in by_sample.items():
+        window = history[(history["timestamp"] >= ts - pd.Timedelta(hours=2)) & (history["timestamp"] <= ts)]
+        static = detect_static_bikes(window, window_minutes=window_minutes,
+                                     activity_threshold=activity_threshold, static_threshold=1)
+        assert set(static["station_id"]) == expected, ts
+    assert sum(map(len, by_sample)) > 20
+
+
+def test_rolling_range_matches_a_direct_window_scan():
+    history = synthetic_history(stations=3, steps=300, seed=2)
+    data = BacktestData(history)
+
+    lows, highs, counts = data.rolling_range(45 * 60)
+
+    left = data.window_start(45 * 60)
+    for row in range(len(data)):
+        window = data.bikes[left[row]:row + 1]
+        assert (lows[row], highs[row], counts[row]) == (window.min(), window.max(), len(window))
+
+
+def frozen_station_detector():
+    detector = StaticBikeDetector(window_minutes=15, activity_threshold=2, activity_hours=6)
+    # "a" moves then freezes; "b" keeps moving
+    for step, bikes in enumerate([0, 4, 8, 8, 8]):
+        detector.update(snapshot({"a": bikes, "b": 3 * step}, START + timedelta(minutes=10 * step)), "net-1")
+    assert detector.open == {"a"}
+    return detector
+
+
+def test_alerts_resolve_when_a_station_leaves_the_feed():
+    detector = frozen_station_detector()
+
+    transitions = detector.update(snapshot({"b": 15}, START + timedelta(minutes=50)), "net-1")
+
+    assert [(kind, station_id) for kind, station_id, _, _ in transitions] == [("resolve", "a")]
+    assert detector.open == set()
+
+
+def test_other_networks_snapshots_leave_alerts_open():
+    detector = frozen_station_detector()
+
+    assert detector.update(snapshot({"z": 3}, START + timedelta(minutes=50)), "net-2") == []
+    assert detector.open == {"a"}
+
+
+@pytest.fixture
+def alerts_db(db_path):
+    conn = sqlite3.connect(db_path)
+    create_alert_tables(conn)
+    yield conn
+    conn.close()
+
+
+def test_dashboard_falls_back_without_a_detector_heartbeat(alerts_db):
+    assert load_open_alerts() is None
+
+
+def test_dashboard_trusts_a_live_detector_with_no_open_alert(alerts_db):
+    now = datetime.now(timezone.utc)
+    record_transitions(alerts_db, [], heartbeat=(now.isoformat(), 120, 0))
+
+    alerts = load_open_alerts()
+
+    assert alerts is not None and alerts.empty
+
+
+def test_dashboard_falls_back_when_the_heartbeat_is_stale(alerts_db):
+    stale = datetime.now(timezone.utc) - timedelta(hours=2)
+    record_transitions(
+        alerts_db,
+        [("open", "a", stale.isoformat(), {"name": "Station a"})],
+        heartbeat=(stale.isoformat(), 120, 1),
+    )
+
+    assert load_open_alerts() is None
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from tests.conftest import snapshot
+from utils import station_cube
+from utils.station_cube import MISSING, StationTimeCube, _grow_rows, open_for_append
+
+START = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+
+def test_appended_snapshots_read_back_from_a_fresh_reader(tmp_path, monkeypatch):
+    # Small padding and hourly slots: new stations and new days both resize the files
+    monkeypatch.setattr(station_cube, "STATION_PADDING", 2)
+    root = str(tmp_path / "cube")
+    writer = StationTimeCube.create(root, origin=START, slot_seconds=3600)
+    batches = [
+        snapshot({"a": 3, "b": 5}, START),
+        snapshot({"a": 4, "b": 5, "c": 1}, START + timedelta(hours=1)),
+        # Same slot: last wins
+        snapshot({"a": 6}, START + timedelta(hours=1, minutes=30)),
+        # A day and a half later, with two more stations
+        snapshot({"b": 2, "d": 7, "e": 9}, START + timedelta(hours=37)),
+    ]
+    for batch in batches:
+        writer.append(batch)
+
+    reader = StationTimeCube.open(root)
+
+    assert reader.station_ids == ["a", "b", "c", "d", "e"]
+    assert reader.shape == (5, 38)
+    expected = np.full((5, 38), MISSING)
+    expected[:, 0] = [3, 5, MISSING, MISSING, MISSING]
+    expected[:, 1] = [6, 5, 1, MISSING, MISSING]
+    expected[:, 37] = [MISSING, 2, MISSING, 7, 9]
+    assert np.array_equal(reader.free_bikes, expected)
+    frame = reader.to_frame().sort_values(["timestamp", "station_id"]).reset_index(drop=True)
+    assert frame["free_bikes"].tolist() == [3, 5, 6, 5, 1, 2, 7, 9]
+    assert (frame["free_bikes"] + frame["empty_slots"] == 20).all()
+
+
+def test_reopening_for_append_keeps_the_existing_cells(tmp_path):
+    root = str(tmp_path / "cube")
+    open_for_append(root, origin=START).append(snapshot({"a": 3}, START))
+    open_for_append(root).append(snapshot({"a": 4, "b": 1}, START + timedelta(minutes=10)))
+
+    cube = StationTimeCube.open(root)
+
+    assert cube.filled()[0].tolist() == [3, 3, 4]
+    assert cube.total_movement().to_dict() == {"a": 1, "b": 0}
+
+
+def test_growing_rows_rewrites_a_valid_header_in_place(tmp_path):
+    path = str(tmp_path / "free_bikes.npy")
+    values = np.arange(24 * 3, dtype=station_cube.DTYPE).reshape(24, 3)
+    np.save(path, values)
+    size = (tmp_path / "free_bikes.npy").stat().st_size
+
+    # Far more digits in the row count than before
+    _grow_rows(path, 10_000_000 // 3)
+
+    grown = np.load(path, mmap_mode="r")
+    assert grown.shape == (10_000_000 // 3, 3)
+    assert np.array_equal(grown[:24], values)
+    assert (grown[24:] == MISSING).all()
+    # Header untouched in size: the data did not move
+    assert (tmp_path / "free_bikes.npy").stat().st_size == size + (grown.shape[0] - 24) * 3 * 2
+    _grow_rows(path, 10)
+    assert np.load(path, mmap_mode="r").shape == grown.shape
+
+
+def test_a_header_without_room_to_grow_is_left_untouched(tmp_path):
+    # Written without numpy's growth padding, as some older writers do
+    header = "{'descr':'<i2','fortran_order':False,'shape':(24,3)}"
+    header += " " * (-(10 + len(header) + 1) % 64) + "\n"
+    path = tmp_path / "free_bikes.npy"
+    path.write_bytes(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode()
+                     + np.arange(72, dtype="<i2").tobytes())
+    before = path.read_bytes()
+
+    with pytest.raises(RuntimeError):
+        _grow_rows(str(path), 48)
+
+    assert path.read_bytes() == before
+    assert np.array_equal(np.load(path), np.arange(72).reshape(24, 3))
+
+
+def test_snapshots_before_the_origin_are_refused(tmp_path):
+    cube = open_for_append(str(tmp_path / "cube"), origin=START)
+    with pytest.raises(ValueError):
+        cube.append(snapshot({"a": 1}, START - timedelta(hours=1)))
+    assert StationTimeCube.open(str(tmp_path / "cube")).shape == (0, 0)
@@ -0,0 +1,91 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from utils.station_profiles import HOURLY, WEEK_HOURS, BehaviourClusters
+
+# A Monday 00:00 UTC: bucket offsets are week hours
+MONDAY = int(datetime(2026, 3, 2, tzinfo=timezone.utc).timestamp())
+CAPACITY = 20
+
+SHAPES = {
+    # Full during office hours, full at night, full at weekends, flat
+    "office": lambda hour: 0.9 if hour < 120 and 9 <= hour % 24 < 17 else 0.2,
+    "home": lambda hour: 0.9 if hour % 24 < 6 or hour % 24 >= 22 else 0.2,
+    "park": lambda hour: 0.9 if hour >= 120 and 11 <= hour % 24 < 19 else 0.2,
+    "flat": lambda hour: 0.5,
+}
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def add_hours(conn, stations, hours):
+    """Hourly rollup rows, stations: {station_id: shape name}."""
+    rows = []
+    for station_id, shape in stations.items():
+        for hour in hours:
+            bikes = round(SHAPES[shape](hour % WEEK_HOURS) * CAPACITY)
+            rows.append((HOURLY, station_id, MONDAY + hour * HOURLY, bikes, bikes, bikes, CAPACITY - bikes))
+    with conn:
+        conn.executemany(
+            "INSERT INTO station_rollup (grain, station_id, bucket, samples, min_bikes, max_bikes,"
+            " sum_bikes, sum_empty, movement) VALUES (?, ?, ?, 1, ?, ?, ?, ?, 0)",
+            rows,
+        )
+
+
+def refresh_after(clusters, conn, hour):
+    """Refresh once `hour` has closed."""
+    return clusters.refresh(conn, now=MONDAY + (hour + 1) * HOURLY)
+
+
+def test_model_is_rebuilt_when_stations_outgrow_the_first_cluster_count(conn):
+    clusters = BehaviourClusters(n_clusters=4, timezone="UTC")
+    add_hours(conn, {"o1": "office", "h1": "home"}, range(WEEK_HOURS))
+    refresh_after(clusters, conn, WEEK_HOURS - 1)
+    assert clusters.model.n_clusters == 2
+
+    # Six stations open the next week
+    more = {"o2": "office", "h2": "home", "p1": "park", "p2": "park", "f1": "flat", "f2": "flat"}
+    add_hours(conn, {"o1": "office", "h1": "home", **more}, range(WEEK_HOURS, 2 * WEEK_HOURS))
+    assignment = refresh_after(clusters, conn, 2 * WEEK_HOURS - 1).set_index("station_id")["cluster"]
+
+    assert clusters.model.n_clusters == 4
+    # Each shape gets its own cluster
+    for a, b in [("o1", "o2"), ("h1", "h2"), ("p1", "p2"), ("f1", "f2")]:
+        assert assignment[a] == assignment[b]
+    assert assignment.nunique() == 4
+
+
+def test_partial_fit_is_weighted_by_the_new_data_only(conn):
+    clusters = BehaviourClusters(n_clusters=2, timezone="UTC")
+    stations = {"o1": "office", "o2": "office", "h1": "home", "h2": "home"}
+    add_hours(conn, stations, range(WEEK_HOURS))
+    refresh_after(clusters, conn, WEEK_HOURS - 1)
+    centers = clusters.model.cluster_centers_.copy()
+
+    fed = []
+    partial_fit = clusters.model.partial_fit
+    clusters.model.partial_fit = lambda X, sample_weight=None: fed.append((len(X), sample_weight)) or partial_fit(
+        X, sample_weight=sample_weight
+    )
+
+    # One more hour for two stations: a week of data each, plus one hour
+    add_hours(conn, {"o1": "office", "h1": "home"}, [WEEK_HOURS])
+    refresh_after(clusters, conn, WEEK_HOURS)
+    (count, weights), = fed
+    assert count == 2
+    assert np.allclose(weights, 1 / (WEEK_HOURS + 1))
+    # Stations re-fed at full weight every hour would drag the centres along
+    assert np.abs(clusters.model.cluster_centers_ - centers).max() < 0.01
+
+    # Nothing closed since: the cached assignment, no model step
+    refresh_after(clusters, conn, WEEK_HOURS)
+    assert len(fed) == 1
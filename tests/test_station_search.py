@@ -0,0 +1,62 @@
+import pytest
+
+from utils.station_search import StationSearchCache, StationSearchIndex
+
+STATIONS = [
+    ("1", "Gare Saint-Jean"),
+    ("2", "Hôtel de Ville"),
+    ("3", "Place de la Bourse"),
+    ("4", "Chartrons - Église"),
+    ("5", "Pont de Pierre Rive Droite"),
+    ("6", "Dupont"),
+]
+
+
+@pytest.fixture
+def index():
+    return StationSearchIndex(STATIONS)
+
+
+@pytest.mark.parametrize("query", ["hôtel de ville", "HOTEL DE VILLE", "Hotel de Vi", "hotel-de-ville"])
+def test_matching_ignores_accents_and_case(index, query):
+    best = index.search(query)[0]
+    assert (best.station_id, best.prefix) == ("2", True)
+
+
+@pytest.mark.parametrize("query, station_id", [("eglise", "4"), ("ÉGLISE", "4"), ("st jean", "1"), ("pl bourse", "3")])
+def test_accents_and_abbreviations_fold_on_both_sides(index, query, station_id):
+    assert index.search(query)[0].station_id == station_id
+
+
+def test_prefix_matches_rank_above_substring_matches(index):
+    # "Dupont" shares more trigrams with "pont" than the long name does,
+    # but only the latter has a word starting with it
+    matches = index.search("pont", min_similarity=0.1)
+    assert [m.station_id for m in matches] == ["5", "6"]
+    assert [m.prefix for m in matches] == [True, False]
+    assert matches[1].score > matches[0].score
+
+
+def test_a_word_being_typed_also_matches_unexpanded():
+    # "st" folds to "saint", but while typed it may be the start of "stade"
+    index = StationSearchIndex(STATIONS + [("7", "Stade Chaban-Delmas")])
+    assert {m.station_id for m in index.search("st") if m.prefix} == {"1", "7"}
+    assert [m.station_id for m in index.search("gare st") if m.prefix] == ["1"]
+
+
+@pytest.mark.parametrize("query", ["", "   ", "-- !"])
+def test_empty_queries_match_nothing(index, query):
+    assert index.search(query) == []
+
+
+def test_empty_index_matches_nothing():
+    assert StationSearchIndex([]).search("gare") == []
+
+
+def test_cache_rebuilds_only_when_the_station_list_changes():
+    cache = StationSearchCache()
+    first = cache.index(STATIONS)
+    assert cache.index(list(reversed(STATIONS))) is first
+    renamed = cache.index(STATIONS[:-1] + [("6", "Rue Dupont")])
+    assert renamed is not first
+    assert renamed.search("rue dupont")[0].station_id == "6"
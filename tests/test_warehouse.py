@@ -0,0 +1,56 @@
+import sqlite3
+from datetime import timedelta
+
+from scripts.fetch_stations import store_snapshot
+from scripts.migrate_warehouse import migrate
+from tests.conftest import snapshot
+
+COLUMNS = "station_id, name, free_bikes, empty_slots, latitude, longitude, timestamp"
+
+
+def read_all(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT {COLUMNS} FROM station_activity").fetchall()
+    conn.close()
+    return rows
+
+
+def test_compatibility_view_returns_the_legacy_rows_in_time_order(db_path, days_ago):
+    conn = sqlite3.connect(db_path)
+    for step in range(30):
+        bikes = {"a": step % 7, "b": 20 - step % 5, "c": 3}
+        store_snapshot(conn, snapshot(bikes, days_ago(1) + timedelta(minutes=5 * step)))
+    conn.close()
+    legacy = read_all(db_path)
+
+    migrate(db_path)
+
+    conn = sqlite3.connect(db_path)
+    plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM station_activity"))
+    conn.close()
+    migrated = read_all(db_path)
+    assert sorted(migrated) == sorted(legacy)
+    assert [row[-1] for row in migrated] == sorted(row[-1] for row in legacy)
+    assert "COVERING INDEX idx_station_facts_ts_covering" in plan
+
+
+def test_migrating_again_refreshes_an_older_view(db_path, days_ago):
+    conn = sqlite3.connect(db_path)
+    store_snapshot(conn, snapshot({"a": 1}, days_ago(1)))
+    conn.close()
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        DROP INDEX idx_station_facts_ts_covering;
+        CREATE INDEX idx_station_facts_ts ON station_facts (ts);
+    """)
+    conn.close()
+
+    migrate(db_path)
+
+    conn = sqlite3.connect(db_path)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert "idx_station_facts_ts_covering" in indexes
+    assert "idx_station_facts_ts" not in indexes
+    assert read_all(db_path) == [("a", "Station a", 1, 19, 44.84, -0.58, days_ago(1).isoformat())]
@@ -0,0 +1,357 @@
+import json
+import os
+import sqlite3
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Same rule and defaults as streamlit_helpers.detect_static_bikes: a station
+# that moved at least ACTIVITY_THRESHOLD bikes over the activity window but
+# whose stock spans at most STATIC_THRESHOLD over the last WINDOW_MINUTES.
+ANOMALY_WINDOW_MINUTES = float(os.getenv("ANOMALY_WINDOW_MINUTES", 15))
+ANOMALY_ACTIVITY_HOURS = float(os.getenv("ANOMALY_ACTIVITY_HOURS", 24))
+ANOMALY_ACTIVITY_THRESHOLD = int(os.getenv("ANOMALY_ACTIVITY_THRESHOLD", 5))
+ANOMALY_STATIC_THRESHOLD = int(os.getenv("ANOMALY_STATIC_THRESHOLD", 1))
+# A detector whose last heartbeat is older than this no longer counts as running
+DETECTOR_STALE_MINUTES = float(os.getenv("DETECTOR_STALE_MINUTES", 15))
+
+STATIC_BIKES = "static_bikes"
+
+# Mirrors the Postgres `alerts` table (db/schema.sql), plus resolved_at
+ALERTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS station_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station_id TEXT NOT NULL,
+        issue_type TEXT NOT NULL,
+        reported_at TEXT NOT NULL,
+        data TEXT NOT NULL DEFAULT '{}',
+        resolved INTEGER NOT NULL DEFAULT 0,
+        resolved_at TEXT
+    );
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_station_alerts_open
+        ON station_alerts (station_id, issue_type) WHERE resolved = 0;
+
+    -- One row per detector, rewritten after every snapshot it processes
+    CREATE TABLE IF NOT EXISTS detector_state (
+        issue_type TEXT PRIMARY KEY,
+        heartbeat_at TEXT NOT NULL,
+        stations INTEGER NOT NULL,
+        open_alerts INTEGER NOT NULL
+    );
+"""
+
+
+def create_alert_tables(conn):
+    conn.executescript(ALERTS_SCHEMA)
+
+
+def _epoch(iso_timestamp):
+    return datetime.fromisoformat(iso_timestamp).timestamp()
+
+
+# -------------------------
+# Online detector
+# -------------------------
+class StationWindow:
+    """Running movement and min/max of one station over two sliding windows.
+
+    Movements are kept for the activity window with a running sum, stamped
+    with the sample they leave from: like detect_static_bikes, a move only
+    counts while both of its samples are in the window. Recent samples feed
+    monotonic deques so min and max are O(1) amortized.
+    """
+
+    __slots__ = ("name", "network", "last_ts", "last_bikes", "moves", "movement", "samples", "lows", "highs")
+
+    def __init__(self, name, network=None):
+        self.name = name
+        self.network = network
+        self.last_ts = None
+        self.last_bikes = None
+        self.moves = deque()
+        self.movement = 0
+        self.samples = deque()
+        self.lows = deque()
+        self.highs = deque()
+
+    def push(self, ts, bikes, activity_cutoff, recent_cutoff):
+        if self.last_bikes is not None:
+            move = abs(bikes - self.last_bikes)
+            if move:
+                self.moves.append((self.last_ts, move))
+                self.movement += move
+        self.last_ts = ts
+        self.last_bikes = bikes
+
+        self.samples.append(ts)
+        while self.lows and self.lows[-1][1] >= bikes:
+            self.lows.pop()
+        self.lows.append((ts, bikes))
+        while self.highs and self.highs[-1][1] <= bikes:
+            self.highs.pop()
+        self.highs.append((ts, bikes))
+
+        self.expire(activity_cutoff, recent_cutoff)
+
+    def expire(self, activity_cutoff, recent_cutoff):
+        while self.moves and self.moves[0][0] < activity_cutoff:
+            self.movement -= self.moves.popleft()[1]
+        while self.samples and self.samples[0] < recent_cutoff:
+            self.samples.popleft()
+        while self.lows and self.lows[0][0] < recent_cutoff:
+            self.lows.popleft()
+        while self.highs and self.highs[0][0] < recent_cutoff:
+            self.highs.popleft()
+
+    def state(self):
+        low, high = self.lows[0][1], self.highs[0][1]
+        return {
+            "name": self.name,
+            "total_movement": self.movement,
+            "recent_min": low,
+            "recent_max": high,
+            "recent_range": high - low,
+            "sample_count": len(self.samples),
+        }
+
+
+class StaticBikeDetector:
+    """Streaming version of detect_static_bikes, fed one snapshot at a time.
+
+    `update(batch)` costs O(stations in the batch) and returns the alert
+    transitions it caused: ("open", station_id, ts, data) when a station
+    starts matching the rule, ("resolve", station_id, ts, data) when it stops
+    or when it is missing from its network's latest snapshot.
+    """
+
+    def __init__(
+        self,
+        window_minutes=ANOMALY_WINDOW_MINUTES,
+        activity_hours=ANOMALY_ACTIVITY_HOURS,
+        activity_threshold=ANOMALY_ACTIVITY_THRESHOLD,
+        static_threshold=ANOMALY_STATIC_THRESHOLD,
+    ):
+        self.window_seconds = window_minutes * 60
+        self.activity_seconds = activity_hours * 3600
+        self.activity_threshold = activity_threshold
+        self.static_threshold = static_threshold
+        self.stations = {}
+        self.open = set()
+
+    def flagged(self, window):
+        return (
+            window.movement >= self.activity_threshold
+            and window.highs[0][1] - window.lows[0][1] <= self.static_threshold
+        )
+
+    def update(self, batch, network=None):
+        """`network` identifies the snapshot's source when several networks
+        share one detector, so only that network's stations can go missing."""
+        ts = _epoch(batch["timestamp"])
+        activity_cutoff = ts - self.activity_seconds
+        recent_cutoff = ts - self.window_seconds
+
+        transitions = []
+        for station_id, name, bikes in zip(batch["station_id"], batch["name"], batch["free_bikes"]):
+            window = self.stations.get(station_id)
+            if window is None:
+                window = self.stations[station_id] = StationWindow(name)
+            window.name = name
+            window.network = network
+            window.push(ts, bikes, activity_cutoff, recent_cutoff)
+
+            flagged = self.flagged(window)
+            if flagged and station_id not in self.open:
+                self.open.add(station_id)
+                transitions.append(("open", station_id, batch["timestamp"], window.state()))
+            elif not flagged and station_id in self.open:
+                self.open.discard(station_id)
+                transitions.append(("resolve", station_id, batch["timestamp"], window.state()))
+
+        # A station dropped from the feed cannot show its bikes moving again.
+        # Windows replayed by prime() have no network yet: those go once the
+        # station has not reported for the whole recent window.
+        missing = self.open.difference(batch["station_id"])
+        for station_id in sorted(missing):
+            window = self.stations.get(station_id)
+            if window is None:
+                # Adopted alert with no sample left in the activity window
+                self.open.discard(station_id)
+                transitions.append(("resolve", station_id, batch["timestamp"], {}))
+            elif window.network == network or (window.network is None and window.samples[-1] < recent_cutoff):
+                self.open.discard(station_id)
+                transitions.append(("resolve", station_id, batch["timestamp"], window.state()))
+        return transitions
+
+    def prime(self, conn):
+        """Replay the activity window from the database without emitting
+        transitions, and adopt the alerts that are already open."""
+        # utils.db imports this module for the schema
+        from utils.queries import window_query
+
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.activity_seconds)
+        sql, params = window_query(conn, since=since)
+        rows = conn.execute(
+            f"SELECT station_id, name, free_bikes, timestamp FROM ({sql}) ORDER BY timestamp", params
+        )
+        for station_id, name, bikes, timestamp in rows:
+            ts = _epoch(timestamp)
+            window = self.stations.get(station_id)
+            if window is None:
+                window = self.stations[station_id] = StationWindow(name)
+            window.push(ts, bikes, ts - self.activity_seconds, ts - self.window_seconds)
+
+        self.open = open_alert_stations(conn)
+        return len(self.stations)
+
+
+# -------------------------
+# Alert store
+# -------------------------
+def open_alert_stations(conn, issue_type=STATIC_BIKES):
+    rows = conn.execute(
+        "SELECT station_id FROM station_alerts WHERE resolved = 0 AND issue_type = ?",
+        (issue_type,),
+    )
+    return {row[0] for row in rows}
+
+
+def record_transitions(conn, transitions, heartbeat=None, issue_type=STATIC_BIKES):
+    """Apply detector transitions to station_alerts in one transaction.
+
+    `heartbeat` is (timestamp, tracked stations, open alerts); it marks the
+    detector as alive even when the snapshot changed no alert.
+    """
+    with conn:
+        if heartbeat is not None:
+            conn.execute(
+                """
+                INSERT INTO detector_state (issue_type, heartbeat_at, stations, open_alerts)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (issue_type) DO UPDATE SET
+                    heartbeat_at = excluded.heartbeat_at,
+                    stations = excluded.stations,
+                    open_alerts = excluded.open_alerts
+                """,
+                (issue_type, *heartbeat),
+            )
+        for kind, station_id, timestamp, data in transitions:
+            if kind == "open":
+                conn.execute(
+                    """
+                    INSERT INTO station_alerts (station_id, issue_type, reported_at, data)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                    """,
+                    (station_id, issue_type, timestamp, json.dumps(data)),
+                )
+            else:
+                conn.execute(
+                    """
+                    UPDATE station_alerts
+                    SET resolved = 1, resolved_at = ?
+                    WHERE station_id = ? AND issue_type = ? AND resolved = 0
+                    """,
+                    (timestamp, station_id, issue_type),
+                )
+    return len(transitions)
+
+
+def detector_alive(conn, issue_type=STATIC_BIKES, stale_minutes=DETECTOR_STALE_MINUTES, now=None):
+    """Whether a detector wrote a heartbeat within the last `stale_minutes`."""
+    try:
+        row = conn.execute(
+            "SELECT heartbeat_at FROM detector_state WHERE issue_type = ?", (issue_type,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return False
+    if row is None:
+        return False
+    now = now or datetime.now(timezone.utc)
+    return now - datetime.fromisoformat(row[0]) <= timedelta(minutes=stale_minutes)
+
+
+def open_alerts_query(issue_type=STATIC_BIKES):
+    sql = """
+        SELECT id, station_id, issue_type, reported_at, data
+        FROM station_alerts
+        WHERE resolved = 0 AND issue_type = ?
+        ORDER BY reported_at DESC
+    """
+    return sql, [issue_type]
+
+
+# -------------------------
+# Postgres mirror (optional)
+# -------------------------
+UPSERT_PG_STATION = """
+    INSERT INTO stations (id, name, location, capacity, available_bikes, updated_at)
+    VALUES (:id, :name, CAST(:location AS JSONB), :capacity, :available_bikes, :updated_at)
+    ON CONFLICT (id) DO UPDATE SET
+        name = EXCLUDED.name,
+        location = EXCLUDED.location,
+        capacity = EXCLUDED.capacity,
+        available_bikes = EXCLUDED.available_bikes,
+        updated_at = EXCLUDED.updated_at
+"""
+
+OPEN_PG_ALERT = """
+    INSERT INTO alerts (station_id, issue_type, reported_at, data)
+    SELECT :station_id, :issue_type, :reported_at, CAST(:data AS JSONB)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM alerts
+        WHERE station_id = :station_id AND issue_type = :issue_type AND resolved = FALSE
+    )
+"""
+
+RESOLVE_PG_ALERT = """
+    UPDATE alerts SET resolved = TRUE
+    WHERE station_id = :station_id AND issue_type = :issue_type AND resolved = FALSE
+"""
+
+
+class PostgresAlertSink:
+    """Publishes transitions to the Postgres `alerts` table served by
+    data_service's /alerts. Stations referenced by an alert are upserted
+    first to satisfy the foreign key."""
+
+    def __init__(self, database_url):
+        from sqlalchemy import create_engine, text
+
+        self.engine = create_engine(database_url, future=True, pool_pre_ping=True)
+        self.text = text
+
+    def publish(self, transitions, batch, issue_type=STATIC_BIKES):
+        if not transitions:
+            return 0
+        rows = {
+            station_id: (name, bikes, empty, lat, lon)
+            for station_id, name, bikes, empty, lat, lon in zip(
+                batch["station_id"], batch["name"], batch["free_bikes"],
+                batch["empty_slots"], batch["latitude"], batch["longitude"],
+            )
+        }
+        with self.engine.begin() as conn:
+            for kind, station_id, timestamp, data in transitions:
+                # Stations missing from the snapshot only resolve, so they already exist
+                if station_id in rows:
+                    name, bikes, empty, lat, lon = rows[station_id]
+                    conn.execute(self.text(UPSERT_PG_STATION), {
+                        "id": station_id,
+                        "name": name,
+                        "location": json.dumps({"latitude": lat, "longitude": lon}),
+                        "capacity": bikes + empty,
+                        "available_bikes": bikes,
+                        "updated_at": timestamp,
+                    })
+                params = {"station_id": station_id, "issue_type": issue_type}
+                if kind == "open":
+                    params.update(reported_at=timestamp, data=json.dumps(data))
+                    conn.execute(self.text(OPEN_PG_ALERT), params)
+                else:
+                    conn.execute(self.text(RESOLVE_PG_ALERT), params)
+        return len(transitions)
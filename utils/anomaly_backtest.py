@@ -0,0 +1,196 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.alerts import (
+    ANOMALY_ACTIVITY_HOURS,
+    ANOMALY_ACTIVITY_THRESHOLD,
+    ANOMALY_STATIC_THRESHOLD,
+    ANOMALY_WINDOW_MINUTES,
+)
+
+INTERVAL_COLUMNS = ["station_id", "name", "opened_at", "resolved_at", "samples", "peak_movement"]
+
+
+class BacktestData:
+    """History sorted once by (station_id, timestamp) as flat numpy arrays.
+
+    Every sample is an evaluation point for the static-bike rule, exactly
+    like the tracker's online detector sees it: detect_static_bikes run on
+    the last `activity_hours` of history at that sample's time. Time
+    windows become [left, i] row ranges found with one searchsorted over a
+    composite (station, time) key, so no cut-off is ever looped over.
+    """
+
+    def __init__(self, df):
+        frame = df[["station_id", "name", "free_bikes", "timestamp"]].copy()
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"], format="ISO8601", utc=True)
+        frame = frame.sort_values(["station_id", "timestamp"], kind="stable").reset_index(drop=True)
+
+        self.station_ids = frame["station_id"].to_numpy()
+        self.names = frame["name"].to_numpy()
+        self.timestamps = frame["timestamp"]
+        self.ts = ((self.timestamps - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(microseconds=1)).to_numpy() / 1e6
+        self.bikes = frame["free_bikes"].to_numpy(dtype=np.int64)
+
+        n = len(frame)
+        is_start = np.ones(n, dtype=bool)
+        is_start[1:] = self.station_ids[1:] != self.station_ids[:-1]
+        codes = np.cumsum(is_start) - 1
+        self.group_start = np.flatnonzero(is_start)[codes]
+        self.is_start = is_start
+
+        span = (self.ts.max() - self.ts.min() + 1) if n else 1
+        self.key = codes * span + (self.ts - (self.ts.min() if n else 0))
+
+        moves = np.abs(np.diff(self.bikes, prepend=0))
+        moves[is_start] = 0
+        self.cum_moves = np.r_[0, np.cumsum(moves)]
+
+    def __len__(self):
+        return len(self.bikes)
+
+    def window_start(self, seconds):
+        """First row of each row's station within the last `seconds`."""
+        left = np.searchsorted(self.key, self.key - seconds, side="left")
+        return np.maximum(left, self.group_start)
+
+    def movement(self, activity_seconds):
+        """Moves between samples that both fall in the window, as
+        detect_static_bikes sums them: the step into the first sample of
+        the window comes from before it and is not counted."""
+        left = self.window_start(activity_seconds)
+        return self.cum_moves[np.arange(len(self)) + 1] - self.cum_moves[left + 1]
+
+    def rolling_range(self, window_seconds):
+        """Rolling min and max of free_bikes over each row's recent window.
+
+        A sparse table: level k holds the min/max of every run of 2**k rows,
+        and a window is covered by two overlapping runs of its level, so the
+        cost is O(rows × log(samples per window)).
+        """
+        left = self.window_start(window_seconds)
+        rows = np.arange(len(self))
+        counts = rows - left + 1
+        levels = np.floor(np.log2(np.maximum(counts, 1))).astype(np.int64)
+        lows = np.empty_like(self.bikes)
+        highs = np.empty_like(self.bikes)
+        level_low, level_high = self.bikes, self.bikes
+        for level in range(int(levels.max(initial=0)) + 1):
+            at = np.flatnonzero(levels == level)
+            tail = rows[at] - (1 << level) + 1
+            lows[at] = np.minimum(level_low[left[at]], level_low[tail])
+            highs[at] = np.maximum(level_high[left[at]], level_high[tail])
+            # Runs crossing a station boundary are never read: windows stay in their station
+            step = 1 << level
+            level_low, level_high = level_low.copy(), level_high.copy()
+            level_low[:-step] = np.minimum(level_low[:-step], level_low[step:])
+            level_high[:-step] = np.maximum(level_high[:-step], level_high[step:])
+        return lows, highs, counts
+
+
+def evaluate(data, window_minutes=ANOMALY_WINDOW_MINUTES,
+             activity_threshold=ANOMALY_ACTIVITY_THRESHOLD,
+             static_threshold=ANOMALY_STATIC_THRESHOLD,
+             activity_hours=ANOMALY_ACTIVITY_HOURS):
+    """Flag of every (station, sample) under one parameter set."""
+    movement = data.movement(activity_hours * 3600)
+    lows, highs, _ = data.rolling_range(window_minutes * 60)
+    flagged = (movement >= activity_threshold) & (highs - lows <= static_threshold)
+    return flagged, movement
+
+
+def flagged_intervals(data, flagged, movement):
+    """Collapse per-sample flags into open/resolve intervals per station.
+
+    An interval opens at its first flagged sample and resolves at the next
+    unflagged sample of the same station (NaT while still open).
+    """
+    if not len(data):
+        return pd.DataFrame(columns=INTERVAL_COLUMNS)
+
+    previous = np.r_[False, flagged[:-1]] & ~data.is_start
+    opens = np.flatnonzero(flagged & ~previous)
+    next_row = np.r_[data.is_start[1:], True]
+    closes = np.flatnonzero(flagged & (next_row | ~np.r_[flagged[1:], False]))
+
+    last_of_station = next_row[closes]
+    resolved_at = data.timestamps.iloc[np.minimum(closes + 1, len(data) - 1)].reset_index(drop=True)
+    resolved_at[last_of_station] = pd.NaT
+
+    # Runs are contiguous among the flagged rows, so one reduceat gives peaks
+    flagged_rows = np.flatnonzero(flagged)
+    peaks = np.maximum.reduceat(movement[flagged_rows], np.searchsorted(flagged_rows, opens)) \
+        if len(opens) else movement[:0]
+
+    return pd.DataFrame({
+        "station_id": data.station_ids[opens],
+        "name": data.names[opens],
+        "opened_at": data.timestamps.iloc[opens].reset_index(drop=True),
+        "resolved_at": resolved_at,
+        "samples": closes - opens + 1,
+        "peak_movement": peaks,
+    })
+
+
+def backtest(df, **params):
+    data = df if isinstance(df, BacktestData) else BacktestData(df)
+    flagged, movement = evaluate(data, **params)
+    return flagged_intervals(data, flagged, movement)
+
+
+# -------------------------
+# Parameter sweep
+# -------------------------
+_SWEEP_DATA = None
+
+
+def _init_worker(data):
+    global _SWEEP_DATA
+    _SWEEP_DATA = data
+
+
+def _score(params):
+    data = _SWEEP_DATA
+    flagged, movement = evaluate(data, **params)
+    intervals = flagged_intervals(data, flagged, movement)
+    durations = (intervals["resolved_at"] - intervals["opened_at"]).dt.total_seconds() / 60
+    return {
+        **params,
+        "flagged_samples": int(flagged.sum()),
+        "flagged_share": float(flagged.mean()) if len(flagged) else 0.0,
+        "intervals": len(intervals),
+        "stations": intervals["station_id"].nunique(),
+        "still_open": int(intervals["resolved_at"].isna().sum()),
+        "median_minutes": float(durations.median()) if durations.notna().any() else float("nan"),
+    }
+
+
+def sweep(df, window_minutes=(ANOMALY_WINDOW_MINUTES,),
+          activity_threshold=(ANOMALY_ACTIVITY_THRESHOLD,),
+          static_threshold=(ANOMALY_STATIC_THRESHOLD,),
+          activity_hours=(ANOMALY_ACTIVITY_HOURS,),
+          processes=None):
+    """Score every parameter combination; combinations run across processes.
+
+    The sorted arrays are built once and shipped to each worker at start-up,
+    not once per combination.
+    """
+    data = df if isinstance(df, BacktestData) else BacktestData(df)
+    grid = [
+        dict(window_minutes=w, activity_threshold=a, static_threshold=s, activity_hours=h)
+        for w, a, s, h in itertools.product(window_minutes, activity_threshold, static_threshold, activity_hours)
+    ]
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(grid) == 1:
+        _init_worker(data)
+        results = [_score(params) for params in grid]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(grid)),
+                                 initializer=_init_worker, initargs=(data,)) as pool:
+            results = list(pool.map(_score, grid))
+    return pd.DataFrame(results)
@@ -0,0 +1,111 @@
+import pandas as pd
+
+# One row per station and compacted bucket. Sums are kept next to
+# min / max / last so rollups of a grain that is a multiple of the bucket
+# width can be rebuilt exactly once the raw rows are gone; movement
+# includes the step from the previous bucket's last sample.
+COMPACT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS station_history_compact (
+        station_id TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        grain INTEGER NOT NULL,
+        name TEXT,
+        latitude REAL,
+        longitude REAL,
+        samples INTEGER NOT NULL,
+        min_bikes INTEGER NOT NULL,
+        max_bikes INTEGER NOT NULL,
+        last_bikes INTEGER NOT NULL,
+        last_empty INTEGER NOT NULL,
+        movement INTEGER NOT NULL,
+        sum_bikes INTEGER,
+        sum_empty INTEGER,
+        PRIMARY KEY (station_id, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_station_history_compact_bucket
+        ON station_history_compact (bucket);
+"""
+
+INSERT_COMPACT = """
+    INSERT INTO station_history_compact
+        (station_id, bucket, grain, name, latitude, longitude,
+         samples, min_bikes, max_bikes, last_bikes, last_empty, movement,
+         sum_bikes, sum_empty)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (station_id, bucket) DO UPDATE SET
+        samples = samples + excluded.samples,
+        min_bikes = MIN(min_bikes, excluded.min_bikes),
+        max_bikes = MAX(max_bikes, excluded.max_bikes),
+        last_bikes = excluded.last_bikes,
+        last_empty = excluded.last_empty,
+        movement = movement + excluded.movement,
+        sum_bikes = sum_bikes + excluded.sum_bikes,
+        sum_empty = sum_empty + excluded.sum_empty
+"""
+
+
+def has_compact_table(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'station_history_compact'"
+    ).fetchone()
+    return row is not None
+
+
+def create_compact_tables(conn):
+    conn.executescript(COMPACT_SCHEMA)
+    # Tables compacted before sums were kept: those buckets fall back to
+    # (min + max) / 2 per sample when rollups are rebuilt
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(station_history_compact)")}
+    for column in ("sum_bikes", "sum_empty"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE station_history_compact ADD COLUMN {column} INTEGER")
+
+
+# -------------------------
+# Readers
+# -------------------------
+def compacted_range(conn):
+    """(first bucket, end of last bucket) in epoch seconds, or None."""
+    if not has_compact_table(conn):
+        return None
+    row = conn.execute("SELECT MIN(bucket), MAX(bucket + grain) FROM station_history_compact").fetchone()
+    return None if row[0] is None else row
+
+
+def compact_history_query(since=None, until=None, station_ids=None):
+    """Compacted buckets shaped like station_activity rows.
+
+    Each bucket reads as one sample at its start, holding the bucket's last
+    free_bikes / empty_slots value.
+    """
+    sql = """
+        SELECT station_id, name, last_bikes AS free_bikes, last_empty AS empty_slots,
+               latitude, longitude, bucket
+        FROM station_history_compact
+        WHERE 1 = 1
+    """
+    params = []
+    if since is not None:
+        sql += " AND bucket >= ?"
+        params.append(int(since.timestamp()))
+    if until is not None:
+        sql += " AND bucket < ?"
+        params.append(int(until.timestamp()))
+    if station_ids is not None:
+        station_ids = list(station_ids)
+        placeholders = ", ".join("?" for _ in station_ids) or "NULL"
+        sql += f" AND station_id IN ({placeholders})"
+        params.extend(station_ids)
+    return sql + " ORDER BY bucket, station_id", params
+
+
+def load_compact_history(conn, since=None, until=None, station_ids=None):
+    if not has_compact_table(conn):
+        return pd.DataFrame(
+            columns=["station_id", "name", "free_bikes", "empty_slots", "latitude", "longitude", "timestamp"]
+        )
+    sql, params = compact_history_query(since, until, station_ids)
+    frame = pd.read_sql(sql, conn, params=params)
+    frame["timestamp"] = pd.to_datetime(frame.pop("bucket"), unit="s", utc=True)
+    return frame
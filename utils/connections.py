@@ -0,0 +1,137 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.db import DB_PATH
+
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every connection. WAL lets readers keep working while the
+# tracker commits; synchronous=NORMAL is durable enough in WAL mode.
+CONNECTION_PRAGMAS = (
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64_000),        # ~64 MB page cache
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+
+def configure(conn):
+    for name, value in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def enable_wal(db_path=DB_PATH):
+    """Switch the database file to WAL (persistent, so done once by a writer)."""
+    conn = sqlite3.connect(db_path)
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    conn.close()
+    return mode
+
+
+def is_busy(exc):
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+class ConnectionManager:
+    """A pool of read-only connections and one serialized writer connection."""
+
+    def __init__(self, db_path=DB_PATH, readers=4, write_retries=5, retry_delay=0.05):
+        self.db_path = db_path
+        self.max_readers = readers
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay
+        self._readers = queue.LifoQueue()
+        self._opened = 0
+        self._open_lock = threading.Lock()
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+    def _open_reader(self):
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+        return configure(conn)
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._open_lock:
+            if self._opened < self.max_readers:
+                self._opened += 1
+                try:
+                    return self._open_reader()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        return self._readers.get()
+
+    @contextmanager
+    def reader(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def _writer_connection(self):
+        if self._writer is None:
+            enable_wal(self.db_path)
+            self._writer = configure(sqlite3.connect(self.db_path, check_same_thread=False))
+        return self._writer
+
+    def write(self, fn, *args, **kwargs):
+        """Run `fn(conn, *args)` on the writer connection, retrying while busy.
+
+        `fn` owns its transaction (e.g. `with conn:`); a failed attempt is
+        rolled back before the next one.
+        """
+        with self._write_lock:
+            conn = self._writer_connection()
+            for attempt in range(self.write_retries + 1):
+                try:
+                    return fn(conn, *args, **kwargs)
+                except sqlite3.OperationalError as exc:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    if not is_busy(exc) or attempt == self.write_retries:
+                        raise
+                    delay = self.retry_delay * 2 ** attempt
+                    time.sleep(delay + random.uniform(0, delay))
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._open_lock:
+            self._opened = 0
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path=DB_PATH):
+    """Process-wide manager for `db_path`."""
+    with _managers_lock:
+        if db_path not in _managers:
+            _managers[db_path] = ConnectionManager(db_path)
+        return _managers[db_path]
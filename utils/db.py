@@ -1,13 +1,18 @@
 import sqlite3
 import os
 
+from utils.alerts import create_alert_tables
+from utils.forecasting import create_forecast_tables
+from utils.rollups import create_rollup_tables, rebuild_rollups, rollups_missing
+
 # Absolute path to /data/bike_data.db
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "bike_data.db")
 
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    # Wait on a concurrent writer instead of failing with "database is locked"
+    return sqlite3.connect(DB_PATH, timeout=5)
 
 def create_table():
     # Ensure directory exists
@@ -27,6 +32,136 @@ def create_table():
             timestamp TEXT
         )
     """)
+    create_indexes(conn)
+    create_rollup_tables(conn)
+    create_alert_tables(conn)
+    create_forecast_tables(conn)
     conn.commit()
+    if rollups_missing(conn):
+        # Upgraded database: incremental updates would only cover new snapshots
+        rebuild_rollups(conn)
+        print("Rollups backfilled from the existing history")
+    # WAL is persistent: readers no longer block on (or block) the tracker
+    conn.execute("PRAGMA journal_mode = WAL")
     conn.close()
     print("Table created successfully at:", DB_PATH)
+
+
+# Time-window and per-station lookups used by the dashboard query layer
+ACTIVITY_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_station_activity_timestamp
+        ON station_activity (timestamp);
+
+    CREATE INDEX IF NOT EXISTS idx_station_activity_station_ts
+        ON station_activity (station_id, timestamp);
+"""
+
+# The (station_key, ts) primary key already serves per-station lookups.
+# The time index covers the fact columns, so time-ordered scans of the
+# compatibility view never go back to the table (the older, narrower
+# idx_station_facts_ts is replaced).
+WAREHOUSE_INDEXES = """
+    DROP INDEX IF EXISTS idx_station_facts_ts;
+
+    CREATE INDEX IF NOT EXISTS idx_station_facts_ts_covering
+        ON station_facts (ts, free_bikes, empty_slots);
+"""
+
+
+def create_indexes(conn):
+    conn.executescript(WAREHOUSE_INDEXES if is_warehouse(conn) else ACTIVITY_INDEXES)
+
+
+# -------------------------
+# Normalized warehouse schema
+# -------------------------
+# `stations` is a type-2 slowly changing dimension: a new surrogate key is
+# issued whenever a station's name or coordinates change, and the previous
+# version is closed by setting `valid_to`. `station_facts` only stores the
+# integers that change between snapshots.
+WAREHOUSE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS stations (
+        station_key INTEGER PRIMARY KEY,
+        station_id TEXT NOT NULL,
+        name TEXT,
+        latitude REAL,
+        longitude REAL,
+        valid_from INTEGER NOT NULL,
+        valid_to INTEGER
+    );
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_stations_current
+        ON stations (station_id) WHERE valid_to IS NULL;
+
+    CREATE INDEX IF NOT EXISTS idx_stations_station_id
+        ON stations (station_id, valid_from);
+
+    CREATE TABLE IF NOT EXISTS station_facts (
+        station_key INTEGER NOT NULL REFERENCES stations (station_key),
+        ts INTEGER NOT NULL,
+        free_bikes INTEGER NOT NULL,
+        empty_slots INTEGER NOT NULL,
+        PRIMARY KEY (station_key, ts)
+    ) WITHOUT ROWID;
+"""
+
+# Same columns as the legacy table (minus the rowid) so `SELECT * FROM
+# station_activity` keeps working, plus the raw epoch `ts` for range filters.
+# datetime() + replace() builds the same ISO string as strftime() in about
+# two thirds of the time.
+COMPAT_VIEW = """
+    CREATE VIEW IF NOT EXISTS station_activity AS
+    SELECT s.station_id,
+           s.name,
+           f.free_bikes,
+           f.empty_slots,
+           s.latitude,
+           s.longitude,
+           replace(datetime(f.ts, 'unixepoch'), ' ', 'T') || '+00:00' AS timestamp,
+           f.ts
+    FROM station_facts f
+    JOIN stations s ON s.station_key = f.station_key;
+
+    CREATE TRIGGER IF NOT EXISTS station_activity_insert
+    INSTEAD OF INSERT ON station_activity
+    BEGIN
+        UPDATE stations
+           SET valid_to = CAST(strftime('%s', NEW.timestamp) AS INTEGER)
+         WHERE station_id = NEW.station_id
+           AND valid_to IS NULL
+           AND (name IS NOT NEW.name
+                OR latitude IS NOT NEW.latitude
+                OR longitude IS NOT NEW.longitude);
+
+        INSERT INTO stations (station_id, name, latitude, longitude, valid_from)
+        SELECT NEW.station_id, NEW.name, NEW.latitude, NEW.longitude,
+               CAST(strftime('%s', NEW.timestamp) AS INTEGER)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM stations
+            WHERE station_id = NEW.station_id AND valid_to IS NULL
+        );
+
+        INSERT OR REPLACE INTO station_facts (station_key, ts, free_bikes, empty_slots)
+        VALUES (
+            (SELECT station_key FROM stations
+             WHERE station_id = NEW.station_id AND valid_to IS NULL),
+            CAST(strftime('%s', NEW.timestamp) AS INTEGER),
+            NEW.free_bikes,
+            NEW.empty_slots
+        );
+    END;
+"""
+
+
+def is_warehouse(conn):
+    """True once `station_activity` has been migrated to the compatibility view."""
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'station_activity'"
+    ).fetchone()
+    return row is not None and row[0] == "view"
+
+
+def create_warehouse(conn):
+    conn.executescript(WAREHOUSE_SCHEMA)
+    conn.executescript(COMPAT_VIEW)
+    create_indexes(conn)
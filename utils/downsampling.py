@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Widest chart the dashboard draws, in CSS pixels
+CHART_WIDTH_PX = int(os.getenv("CHART_WIDTH_PX", 1200))
+# Traces at or under this many points keep their markers
+MARKER_MAX_POINTS = int(os.getenv("MARKER_MAX_POINTS", 200))
+
+
+def point_budget(width_px=CHART_WIDTH_PX, points_per_px=1.0):
+    """Points worth sending for a chart `width_px` wide: more cannot be drawn."""
+    return max(4, int(width_px * points_per_px))
+
+
+def minmax_indices(values, max_points):
+    """Row indices of a min/max envelope of at most ~`max_points` points.
+
+    The series is cut into equal buckets of consecutive rows and each bucket
+    keeps its lowest and highest value, so every peak and trough survives
+    (unlike striding or averaging). Bucketing is one reshape of a padded
+    array; NaNs are never picked over a real value. First and last rows are
+    always kept, and indices come back sorted.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max(max_points, 4):
+        return np.arange(n)
+
+    size = -(-n // max(1, (max_points - 2) // 2))
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    keep = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return keep[keep < n]
+
+
+def downsample(frame, x, y, max_points, by=None):
+    """Rows of `frame` kept by a min/max envelope of `y` along `x`, per trace.
+
+    `by` names the column that splits traces (one envelope each, each with
+    the full budget, like one Plotly trace each).
+    """
+    if frame.empty:
+        return frame
+    ordered = frame.sort_values([by, x] if by else x, kind="stable")
+    if by is None:
+        return ordered.iloc[minmax_indices(ordered[y].to_numpy(), max_points)]
+
+    keys = ordered[by].to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    values = ordered[y].to_numpy()
+    rows = np.concatenate([
+        start + minmax_indices(values[start:end], max_points) for start, end in zip(starts, ends)
+    ])
+    return ordered.iloc[rows]
+
+
+def downsample_columns(frame, columns, max_points):
+    """Rows of a wide, x-sorted frame kept by the envelopes of several columns.
+
+    Each column gets an equal share of the budget and the union of their
+    rows is kept, so the traces of one chart stay aligned on x.
+    """
+    share = max(4, max_points // len(columns))
+    rows = np.unique(np.concatenate([
+        minmax_indices(frame[column].to_numpy(), share) for column in columns
+    ]))
+    return frame.iloc[rows]
+
+
+def figure_payload_bytes(fig):
+    """Size of the JSON the browser receives for `fig`."""
+    return len(fig.to_json())
+
+
+def trace_mode(points):
+    return "lines+markers" if points <= MARKER_MAX_POINTS else "lines"
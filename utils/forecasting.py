@@ -0,0 +1,286 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FORECAST_HORIZONS = tuple(
+    int(h) for h in os.getenv("FORECAST_HORIZONS", "15,30,60").split(",") if h.strip()
+)
+FORECAST_HISTORY_DAYS = float(os.getenv("FORECAST_HISTORY_DAYS", 28))
+# How fast today's deviation from the usual profile fades with the horizon
+FORECAST_DAMPING_MINUTES = float(os.getenv("FORECAST_DAMPING_MINUTES", 90))
+# Recent samples per station used for the trend
+FORECAST_TREND_SAMPLES = int(os.getenv("FORECAST_TREND_SAMPLES", 6))
+
+# Seasonal profile: 15-minute slots of the (UTC) week, backed off to the
+# slot of the day and then to the station mean while history is short.
+SLOT_SECONDS = 900
+SLOTS_PER_DAY = 86400 // SLOT_SECONDS
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+# 1970-01-01 was a Thursday; shift so week slot 0 is Monday 00:00
+EPOCH_WEEKDAY = 3
+
+FORECAST_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS station_forecasts (
+        station_id TEXT NOT NULL,
+        horizon_minutes INTEGER NOT NULL,
+        issued_at TEXT NOT NULL,
+        predicted_bikes REAL NOT NULL,
+        capacity INTEGER NOT NULL,
+        PRIMARY KEY (station_id, horizon_minutes)
+    ) WITHOUT ROWID;
+"""
+
+FORECAST_COLUMNS = ["station_id", "horizon_minutes", "issued_at", "predicted_bikes", "capacity"]
+
+
+def create_forecast_tables(conn):
+    conn.executescript(FORECAST_SCHEMA)
+
+
+def week_slot(epoch):
+    return ((np.asarray(epoch, dtype=np.int64) // SLOT_SECONDS) + EPOCH_WEEKDAY * SLOTS_PER_DAY) % SLOTS_PER_WEEK
+
+
+def _epoch_seconds(timestamps):
+    stamps = pd.to_datetime(timestamps, format="ISO8601", utc=True)
+    return ((stamps - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy()
+
+
+def _profile_sums(codes, slots, bikes, n_stations):
+    """(sum, count) of free bikes per station and week slot."""
+    flat = codes * SLOTS_PER_WEEK + slots
+    size = n_stations * SLOTS_PER_WEEK
+    sums = np.bincount(flat, weights=bikes, minlength=size).reshape(n_stations, SLOTS_PER_WEEK)
+    counts = np.bincount(flat, minlength=size).reshape(n_stations, SLOTS_PER_WEEK)
+    return sums, counts
+
+
+class StationForecaster:
+    """Seasonal profile + damped recent trend, for every station at once.
+
+    State is a handful of dense stations × slots arrays: profile sums and
+    counts per week slot, and a small ring buffer of the latest samples.
+    `update(batch)` folds one snapshot in with O(stations) work, and
+    `predict()` evaluates every station and horizon as array operations.
+    """
+
+    def __init__(self, horizons=FORECAST_HORIZONS, damping_minutes=FORECAST_DAMPING_MINUTES,
+                 trend_samples=FORECAST_TREND_SAMPLES):
+        self.horizons = tuple(horizons)
+        self.damping_minutes = damping_minutes
+        self.trend_samples = trend_samples
+        self.reset()
+
+    def reset(self):
+        trend_samples = self.trend_samples
+        self.station_ids = []
+        self.index = {}
+        self.names = np.empty(0, dtype=object)
+        self.sums = np.zeros((0, SLOTS_PER_WEEK))
+        self.counts = np.zeros((0, SLOTS_PER_WEEK), dtype=np.int64)
+        self.capacity = np.zeros(0, dtype=np.int64)
+        self.recent_ts = np.full((0, trend_samples), np.nan)
+        self.recent_bikes = np.full((0, trend_samples), np.nan)
+        self.cursor = np.zeros(0, dtype=np.int64)
+        self.last_ts = None
+        self._profile = None
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def _rows_for(self, station_ids, names):
+        new = [(sid, name) for sid, name in zip(station_ids, names) if sid not in self.index]
+        if new:
+            added = len(dict(new))
+            for sid, _ in new:
+                if sid not in self.index:
+                    self.index[sid] = len(self.station_ids)
+                    self.station_ids.append(sid)
+            self.names = np.r_[self.names, np.empty(added, dtype=object)]
+            self.sums = np.vstack([self.sums, np.zeros((added, SLOTS_PER_WEEK))])
+            self.counts = np.vstack([self.counts, np.zeros((added, SLOTS_PER_WEEK), dtype=np.int64)])
+            self.capacity = np.r_[self.capacity, np.zeros(added, dtype=np.int64)]
+            self.recent_ts = np.vstack([self.recent_ts, np.full((added, self.trend_samples), np.nan)])
+            self.recent_bikes = np.vstack([self.recent_bikes, np.full((added, self.trend_samples), np.nan)])
+            self.cursor = np.r_[self.cursor, np.zeros(added, dtype=np.int64)]
+        rows = np.fromiter((self.index[sid] for sid in station_ids), dtype=np.int64, count=len(station_ids))
+        self.names[rows] = list(names)
+        return rows
+
+    # ---- fitting -----------------------------------------------------------
+    def fit(self, df, processes=1):
+        """Rebuild the state from a long-format history frame."""
+        self.reset()
+        if df.empty:
+            return self
+
+        frame = df.assign(epoch=_epoch_seconds(df["timestamp"]))
+        frame = frame.sort_values(["station_id", "epoch"], kind="stable").reset_index(drop=True)
+        last = frame.groupby("station_id", sort=False).tail(1)
+        rows = self._rows_for(last["station_id"].tolist(), last["name"].tolist())
+        self.capacity[rows] = (last["free_bikes"] + last["empty_slots"]).to_numpy()
+
+        codes = frame["station_id"].map(self.index).to_numpy()
+        slots = week_slot(frame["epoch"].to_numpy())
+        bikes = frame["free_bikes"].to_numpy(dtype=float)
+
+        if processes > 1 and len(self) > processes:
+            # Independent per station: split the station axis across workers
+            bounds = np.linspace(0, len(self), processes + 1).astype(int)
+            chunks = []
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                keep = (codes >= lo) & (codes < hi)
+                chunks.append((codes[keep] - lo, slots[keep], bikes[keep], hi - lo))
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                parts = list(pool.map(_profile_sums, *zip(*chunks)))
+            self.sums = np.vstack([p[0] for p in parts])
+            self.counts = np.vstack([p[1] for p in parts])
+        else:
+            self.sums, self.counts = _profile_sums(codes, slots, bikes, len(self))
+
+        # Ring buffer: the last `trend_samples` samples of each station, oldest first
+        from_end = frame.groupby("station_id", sort=False).cumcount(ascending=False).to_numpy()
+        keep = from_end < self.trend_samples
+        position = self.trend_samples - 1 - from_end[keep]
+        self.recent_ts[codes[keep], position] = frame["epoch"].to_numpy()[keep]
+        self.recent_bikes[codes[keep], position] = bikes[keep]
+        self.cursor[:] = 0
+
+        self.last_ts = int(frame["epoch"].max())
+        self._profile = None
+        return self
+
+    def update(self, batch):
+        """Fold one normalized snapshot (see fetch_stations.normalize_snapshot)."""
+        ts = int(datetime.fromisoformat(batch["timestamp"]).timestamp())
+        rows = self._rows_for(batch["station_id"], batch["name"])
+        bikes = np.asarray(batch["free_bikes"], dtype=float)
+
+        slot = week_slot(ts)
+        np.add.at(self.sums[:, slot], rows, bikes)
+        np.add.at(self.counts[:, slot], rows, 1)
+        self.capacity[rows] = bikes.astype(np.int64) + np.asarray(batch["empty_slots"], dtype=np.int64)
+
+        position = self.cursor[rows]
+        self.recent_ts[rows, position] = ts
+        self.recent_bikes[rows, position] = bikes
+        self.cursor[rows] = (position + 1) % self.trend_samples
+
+        self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+        self._profile = None
+        return len(rows)
+
+    # ---- inference ---------------------------------------------------------
+    def profile(self):
+        """Expected free bikes per station and week slot, with back-off."""
+        if self._profile is None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                week = self.sums / self.counts
+                day_sums = self.sums.reshape(len(self), 7, SLOTS_PER_DAY).sum(axis=1)
+                day_counts = self.counts.reshape(len(self), 7, SLOTS_PER_DAY).sum(axis=1)
+                day = np.tile(day_sums / day_counts, 7)
+                overall = self.sums.sum(axis=1) / self.counts.sum(axis=1)
+            profile = np.where(self.counts > 0, week, day)
+            self._profile = np.where(np.isnan(profile), overall[:, None], profile)
+        return self._profile
+
+    def predict(self, now=None):
+        """Forecast every station at every horizon; long format."""
+        if not len(self) or self.last_ts is None:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+
+        now = self.last_ts if now is None else int(now)
+        profile = self.profile()
+        rows = np.arange(len(self))[:, None]
+
+        valid = ~np.isnan(self.recent_ts)
+        recent_slots = week_slot(np.where(valid, self.recent_ts, 0))
+        residual = np.where(valid, self.recent_bikes - profile[rows, recent_slots], np.nan)
+
+        # Least-squares slope of the residual (bikes per minute) per station
+        minutes = (self.recent_ts - now) / 60
+        n = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = np.nansum(minutes, axis=1, keepdims=True) / n[:, None]
+            r_mean = np.nansum(residual, axis=1, keepdims=True) / n[:, None]
+            dx = np.where(valid, minutes - x_mean, 0)
+            dr = np.where(valid, residual - r_mean, 0)
+            slope = (dx * dr).sum(axis=1) / (dx ** 2).sum(axis=1)
+        slope = np.where((n >= 2) & np.isfinite(slope), slope, 0.0)
+
+        newest = np.nanargmax(np.where(valid, self.recent_ts, -np.inf), axis=1)
+        level = residual[np.arange(len(self)), newest]
+        age = (now - self.recent_ts[np.arange(len(self)), newest]) / 60
+        level = np.nan_to_num(level)
+
+        horizons = np.asarray(self.horizons, dtype=float)
+        ahead = age[:, None] + horizons[None, :]
+        target_slots = week_slot(now + horizons * 60)
+        anomaly = (level[:, None] + slope[:, None] * ahead) * np.exp(-ahead / self.damping_minutes)
+        predicted = np.clip(profile[:, target_slots] + anomaly, 0, self.capacity[:, None])
+
+        issued_at = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        return pd.DataFrame({
+            "station_id": np.repeat(np.asarray(self.station_ids, dtype=object), len(horizons)),
+            "horizon_minutes": np.tile(np.asarray(self.horizons), len(self)),
+            "issued_at": issued_at,
+            "predicted_bikes": predicted.ravel().round(2),
+            "capacity": np.repeat(self.capacity, len(horizons)),
+        })
+
+
+def forecast_table(forecasts, snapshot):
+    """Wide view for display: one row per station, one column per horizon."""
+    if forecasts.empty:
+        return forecasts
+    wide = forecasts.pivot(index="station_id", columns="horizon_minutes", values="predicted_bikes")
+    wide.columns = [f"+{h} min" for h in wide.columns]
+    current = snapshot[["station_id", "name", "free_bikes", "empty_slots"]].set_index("station_id")
+    return current.join(wide, how="inner").reset_index()
+
+
+# -------------------------
+# Storage
+# -------------------------
+def store_forecasts(conn, forecasts):
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO station_forecasts ({', '.join(FORECAST_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+            forecasts[FORECAST_COLUMNS].itertuples(index=False, name=None),
+        )
+    return len(forecasts)
+
+
+UPSERT_PG_FORECAST = """
+    INSERT INTO station_forecasts (station_id, horizon_minutes, issued_at, predicted_bikes, capacity)
+    VALUES (:station_id, :horizon_minutes, :issued_at, :predicted_bikes, :capacity)
+    ON CONFLICT (station_id, horizon_minutes) DO UPDATE SET
+        issued_at = EXCLUDED.issued_at,
+        predicted_bikes = EXCLUDED.predicted_bikes,
+        capacity = EXCLUDED.capacity
+"""
+
+
+class PostgresForecastSink:
+    """Publishes the latest forecasts to Postgres for data_service."""
+
+    def __init__(self, database_url):
+        from sqlalchemy import create_engine, text
+
+        self.engine = create_engine(database_url, future=True, pool_pre_ping=True)
+        self.statement = text(UPSERT_PG_FORECAST)
+
+    def publish(self, forecasts):
+        if forecasts.empty:
+            return 0
+        records = json.loads(forecasts[FORECAST_COLUMNS].to_json(orient="records"))
+        with self.engine.begin() as conn:
+            conn.execute(self.statement, records)
+        return len(records)
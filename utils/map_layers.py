@@ -0,0 +1,198 @@
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Above this many stations the map opens on hexagons instead of points
+MAP_HEX_ABOVE = int(os.getenv("MAP_HEX_ABOVE", 1500))
+MAP_HEX_RADIUS_M = float(os.getenv("MAP_HEX_RADIUS_M", 400))
+# 5 decimals is ~1 m: anything finer only inflates the JSON sent to deck.gl
+COORD_DECIMALS = 5
+
+METERS_PER_DEGREE = 111_320.0
+
+# Availability colour for every whole percent, red (empty) to green (full)
+_PCT = np.linspace(0.0, 1.0, 101)
+UTILIZATION_COLORS = np.column_stack([
+    220 - 150 * _PCT, 60 + 150 * _PCT, 50 + 80 * _PCT, np.full(101, 230),
+]).astype(np.uint8)
+
+CLUSTER_PALETTE = np.array([
+    [31, 119, 180, 230], [255, 127, 14, 230], [44, 160, 44, 230], [148, 103, 189, 230],
+    [214, 39, 40, 230], [140, 86, 75, 230], [227, 119, 194, 230], [23, 190, 207, 230],
+], dtype=np.uint8)
+UNCLUSTERED_COLOR = np.array([160, 160, 160, 200], dtype=np.uint8)
+
+
+# -------------------------
+# Lookups
+# -------------------------
+def utilization_colors(utilization):
+    """RGBA rows for fill ratios in [0, 1] (clipped, NaN as empty)."""
+    pct = np.clip(np.nan_to_num(np.asarray(utilization, dtype=float)), 0.0, 1.0)
+    return UTILIZATION_COLORS[np.rint(pct * 100).astype(np.int64)]
+
+
+def cluster_colors(clusters):
+    """RGBA rows for cluster ids, grey where a station has none (NaN)."""
+    clusters = np.asarray(clusters, dtype=float)
+    missing = np.isnan(clusters)
+    colors = CLUSTER_PALETTE[np.where(missing, 0, clusters).astype(np.int64) % len(CLUSTER_PALETTE)]
+    colors[missing] = UNCLUSTERED_COLOR
+    return colors
+
+
+def station_radius(capacity):
+    return np.clip(np.asarray(capacity, dtype=float), 1, 20)
+
+
+def hexagon_cells(lat, lon, radius_m=MAP_HEX_RADIUS_M):
+    """Flat-top hexagon of side `radius_m` holding each point, and cell centres.
+
+    Points are projected on a local equirectangular plane (fine at city or
+    region scale), converted to axial hex coordinates and cube-rounded.
+    Returns (cell index per point, centre latitudes, centre longitudes).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    lat0 = float(np.nanmean(lat)) if len(lat) else 0.0
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(lat0))
+    x = lon * scale_x / radius_m
+    y = lat * METERS_PER_DEGREE / radius_m
+
+    q = 2.0 / 3.0 * x
+    r = -1.0 / 3.0 * x + math.sqrt(3) / 3.0 * y
+    s = -q - r
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+
+    axial = np.column_stack([rq, rr]).astype(np.int64)
+    cells, index = np.unique(axial, axis=0, return_inverse=True)
+    centre_x = 1.5 * cells[:, 0]
+    centre_y = math.sqrt(3) * (cells[:, 1] + cells[:, 0] / 2.0)
+    return index.ravel(), centre_y * radius_m / METERS_PER_DEGREE, centre_x * radius_m / scale_x
+
+
+# -------------------------
+# Layer data
+# -------------------------
+class StationGeometry:
+    """Static part of the map, rebuilt only when the station set moves.
+
+    Positions, names and hexagon membership are computed once per station
+    set; each rerun only looks up colours and sizes for the new availability
+    and zips them onto the prepared rows. Layer data is a list of plain
+    records holding just the fields the layers and tooltip read, with
+    rounded coordinates, which is what pydeck serialises.
+    """
+
+    def __init__(self, hex_radius_m=MAP_HEX_RADIUS_M):
+        self.hex_radius_m = hex_radius_m
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _prepare(self, snapshot):
+        ordered = snapshot.sort_values("station_id")
+        station_ids = ordered["station_id"].to_numpy()
+        lat = ordered["latitude"].to_numpy(dtype=float).round(COORD_DECIMALS)
+        lon = ordered["longitude"].to_numpy(dtype=float).round(COORD_DECIMALS)
+
+        state = self._state
+        if (
+            state is not None
+            and np.array_equal(state["station_ids"], station_ids)
+            and np.array_equal(state["lat"], lat)
+            and np.array_equal(state["lon"], lon)
+        ):
+            return state
+
+        with self._lock:
+            cells, hex_lat, hex_lon = hexagon_cells(lat, lon, self.hex_radius_m)
+            state = {
+                "station_ids": station_ids,
+                "index": pd.Index(station_ids),
+                "lat": lat,
+                "lon": lon,
+                "positions": np.column_stack([lon, lat]).tolist(),
+                "names": ordered["name"].astype(str).tolist(),
+                "cells": cells,
+                "hex_positions": np.column_stack([
+                    hex_lon.round(COORD_DECIMALS), hex_lat.round(COORD_DECIMALS)
+                ]).tolist(),
+            }
+            self._state = state
+        return state
+
+    def center(self, snapshot):
+        state = self._prepare(snapshot)
+        return float(state["lat"].mean()), float(state["lon"].mean())
+
+    def station_records(self, snapshot, clusters=None):
+        """One record per station: position, color, radius, name, details.
+
+        `clusters` (station_id, cluster, cluster_label) switches colours from
+        availability to usage profile.
+        """
+        state = self._prepare(snapshot)
+        values = snapshot.set_index("station_id").reindex(state["index"])
+        bikes = values["free_bikes"].fillna(0).to_numpy(dtype=np.int64)
+        slots = values["empty_slots"].fillna(0).to_numpy(dtype=np.int64)
+        capacity = np.maximum(bikes + slots, 1)
+
+        details = [f"Vélos: {b}<br/>Bornes: {e}" for b, e in zip(bikes.tolist(), slots.tolist())]
+        if clusters is None:
+            colors = utilization_colors(bikes / capacity)
+        else:
+            assigned = clusters.set_index("station_id").reindex(state["index"])
+            colors = cluster_colors(assigned["cluster"].to_numpy(dtype=float))
+            labels = assigned["cluster_label"].fillna("—").tolist()
+            details = [f"{d}<br/>Profil: {label}" for d, label in zip(details, labels)]
+
+        return [
+            {"position": p, "color": c, "radius": r, "name": n, "details": d}
+            for p, c, r, n, d in zip(
+                state["positions"], colors.tolist(), station_radius(capacity).tolist(), state["names"], details
+            )
+        ]
+
+    def hexagon_records(self, snapshot):
+        """One record per occupied hexagon: stations, bikes and mean fill.
+
+        Columns are extruded by the bikes available and coloured by the
+        fill ratio of the whole cell.
+        """
+        state = self._prepare(snapshot)
+        values = snapshot.set_index("station_id").reindex(state["index"])
+        bikes = values["free_bikes"].fillna(0).to_numpy(dtype=float)
+        slots = values["empty_slots"].fillna(0).to_numpy(dtype=float)
+
+        cells = state["cells"]
+        count = len(state["hex_positions"])
+        stations = np.bincount(cells, minlength=count)
+        cell_bikes = np.bincount(cells, weights=bikes, minlength=count)
+        cell_slots = np.bincount(cells, weights=slots, minlength=count)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            utilization = np.where(cell_bikes + cell_slots > 0, cell_bikes / (cell_bikes + cell_slots), 0.0)
+
+        return [
+            {
+                "position": p,
+                "color": c,
+                "elevation": b,
+                "name": f"{n} station{'s' if n > 1 else ''}",
+                "details": f"Vélos: {b}<br/>Bornes: {e}<br/>Remplissage: {u:.0%}",
+            }
+            for p, c, n, b, e, u in zip(
+                state["hex_positions"], utilization_colors(utilization).tolist(), stations.tolist(),
+                cell_bikes.astype(np.int64).tolist(), cell_slots.astype(np.int64).tolist(), utilization.tolist(),
+            )
+        ]
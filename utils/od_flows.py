@@ -0,0 +1,272 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from utils.queries import window_query
+from utils.rebalancing import EARTH_RADIUS_KM, unit_vectors
+
+load_dotenv()
+
+# Snapshots are aligned on this grid before differencing
+OD_SLOT_SECONDS = int(os.getenv("OD_SLOT_SECONDS", 300))
+# exp(-d / OD_DECAY_KM) affinity, cut to zero beyond OD_MAX_KM
+OD_DECAY_KM = float(os.getenv("OD_DECAY_KM", 1.5))
+OD_MAX_KM = float(os.getenv("OD_MAX_KM", 6.0))
+# A station that misses a few polls still contributes its delta afterwards
+OD_MAX_GAP_SLOTS = int(os.getenv("OD_MAX_GAP_SLOTS", 3))
+# Pairs whose daily total stays below this are dropped once the day is closed
+OD_MIN_FLOW = float(os.getenv("OD_MIN_FLOW", 0.05))
+
+# Kernel non-zeros × slots gathered per block by estimate_flows: two float64
+# temporaries of 16 MB each, whatever the city size or chunk length
+OD_BLOCK_ELEMENTS = 2 ** 21
+
+OD_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS station_od_flows (
+        day TEXT NOT NULL,
+        origin_id TEXT NOT NULL,
+        destination_id TEXT NOT NULL,
+        flow REAL NOT NULL,
+        PRIMARY KEY (day, origin_id, destination_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS od_progress (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_slot INTEGER NOT NULL
+    );
+"""
+
+UPSERT_FLOW = """
+    INSERT INTO station_od_flows (day, origin_id, destination_id, flow)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (day, origin_id, destination_id) DO UPDATE SET
+        flow = flow + excluded.flow
+"""
+
+
+def create_od_tables(conn):
+    conn.executescript(OD_SCHEMA)
+
+
+# -------------------------
+# Model
+# -------------------------
+def decay_kernel(lat, lon, decay_km=OD_DECAY_KM, max_km=OD_MAX_KM):
+    """Sparse station × station affinity exp(-d / decay), no self-loops.
+
+    Only pairs within `max_km` are ever formed: a KD-tree over 3-D unit
+    vectors finds them with a chord radius, so memory follows the number of
+    neighbours instead of stations².
+    """
+    points = unit_vectors(lat, lon)
+    radius = 2 * np.sin(max_km / (2 * EARTH_RADIUS_KM))
+    pairs = cKDTree(points).query_pairs(radius, output_type="ndarray")
+    # Each unordered pair once, then mirrored: the kernel is symmetric
+    chord = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    weights = np.exp(-2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0)) / decay_km)
+    upper = sparse.coo_matrix((weights, (pairs[:, 0], pairs[:, 1])), shape=(len(points), len(points)))
+    return (upper + upper.T).tocsr()
+
+
+def slot_matrix(rows, slot_seconds=OD_SLOT_SECONDS, max_gap=OD_MAX_GAP_SLOTS):
+    """free_bikes as stations × slots (last sample per slot), short gaps filled."""
+    stamps = pd.to_datetime(rows["timestamp"], format="ISO8601", utc=True)
+    epoch = (stamps - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    frame = rows.assign(slot=epoch - epoch % slot_seconds, ts=stamps)
+    frame = frame.sort_values("ts").drop_duplicates(["station_id", "slot"], keep="last")
+    grid = frame.pivot(index="station_id", columns="slot", values="free_bikes")
+    grid = grid.reindex(columns=np.arange(grid.columns.min(), grid.columns.max() + 1, slot_seconds))
+    return grid.ffill(axis=1, limit=max_gap)
+
+
+def estimate_flows(deltas, kernel):
+    """Flows implied by one block of snapshot-to-snapshot deltas.
+
+    For each snapshot t, departures out_i(t) are spread over the stations
+    that gained bikes, in proportion to K_ij · in_j(t):
+
+        F_ij = K_ij · Σ_t out_i(t) · in_j(t) / Σ_k K_ik · in_k(t)
+
+    which is evaluated for every snapshot at once: one sparse × dense
+    product for the normalisers, then one row-wise dot product per
+    non-zero of K, gathered a block of non-zeros at a time so memory does
+    not grow with nnz × slots. Returns a sparse matrix of summed flows.
+    """
+    deltas = np.nan_to_num(deltas)
+    outflow = np.clip(-deltas, 0, None)
+    inflow = np.clip(deltas, 0, None)
+
+    reach = kernel @ inflow
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(reach > 0, outflow / reach, 0.0)
+
+    coo = kernel.tocoo()
+    values = np.empty(coo.nnz)
+    block = max(1, OD_BLOCK_ELEMENTS // max(1, deltas.shape[1]))
+    for start in range(0, coo.nnz, block):
+        rows, cols = coo.row[start:start + block], coo.col[start:start + block]
+        values[start:start + block] = np.einsum("kt,kt->k", share[rows], inflow[cols])
+    values *= coo.data
+    return sparse.csr_matrix((values, (coo.row, coo.col)), shape=kernel.shape)
+
+
+class FlowEstimator:
+    """Caches the decay kernel for a station set across day chunks."""
+
+    def __init__(self, decay_km=OD_DECAY_KM, max_km=OD_MAX_KM,
+                 slot_seconds=OD_SLOT_SECONDS, min_flow=OD_MIN_FLOW):
+        self.decay_km = decay_km
+        self.max_km = max_km
+        self.slot_seconds = slot_seconds
+        self.min_flow = min_flow
+        self._kernel_key = None
+        self._kernel = None
+
+    def kernel(self, stations):
+        key = tuple(stations.index)
+        if key != self._kernel_key:
+            self._kernel = decay_kernel(
+                stations["latitude"].to_numpy(), stations["longitude"].to_numpy(),
+                self.decay_km, self.max_km,
+            )
+            self._kernel_key = key
+        return self._kernel
+
+    def chunk_flows(self, rows, after_slot=None):
+        """Flows (origin_id, destination_id, flow) for deltas landing after `after_slot`.
+
+        Nothing is cut at `min_flow` here: a day processed in several chunks
+        must add up to the same totals as one pass, so small pairs are only
+        dropped by store_day once their day is closed.
+        """
+        if rows.empty:
+            return pd.DataFrame(columns=["origin_id", "destination_id", "flow"])
+        grid = slot_matrix(rows, self.slot_seconds)
+        if grid.shape[1] < 2:
+            return pd.DataFrame(columns=["origin_id", "destination_id", "flow"])
+
+        deltas = np.diff(grid.to_numpy(dtype=float), axis=1)
+        landing = grid.columns[1:]
+        if after_slot is not None:
+            keep = landing > after_slot
+            deltas, landing = deltas[:, keep], landing[keep]
+
+        stations = (
+            rows.sort_values("timestamp").drop_duplicates("station_id", keep="last")
+            .set_index("station_id")[["latitude", "longitude"]].reindex(grid.index)
+        )
+        flows = estimate_flows(deltas, self.kernel(stations)).tocoo()
+        keep = flows.data > 0
+        station_ids = grid.index.to_numpy()
+        return pd.DataFrame({
+            "origin_id": station_ids[flows.row[keep]],
+            "destination_id": station_ids[flows.col[keep]],
+            "flow": flows.data[keep],
+        })
+
+
+# -------------------------
+# Incremental job
+# -------------------------
+def last_processed_slot(conn):
+    row = conn.execute("SELECT last_slot FROM od_progress WHERE id = 1").fetchone()
+    return None if row is None else row[0]
+
+
+def store_day(conn, day, flows, last_slot, closed_min_flow=None):
+    """Add one chunk of flows to `day` and move the watermark; with
+    `closed_min_flow`, the day is complete and its small pairs are pruned."""
+    with conn:
+        conn.executemany(
+            UPSERT_FLOW,
+            ((day, o, d, float(f)) for o, d, f in flows.itertuples(index=False, name=None)),
+        )
+        if closed_min_flow is not None:
+            conn.execute(
+                "DELETE FROM station_od_flows WHERE day = ? AND flow < ?", (day, closed_min_flow)
+            )
+        conn.execute(
+            "INSERT INTO od_progress (id, last_slot) VALUES (1, ?) "
+            "ON CONFLICT (id) DO UPDATE SET last_slot = excluded.last_slot",
+            (int(last_slot),),
+        )
+    return len(flows)
+
+
+def process_history(manager, estimator=None, rebuild=False, until=None):
+    """Fold every closed slot since the last run into station_od_flows.
+
+    Works one UTC day at a time. Each chunk re-reads a few slots before the
+    watermark so the first delta after it (and gap filling) has a baseline,
+    but only deltas landing after the watermark are counted. Pairs below
+    the estimator's `min_flow` are pruned when their day closes, so any
+    sequence of runs stores the same flows as a single one. Returns
+    {day: pairs added}.
+    """
+    estimator = estimator or FlowEstimator()
+    slot = estimator.slot_seconds
+    lookback = timedelta(seconds=slot * (OD_MAX_GAP_SLOTS + 1))
+
+    def prepare(conn):
+        create_od_tables(conn)
+        if rebuild:
+            with conn:
+                conn.execute("DELETE FROM station_od_flows")
+                conn.execute("DELETE FROM od_progress")
+        return last_processed_slot(conn)
+
+    last_slot = manager.write(prepare)
+    # Only closed slots: the current one may still receive samples
+    end = int((until or datetime.now(timezone.utc)).timestamp()) // slot * slot
+
+    if last_slot is None:
+        with manager.reader() as conn:
+            sql, params = window_query(conn)
+            first = conn.execute(f"SELECT MIN(timestamp) FROM ({sql})", params).fetchone()[0]
+        if first is None:
+            return {}
+        start = datetime.fromisoformat(first).astimezone(timezone.utc)
+    else:
+        start = datetime.fromtimestamp(last_slot + slot, timezone.utc)
+
+    written = {}
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    stop = datetime.fromtimestamp(end, timezone.utc)
+    while day < stop:
+        day_end = min(day + timedelta(days=1), stop)
+        with manager.reader() as conn:
+            sql, params = window_query(conn, since=max(day, start) - lookback, until=day_end)
+            rows = pd.read_sql(sql, conn, params=params)
+
+        # A day must still be closed (pruned) when its last chunk falls in a gap
+        closed = day_end == day + timedelta(days=1)
+        if not rows.empty or closed:
+            flows = estimator.chunk_flows(rows, after_slot=last_slot)
+            last_slot = int(day_end.timestamp()) - slot
+            written[day.date().isoformat()] = manager.write(
+                store_day, day.date().isoformat(), flows, last_slot,
+                estimator.min_flow if closed else None,
+            )
+        day += timedelta(days=1)
+    return written
+
+
+def od_flows_query(since_day=None, limit=None):
+    sql = """
+        SELECT origin_id, destination_id, SUM(flow) AS flow
+        FROM station_od_flows
+    """
+    params = []
+    if since_day is not None:
+        sql += " WHERE day >= ?"
+        params.append(since_day)
+    sql += " GROUP BY origin_id, destination_id ORDER BY flow DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return sql, params
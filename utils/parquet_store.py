@@ -0,0 +1,183 @@
+import os
+from datetime import datetime, time, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.compaction import load_compact_history
+from utils.connections import get_manager
+from utils.db import DATA_DIR, DB_PATH
+from utils.queries import window_query
+
+PARQUET_ROOT = os.path.join(DATA_DIR, "parquet", "station_activity")
+
+# One directory per closed UTC day: <root>/date=YYYY-MM-DD/part-0.parquet
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+ARROW_SCHEMA = pa.schema([
+    ("station_id", pa.dictionary(pa.int32(), pa.string())),
+    ("name", pa.dictionary(pa.int32(), pa.string())),
+    ("free_bikes", pa.int32()),
+    ("empty_slots", pa.int32()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+])
+
+DICTIONARY_COLUMNS = ["station_id", "name"]
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def partition_path(day, root=PARQUET_ROOT):
+    return os.path.join(root, f"date={day.isoformat()}", "part-0.parquet")
+
+
+def exported_days(root=PARQUET_ROOT):
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for entry in os.listdir(root):
+        if entry.startswith("date=") and os.path.exists(os.path.join(root, entry, "part-0.parquet")):
+            days.append(datetime.strptime(entry[5:], "%Y-%m-%d").date())
+    return sorted(days)
+
+
+def exported_until(root=PARQUET_ROOT):
+    """End (exclusive, UTC) of the last exported day, or None."""
+    days = exported_days(root)
+    return _day_start(days[-1] + timedelta(days=1)) if days else None
+
+
+def to_arrow(df):
+    frame = df[[field.name for field in ARROW_SCHEMA]].copy()
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], format="ISO8601", utc=True)
+    return pa.Table.from_pandas(frame, schema=ARROW_SCHEMA, preserve_index=False)
+
+
+# -------------------------
+# Export
+# -------------------------
+def export_day(conn, day, root=PARQUET_ROOT):
+    since = _day_start(day)
+    sql, params = window_query(conn, since=since, until=since + timedelta(days=1))
+    df = pd.read_sql(sql, conn, params=params)
+    if df.empty:
+        return 0
+
+    # Sorted rows give long runs of equal dictionary ids, which zstd loves
+    table = to_arrow(df.sort_values(["station_id", "timestamp"]))
+    path = partition_path(day, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(
+        table,
+        tmp_path,
+        compression="zstd",
+        use_dictionary=DICTIONARY_COLUMNS,
+    )
+    os.replace(tmp_path, path)
+    return table.num_rows
+
+
+def export_closed_days(db_path=None, root=PARQUET_ROOT, overwrite=False):
+    """Export every UTC day before today that is not yet in the dataset."""
+    manager = get_manager(db_path or DB_PATH)
+    today = datetime.now(timezone.utc).date()
+    done = set() if overwrite else set(exported_days(root))
+
+    with manager.reader() as conn:
+        sql, params = window_query(conn, until=_day_start(today))
+        bounds = conn.execute(
+            f"SELECT MIN(timestamp), MAX(timestamp) FROM ({sql})", params
+        ).fetchone()
+        if bounds[0] is None:
+            return {}
+
+        first = datetime.fromisoformat(bounds[0]).astimezone(timezone.utc).date()
+        last = datetime.fromisoformat(bounds[1]).astimezone(timezone.utc).date()
+        written = {}
+        day = first
+        while day <= last:
+            if day not in done:
+                written[day] = export_day(conn, day, root)
+            day += timedelta(days=1)
+    return written
+
+
+# -------------------------
+# Load
+# -------------------------
+def load_archive(since=None, until=None, columns=None, station_ids=None,
+                 root=PARQUET_ROOT, as_frame=True):
+    """Read a time window with partition pruning and column projection."""
+    if not exported_days(root):
+        empty = ARROW_SCHEMA.empty_table()
+        table = empty.select(columns) if columns else empty
+    else:
+        dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+        filters = []
+        if since is not None:
+            filters.append(ds.field("date") >= since.astimezone(timezone.utc).date().isoformat())
+            filters.append(ds.field("timestamp") >= pa.scalar(since, pa.timestamp("us", tz="UTC")))
+        if until is not None:
+            filters.append(ds.field("date") <= until.astimezone(timezone.utc).date().isoformat())
+            filters.append(ds.field("timestamp") < pa.scalar(until, pa.timestamp("us", tz="UTC")))
+        if station_ids is not None:
+            filters.append(ds.field("station_id").isin(list(station_ids)))
+
+        expression = None
+        for f in filters:
+            expression = f if expression is None else expression & f
+        table = dataset.to_table(
+            columns=columns or [field.name for field in ARROW_SCHEMA],
+            filter=expression,
+        )
+
+    if not as_frame:
+        return table
+
+    # Plain strings downstream: categorical station ids change groupby semantics
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+    return table.to_pandas()
+
+
+def load_full_history(columns=None, station_ids=None):
+    """Whole history: Parquet for exported days, SQLite for the rest.
+
+    Buckets compacted before their day was exported exist nowhere else, so
+    they are read from station_history_compact (one sample per station and
+    bucket) for the days the other two sources do not cover.
+    """
+    boundary = exported_until()
+    manager = get_manager()
+    with manager.reader() as conn:
+        sql, params = window_query(conn, since=boundary, station_ids=station_ids)
+        recent = pd.read_sql(sql, conn, params=params)
+        all_sql, all_params = window_query(conn)
+        (raw_start,) = conn.execute(f"SELECT MIN(timestamp) FROM ({all_sql})", all_params).fetchone()
+        compacted = load_compact_history(
+            conn,
+            until=None if raw_start is None else datetime.fromisoformat(raw_start),
+            station_ids=station_ids,
+        )
+    recent["timestamp"] = pd.to_datetime(recent["timestamp"], format="ISO8601", utc=True)
+    if not compacted.empty:
+        compacted = compacted[~compacted["timestamp"].dt.date.isin(set(exported_days()))]
+
+    parts = [compacted]
+    if boundary is not None:
+        parts.append(load_archive(until=boundary, columns=columns, station_ids=station_ids))
+    parts.append(recent)
+    if columns:
+        parts = [part[columns] for part in parts]
+    filled = [part for part in parts if not part.empty]
+    if len(filled) <= 1:
+        return (filled or parts)[-1].reset_index(drop=True)
+    return pd.concat(filled, ignore_index=True)
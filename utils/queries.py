@@ -0,0 +1,125 @@
+from datetime import timezone
+
+from utils.db import is_warehouse
+
+ACTIVITY_COLUMNS = (
+    "station_id, name, free_bikes, empty_slots, latitude, longitude, timestamp"
+)
+
+
+def _to_utc(since):
+    if since.tzinfo is None:
+        return since.replace(tzinfo=timezone.utc)
+    return since.astimezone(timezone.utc)
+
+
+def _window_clauses(conn, since=None, until=None, station_ids=None):
+    warehouse = is_warehouse(conn)
+    clauses, params = [], []
+
+    for op, bound in ((">=", since), ("<", until)):
+        if bound is None:
+            continue
+        bound = _to_utc(bound)
+        if warehouse:
+            clauses.append(f"ts {op} ?")
+            params.append(int(bound.timestamp()))
+        else:
+            clauses.append(f"timestamp {op} ?")
+            params.append(bound.isoformat())
+
+    if station_ids is not None:
+        station_ids = list(station_ids)
+        if not station_ids:
+            clauses.append("0")
+        else:
+            placeholders = ", ".join("?" for _ in station_ids)
+            clauses.append(f"station_id IN ({placeholders})")
+            params.extend(station_ids)
+
+    return clauses, params
+
+
+def _select(columns, clauses):
+    sql = f"SELECT {columns} FROM station_activity"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql
+
+
+def window_query(conn, since=None, until=None, station_ids=None):
+    """SELECT for the rows of a time window, filtered inside SQLite.
+
+    Legacy tables compare ISO strings (all stored in UTC, so they sort
+    chronologically) against idx_station_activity_timestamp; migrated
+    databases filter the integer `ts` column exposed by the view.
+    """
+    clauses, params = _window_clauses(conn, since, until, station_ids)
+    return _select(ACTIVITY_COLUMNS, clauses), params
+
+
+def latest_snapshot_query(conn):
+    """SELECT for the most recent row of every station."""
+    if is_warehouse(conn):
+        sql = """
+            SELECT s.station_id, s.name, f.free_bikes, f.empty_slots,
+                   s.latitude, s.longitude,
+                   strftime('%Y-%m-%dT%H:%M:%S+00:00', f.ts, 'unixepoch') AS timestamp
+            FROM stations s
+            JOIN station_facts f ON f.station_key = s.station_key
+            WHERE s.valid_to IS NULL
+              AND f.ts = (
+                  SELECT MAX(ts) FROM station_facts WHERE station_key = s.station_key
+              )
+        """
+    else:
+        # GROUP BY/MAX is answered from idx_station_activity_station_ts alone
+        sql = """
+            SELECT a.station_id, a.name, a.free_bikes, a.empty_slots,
+                   a.latitude, a.longitude, a.timestamp
+            FROM station_activity a
+            JOIN (
+                SELECT station_id, MAX(timestamp) AS last_seen
+                FROM station_activity
+                GROUP BY station_id
+            ) latest
+              ON latest.station_id = a.station_id
+             AND latest.last_seen = a.timestamp
+        """
+    return sql, []
+
+
+def watermark_column(conn):
+    """Monotonic column used to fetch only newly appended rows."""
+    return "ts" if is_warehouse(conn) else "id"
+
+
+def data_version_query(conn):
+    """SELECT for a value that changes whenever a snapshot is stored.
+
+    Both answer from an index (the rowid, idx_station_facts_ts_covering) without
+    scanning the history.
+    """
+    if is_warehouse(conn):
+        return "SELECT MAX(ts) FROM station_facts", []
+    return "SELECT MAX(id) FROM station_activity", []
+
+
+def increment_query(conn, after=None, since=None, overlap_seconds=0):
+    """SELECT for rows appended after watermark `after`, or since `since`.
+
+    Legacy tables use the AUTOINCREMENT id, which is strictly increasing.
+    The warehouse has no rowid, so the epoch `ts` is used instead and the
+    last `overlap_seconds` are re-read to catch snapshots committed slightly
+    out of capture order; callers de-duplicate on (station_id, timestamp).
+    """
+    key = watermark_column(conn)
+    columns = f"{key}, {ACTIVITY_COLUMNS}"
+
+    if after is not None:
+        if key == "id":
+            return _select(columns, ["id > ?"]), [after]
+        return _select(columns, ["ts >= ?"]), [after - overlap_seconds]
+
+    clauses, params = _window_clauses(conn, since=since)
+    return _select(columns, clauses), params
@@ -0,0 +1,220 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EARTH_RADIUS_KM = 6371.0088
+
+REBALANCE_TARGET_FILL = float(os.getenv("REBALANCE_TARGET_FILL", 0.5))
+REBALANCE_TRUCKS = int(os.getenv("REBALANCE_TRUCKS", 2))
+REBALANCE_TRUCK_CAPACITY = int(os.getenv("REBALANCE_TRUCK_CAPACITY", 20))
+REBALANCE_MIN_MOVE = int(os.getenv("REBALANCE_MIN_MOVE", 3))
+REBALANCE_MAX_STOPS = int(os.getenv("REBALANCE_MAX_STOPS", 12))
+REBALANCE_TIME_BUDGET = float(os.getenv("REBALANCE_TIME_BUDGET", 2.0))
+
+STOP_COLUMNS = [
+    "truck", "stop", "station_id", "name", "action", "bikes",
+    "load", "leg_km", "latitude", "longitude",
+]
+
+
+def unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+# Rows per block of haversine_matrix: the float64 temporaries stay a few MB
+HAVERSINE_BLOCK_ROWS = 256
+
+
+def haversine_matrix(lat, lon, other_lat=None, other_lon=None, dtype=np.float32):
+    """Pairwise great-circle distances in km.
+
+    Same result as the haversine formula, computed from 3-D unit vectors so
+    the n × m part is a matrix product: the chord between two points is
+    sqrt(2 - 2·cos θ) and the arc is 2·asin(chord / 2). Blocks of rows are
+    computed in float64 and written straight into the `dtype` result, so
+    the only n × m allocation is the result itself.
+    """
+    left = unit_vectors(lat, lon)
+    right = left if other_lat is None else unit_vectors(other_lat, other_lon)
+    out = np.empty((len(left), len(right)), dtype=dtype)
+    for start in range(0, len(left), HAVERSINE_BLOCK_ROWS):
+        arc = left[start:start + HAVERSINE_BLOCK_ROWS] @ right.T
+        arc *= -2.0
+        arc += 2.0
+        np.clip(arc, 0.0, 4.0, out=arc)
+        np.sqrt(arc, out=arc)
+        arc /= 2.0
+        np.arcsin(arc, out=arc)
+        arc *= 2 * EARTH_RADIUS_KM
+        out[start:start + HAVERSINE_BLOCK_ROWS] = arc
+    return out
+
+
+def station_imbalance(snapshot, target_fill=REBALANCE_TARGET_FILL, min_move=REBALANCE_MIN_MOVE):
+    """Bikes to remove (> 0) or bring (< 0) to reach the target fill level.
+
+    `target_fill` is a ratio of capacity, or a Series of ratios indexed by
+    station_id for per-station targets.
+    """
+    frame = snapshot[["station_id", "name", "latitude", "longitude", "free_bikes", "empty_slots"]].copy()
+    capacity = frame["free_bikes"] + frame["empty_slots"]
+    if isinstance(target_fill, pd.Series):
+        fill = frame["station_id"].map(target_fill).fillna(REBALANCE_TARGET_FILL)
+    else:
+        fill = target_fill
+    frame["target"] = np.round(capacity * fill).astype(int)
+    frame["imbalance"] = frame["free_bikes"] - frame["target"]
+    return frame[frame["imbalance"].abs() >= min_move].reset_index(drop=True)
+
+
+class RebalancingPlanner:
+    """Greedy pick-up / drop-off routing with a 2-opt polish.
+
+    Trucks are routed one stop at a time: from its position, each truck
+    takes the reachable stop with the most bikes moved per km (pick-ups
+    while it has room, drop-offs while it carries bikes), every choice
+    being a vectorized pass over the remaining candidates. Routes are then
+    shortened with 2-opt moves that keep the load feasible, until the time
+    budget runs out.
+    """
+
+    def __init__(self, trucks=REBALANCE_TRUCKS, truck_capacity=REBALANCE_TRUCK_CAPACITY,
+                 max_stops=REBALANCE_MAX_STOPS, time_budget=REBALANCE_TIME_BUDGET):
+        self.trucks = trucks
+        self.truck_capacity = truck_capacity
+        self.max_stops = max_stops
+        self.time_budget = time_budget
+
+    def plan(self, snapshot, target_fill=REBALANCE_TARGET_FILL, min_move=REBALANCE_MIN_MOVE,
+             depot=None):
+        """Routes as one stop per row (see STOP_COLUMNS).
+
+        `depot` is a (latitude, longitude) start point; by default each
+        truck starts at the pick-up with the largest surplus still open.
+        """
+        deadline = time.perf_counter() + self.time_budget
+        stations = station_imbalance(snapshot, target_fill, min_move)
+        if stations.empty:
+            return pd.DataFrame(columns=STOP_COLUMNS)
+
+        lat = stations["latitude"].to_numpy()
+        lon = stations["longitude"].to_numpy()
+        distances = haversine_matrix(lat, lon)
+        from_depot = None if depot is None else haversine_matrix([depot[0]], [depot[1]], lat, lon)[0]
+
+        remaining = stations["imbalance"].to_numpy().astype(np.int64)
+        routes = []
+        for truck in range(self.trucks):
+            if time.perf_counter() > deadline or not (remaining > 0).any():
+                break
+            route = self._build_route(distances, from_depot, remaining, deadline)
+            if route:
+                routes.append(route)
+
+        stops = []
+        for truck, route in enumerate(routes, start=1):
+            route = self._two_opt(route, distances, from_depot, deadline)
+            load, previous = 0, None
+            for order, (index, bikes) in enumerate(route, start=1):
+                load += bikes
+                if previous is None:
+                    leg = 0.0 if from_depot is None else float(from_depot[index])
+                else:
+                    leg = float(distances[previous, index])
+                row = stations.iloc[index]
+                stops.append((
+                    truck, order, row["station_id"], row["name"],
+                    "pickup" if bikes > 0 else "dropoff", abs(bikes), load, round(leg, 3),
+                    row["latitude"], row["longitude"],
+                ))
+                previous = index
+        return pd.DataFrame(stops, columns=STOP_COLUMNS)
+
+    def _build_route(self, distances, from_depot, remaining, deadline):
+        route, load = [], 0
+        position = None
+        while len(route) < self.max_stops and time.perf_counter() <= deadline:
+            room = self.truck_capacity - load
+            movable = np.where(remaining > 0, np.minimum(remaining, room), np.minimum(-remaining, load))
+            movable[remaining == 0] = 0
+            if not (movable > 0).any():
+                break
+
+            if position is None:
+                if from_depot is None:
+                    # Start where the most bikes can be loaded
+                    candidate = int(np.argmax(np.where(remaining > 0, movable, 0)))
+                    if movable[candidate] <= 0:
+                        break
+                else:
+                    candidate = int(np.argmax(movable / (from_depot + 0.1)))
+            else:
+                score = movable / (distances[position] + 0.1)
+                score[movable <= 0] = -1
+                candidate = int(np.argmax(score))
+                if score[candidate] <= 0:
+                    break
+
+            bikes = int(movable[candidate]) if remaining[candidate] > 0 else -int(movable[candidate])
+            remaining[candidate] -= bikes
+            load += bikes
+            route.append((candidate, bikes))
+            position = candidate
+
+        # A truck must finish empty: bikes it could not deliver go back to their
+        # stations, latest pick-ups first. Only drop-offs follow the last
+        # pick-up still carrying bikes, so no load along the route turns negative.
+        for step in range(len(route) - 1, -1, -1):
+            if load == 0:
+                break
+            index, bikes = route[step]
+            if bikes > 0:
+                returned = min(bikes, load)
+                remaining[index] += returned
+                load -= returned
+                route[step] = (index, bikes - returned)
+        return [(index, bikes) for index, bikes in route if bikes != 0]
+
+    @staticmethod
+    def _route_km(route, distances, from_depot):
+        indices = [index for index, _ in route]
+        total = float(distances[indices[:-1], indices[1:]].sum())
+        if from_depot is not None:
+            total += float(from_depot[indices[0]])
+        return total
+
+    def _two_opt(self, route, distances, from_depot, deadline):
+        if len(route) < 4:
+            return route
+        best = self._route_km(route, distances, from_depot)
+        improved = True
+        while improved and time.perf_counter() <= deadline:
+            improved = False
+            for i in range(1, len(route) - 2):
+                for j in range(i + 1, len(route) - 1):
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    loads = np.cumsum([bikes for _, bikes in candidate])
+                    if loads.min() < 0 or loads.max() > self.truck_capacity:
+                        continue
+                    km = self._route_km(candidate, distances, from_depot)
+                    if km < best - 1e-6:
+                        route, best, improved = candidate, km, True
+        return route
+
+
+def plan_summary(stops):
+    if stops.empty:
+        return {"trucks": 0, "stops": 0, "bikes_moved": 0, "km": 0.0}
+    return {
+        "trucks": int(stops["truck"].nunique()),
+        "stops": len(stops),
+        "bikes_moved": int(stops.loc[stops["action"] == "dropoff", "bikes"].sum()),
+        "km": round(float(stops["leg_km"].sum()), 2),
+    }
@@ -0,0 +1,288 @@
+from datetime import datetime
+
+from utils.compaction import has_compact_table
+
+# Bucket widths in seconds, aligned on the UTC epoch like pandas resample
+GRAINS = {
+    "15min": 900,
+    "1h": 3600,
+    "1D": 86400,
+}
+
+# Sums (not means) are stored so buckets can be merged into coarser ones;
+# movement is the summed |Δ free_bikes| between consecutive samples, counted
+# in the bucket of the later sample. rollup_state remembers each station's
+# last sample so the next snapshot's movement needs no history scan.
+ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS station_rollup (
+        grain INTEGER NOT NULL,
+        station_id TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        min_bikes INTEGER NOT NULL,
+        max_bikes INTEGER NOT NULL,
+        sum_bikes INTEGER NOT NULL,
+        sum_empty INTEGER NOT NULL,
+        movement INTEGER NOT NULL,
+        PRIMARY KEY (grain, station_id, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_station_rollup_bucket
+        ON station_rollup (grain, bucket);
+
+    CREATE TABLE IF NOT EXISTS citywide_rollup (
+        grain INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        sum_bikes INTEGER NOT NULL,
+        sum_empty INTEGER NOT NULL,
+        movement INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        station_id TEXT PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        free_bikes INTEGER NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+UPSERT_STATION = """
+    INSERT INTO station_rollup
+        (grain, station_id, bucket, samples, min_bikes, max_bikes, sum_bikes, sum_empty, movement)
+    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT (grain, station_id, bucket) DO UPDATE SET
+        samples = samples + 1,
+        min_bikes = MIN(min_bikes, excluded.min_bikes),
+        max_bikes = MAX(max_bikes, excluded.max_bikes),
+        sum_bikes = sum_bikes + excluded.sum_bikes,
+        sum_empty = sum_empty + excluded.sum_empty,
+        movement = movement + excluded.movement
+"""
+
+UPSERT_CITYWIDE = """
+    INSERT INTO citywide_rollup (grain, bucket, samples, sum_bikes, sum_empty, movement)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (grain, bucket) DO UPDATE SET
+        samples = samples + excluded.samples,
+        sum_bikes = sum_bikes + excluded.sum_bikes,
+        sum_empty = sum_empty + excluded.sum_empty,
+        movement = movement + excluded.movement
+"""
+
+UPSERT_STATE = """
+    INSERT INTO rollup_state (station_id, ts, free_bikes) VALUES (?, ?, ?)
+    ON CONFLICT (station_id) DO UPDATE SET
+        ts = excluded.ts,
+        free_bikes = excluded.free_bikes
+    WHERE excluded.ts > rollup_state.ts
+"""
+
+
+def create_rollup_tables(conn):
+    conn.executescript(ROLLUP_SCHEMA)
+
+
+def epoch_seconds(iso_timestamp):
+    return int(datetime.fromisoformat(iso_timestamp).timestamp())
+
+
+def update_rollups(conn, batch):
+    """Fold one normalized snapshot (see fetch_stations.normalize_snapshot)
+    into every rollup. Runs inside the caller's transaction."""
+    ts = epoch_seconds(batch["timestamp"])
+    station_ids = batch["station_id"]
+    if not station_ids:
+        return
+
+    previous = {}
+    for offset in range(0, len(station_ids), 500):
+        chunk = station_ids[offset:offset + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        previous.update(
+            (row[0], (row[1], row[2]))
+            for row in conn.execute(
+                f"SELECT station_id, ts, free_bikes FROM rollup_state WHERE station_id IN ({placeholders})",
+                chunk,
+            )
+        )
+
+    movements = []
+    for station_id, bikes in zip(station_ids, batch["free_bikes"]):
+        last = previous.get(station_id)
+        movements.append(abs(bikes - last[1]) if last and last[0] < ts else 0)
+
+    total_bikes = sum(batch["free_bikes"])
+    total_empty = sum(batch["empty_slots"])
+    total_movement = sum(movements)
+
+    for width in GRAINS.values():
+        bucket = ts - ts % width
+        conn.executemany(
+            UPSERT_STATION,
+            (
+                (width, station_id, bucket, bikes, bikes, bikes, empty, movement)
+                for station_id, bikes, empty, movement in zip(
+                    station_ids, batch["free_bikes"], batch["empty_slots"], movements
+                )
+            ),
+        )
+        conn.execute(
+            UPSERT_CITYWIDE,
+            (width, bucket, len(station_ids), total_bikes, total_empty, total_movement),
+        )
+
+    conn.executemany(
+        UPSERT_STATE,
+        ((station_id, ts, bikes) for station_id, bikes in zip(station_ids, batch["free_bikes"])),
+    )
+
+
+# -------------------------
+# Backfill from raw history
+# -------------------------
+REBUILD_STATION = """
+    INSERT INTO station_rollup
+        (grain, station_id, bucket, samples, min_bikes, max_bikes, sum_bikes, sum_empty, movement)
+    WITH typed AS (
+        SELECT station_id, free_bikes, empty_slots,
+               CAST(strftime('%s', timestamp) AS INTEGER) AS ts, 0 AS seed
+        FROM station_activity
+        {seed}
+    ),
+    moves AS (
+        SELECT *,
+               ABS(free_bikes - LAG(free_bikes) OVER (
+                   PARTITION BY station_id ORDER BY ts
+               )) AS movement
+        FROM typed
+    )
+    SELECT :grain, station_id, ts - ts % :grain,
+           COUNT(*), MIN(free_bikes), MAX(free_bikes),
+           SUM(free_bikes), SUM(empty_slots), COALESCE(SUM(movement), 0)
+    FROM moves
+    WHERE seed = 0
+    GROUP BY station_id, ts - ts % :grain
+    ON CONFLICT (grain, station_id, bucket) DO UPDATE SET
+        samples = samples + excluded.samples,
+        min_bikes = MIN(min_bikes, excluded.min_bikes),
+        max_bikes = MAX(max_bikes, excluded.max_bikes),
+        sum_bikes = sum_bikes + excluded.sum_bikes,
+        sum_empty = sum_empty + excluded.sum_empty,
+        movement = movement + excluded.movement
+"""
+
+# Each station's last compacted value, so the first raw sample after the
+# compacted period still counts its movement
+COMPACT_SEED = """
+        UNION ALL
+        SELECT station_id, last_bikes, last_empty, bucket + grain - 1, 1
+        FROM station_history_compact c
+        WHERE bucket = (
+            SELECT MAX(bucket) FROM station_history_compact WHERE station_id = c.station_id
+        )
+"""
+
+# Periods whose raw rows were compacted away, for every grain that is a
+# multiple of the compaction bucket (a 15-minute grain cannot be rebuilt
+# from hourly buckets). Buckets compacted before sums were kept assume
+# (min + max) / 2 bikes and the last empty_slots value per sample.
+REBUILD_STATION_COMPACT = """
+    INSERT INTO station_rollup
+        (grain, station_id, bucket, samples, min_bikes, max_bikes, sum_bikes, sum_empty, movement)
+    SELECT :grain, station_id, bucket - bucket % :grain,
+           SUM(samples), MIN(min_bikes), MAX(max_bikes),
+           SUM(COALESCE(sum_bikes, samples * (min_bikes + max_bikes) / 2)),
+           SUM(COALESCE(sum_empty, samples * last_empty)),
+           SUM(movement)
+    FROM station_history_compact
+    WHERE :grain % grain = 0
+    GROUP BY station_id, bucket - bucket % :grain
+"""
+
+REBUILD_CITYWIDE = """
+    INSERT INTO citywide_rollup (grain, bucket, samples, sum_bikes, sum_empty, movement)
+    SELECT grain, bucket, SUM(samples), SUM(sum_bikes), SUM(sum_empty), SUM(movement)
+    FROM station_rollup
+    WHERE grain = :grain
+    GROUP BY bucket
+"""
+
+REBUILD_STATE = """
+    INSERT INTO rollup_state (station_id, ts, free_bikes)
+    SELECT station_id, ts, free_bikes
+    FROM (
+        SELECT station_id, free_bikes,
+               CAST(strftime('%s', timestamp) AS INTEGER) AS ts,
+               ROW_NUMBER() OVER (
+                   PARTITION BY station_id ORDER BY timestamp DESC
+               ) AS rn
+        FROM station_activity
+    )
+    WHERE rn = 1
+"""
+
+
+def rollups_missing(conn):
+    """True when there is history but no rollup was ever built from it, as
+    in a database created before the rollup tables."""
+    if conn.execute("SELECT 1 FROM rollup_state LIMIT 1").fetchone() is not None:
+        return False
+    return conn.execute("SELECT 1 FROM station_activity LIMIT 1").fetchone() is not None
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from the raw station_activity history, and
+    from station_history_compact for the periods compacted away."""
+    create_rollup_tables(conn)
+    compacted = has_compact_table(conn)
+    with conn:
+        conn.execute("DELETE FROM station_rollup")
+        conn.execute("DELETE FROM citywide_rollup")
+        conn.execute("DELETE FROM rollup_state")
+        for width in GRAINS.values():
+            if compacted:
+                conn.execute(REBUILD_STATION_COMPACT, {"grain": width})
+            conn.execute(REBUILD_STATION.format(seed=COMPACT_SEED if compacted else ""), {"grain": width})
+            conn.execute(REBUILD_CITYWIDE, {"grain": width})
+        conn.execute(REBUILD_STATE)
+
+
+# -------------------------
+# Readers
+# -------------------------
+def citywide_rollup_query(grain, since=None):
+    sql = """
+        SELECT bucket, samples,
+               sum_bikes AS free_bikes,
+               sum_empty AS empty_slots,
+               movement
+        FROM citywide_rollup
+        WHERE grain = ?
+    """
+    params = [GRAINS[grain]]
+    if since is not None:
+        sql += " AND bucket >= ?"
+        params.append(int(since.timestamp()) - int(since.timestamp()) % GRAINS[grain])
+    return sql + " ORDER BY bucket", params
+
+
+def station_rollup_query(grain, since=None, station_ids=None):
+    sql = """
+        SELECT station_id, bucket, samples, min_bikes, max_bikes,
+               CAST(sum_bikes AS REAL) / samples AS mean_bikes,
+               CAST(sum_empty AS REAL) / samples AS mean_empty,
+               movement
+        FROM station_rollup
+        WHERE grain = ?
+    """
+    params = [GRAINS[grain]]
+    if since is not None:
+        sql += " AND bucket >= ?"
+        params.append(int(since.timestamp()) - int(since.timestamp()) % GRAINS[grain])
+    if station_ids is not None:
+        station_ids = list(station_ids)
+        placeholders = ", ".join("?" for _ in station_ids) or "NULL"
+        sql += f" AND station_id IN ({placeholders})"
+        params.extend(station_ids)
+    return sql + " ORDER BY station_id, bucket", params
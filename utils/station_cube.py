@@ -0,0 +1,380 @@
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from numpy.lib import format as npy_format
+
+from utils.db import DATA_DIR
+
+CUBE_ROOT = os.path.join(DATA_DIR, "cube")
+CUBE_SLOT_SECONDS = int(os.getenv("CUBE_SLOT_SECONDS", 300))
+
+# int16 cells; a slot with no sample for a station holds MISSING
+MISSING = -1
+DTYPE = np.int16
+VALUE_FILES = {"free_bikes": "free_bikes.npy", "empty_slots": "empty_slots.npy"}
+META_FILE = "meta.json"
+
+# Column headroom so a few new stations do not force a rewrite
+STATION_PADDING = 64
+
+
+def _epoch(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+def _write_json(path, payload):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh)
+    os.replace(tmp_path, path)
+
+
+def _create_npy(path, rows, columns):
+    array = npy_format.open_memmap(path + ".tmp", mode="w+", dtype=DTYPE, shape=(rows, columns))
+    array[:] = MISSING
+    array.flush()
+    del array
+    os.replace(path + ".tmp", path)
+
+
+def _grow_rows(path, rows):
+    """Extend a time-major .npy file to `rows` rows in place.
+
+    numpy pads .npy headers so the first dimension can grow without moving
+    the data; new rows are appended to the end of the file as MISSING.
+    """
+    with open(path, "r+b") as fh:
+        npy_format.read_magic(fh)
+        shape, fortran_order, dtype = npy_format.read_array_header_1_0(fh)
+        offset = fh.tell()
+        added = rows - shape[0]
+        if added <= 0:
+            return
+
+        # Checked before anything is written: a longer header would overwrite
+        # the first cells and every reader would see shifted data
+        header = io.BytesIO()
+        npy_format.write_array_header_1_0(
+            header, {"descr": npy_format.dtype_to_descr(dtype), "fortran_order": fortran_order, "shape": (rows, shape[1])}
+        )
+        if header.tell() != offset:
+            raise RuntimeError(f"{path}: growing to {rows} rows would change the .npy header size")
+
+        fh.seek(0, os.SEEK_END)
+        fh.write(np.full((added, shape[1]), MISSING, dtype=DTYPE).tobytes())
+        fh.seek(0)
+        fh.write(header.getvalue())
+
+
+class StationTimeCube:
+    """Dense stations × time-slot view of the history.
+
+    On disk each measure is a time-major int16 .npy file (one row per slot,
+    one column per station) so that appending a snapshot writes one
+    contiguous row; meta.json holds the station axis and the slot origin.
+    Arrays are opened with mmap, so every process reading the cube shares
+    the same page cache instead of holding a private DataFrame copy.
+
+    The cube is an analysis store for scripts and notebooks. The dashboard
+    does not read it: its helpers take long-format frames, and building one
+    from the cube would be a private copy again. Within one dashboard
+    process, DATA_LAYER already shares history across sessions.
+
+    `free_bikes` / `empty_slots` are exposed stations × slots (a transposed
+    view, no copy) and `mask` marks the cells that hold a real sample.
+    """
+
+    def __init__(self, root, meta, arrays):
+        self.root = root
+        self.meta = meta
+        self.slot_seconds = meta["slot_seconds"]
+        self.origin = meta["origin"]
+        self.station_ids = meta["station_ids"]
+        self.names = meta["names"]
+        self._full = None
+        n_slots, n_stations = meta["n_slots"], len(self.station_ids)
+        self._arrays = {
+            column: array[:n_slots, :n_stations] for column, array in arrays.items()
+        }
+
+    # ---- opening -----------------------------------------------------------
+    @classmethod
+    def open(cls, root=CUBE_ROOT, writable=False):
+        meta_path = os.path.join(root, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as fh:
+            meta = json.load(fh)
+        mode = "r+" if writable else "r"
+        arrays = {
+            column: np.load(os.path.join(root, filename), mmap_mode=mode)
+            for column, filename in VALUE_FILES.items()
+        }
+        return cls(root, meta, arrays)
+
+    @classmethod
+    def create(cls, root=CUBE_ROOT, origin=None, slot_seconds=CUBE_SLOT_SECONDS):
+        os.makedirs(root, exist_ok=True)
+        origin = _epoch(origin or datetime.now(timezone.utc))
+        meta = {
+            "slot_seconds": slot_seconds,
+            "origin": origin - origin % slot_seconds,
+            "n_slots": 0,
+            "station_ids": [],
+            "names": [],
+            "latitude": [],
+            "longitude": [],
+        }
+        for filename in VALUE_FILES.values():
+            _create_npy(os.path.join(root, filename), max(1, 86400 // slot_seconds), STATION_PADDING)
+        _write_json(os.path.join(root, META_FILE), meta)
+        return cls.open(root, writable=True)
+
+    @property
+    def shape(self):
+        return len(self.station_ids), self.meta["n_slots"]
+
+    @property
+    def free_bikes(self):
+        return self._arrays["free_bikes"].T
+
+    @property
+    def empty_slots(self):
+        return self._arrays["empty_slots"].T
+
+    @property
+    def mask(self):
+        return self.free_bikes != MISSING
+
+    @property
+    def timestamps(self):
+        seconds = self.origin + self.slot_seconds * np.arange(self.meta["n_slots"])
+        return pd.to_datetime(seconds, unit="s", utc=True)
+
+    def slot_of(self, when):
+        return (_epoch(when) - self.origin) // self.slot_seconds
+
+    def _slot_after(self, when):
+        return -(-(_epoch(when) - self.origin) // self.slot_seconds)
+
+    # ---- appending (single writer: the tracker) ---------------------------
+    def append(self, batch):
+        """Write one normalized snapshot (see fetch_stations.normalize_snapshot).
+
+        Samples landing in the same slot overwrite each other (last wins);
+        slots skipped since the previous snapshot stay MISSING.
+        """
+        slot = self.slot_of(batch["timestamp"])
+        if slot < 0:
+            raise ValueError(f"snapshot {batch['timestamp']} predates the cube origin")
+
+        columns = self._station_columns(batch)
+        n_slots = max(self.meta["n_slots"], slot + 1)
+        self._ensure_rows(n_slots)
+
+        for column in VALUE_FILES:
+            values = np.asarray(batch[column], dtype=np.int64)
+            self._files[column][slot, columns] = np.clip(values, 0, np.iinfo(DTYPE).max)
+            self._files[column].flush()
+
+        # Data first, then the metadata readers use to bound their view
+        self.meta["n_slots"] = n_slots
+        _write_json(os.path.join(self.root, META_FILE), self.meta)
+        self._reload()
+        return len(columns)
+
+    def _station_columns(self, batch):
+        index = {station_id: i for i, station_id in enumerate(self.station_ids)}
+        columns = []
+        for station_id, name, lat, lon in zip(
+            batch["station_id"], batch["name"], batch["latitude"], batch["longitude"]
+        ):
+            column = index.get(station_id)
+            if column is None:
+                column = index[station_id] = len(self.station_ids)
+                self.station_ids.append(station_id)
+                self.names.append(name)
+                self.meta["latitude"].append(lat)
+                self.meta["longitude"].append(lon)
+            else:
+                self.names[column] = name
+            columns.append(column)
+
+        capacity = self._files["free_bikes"].shape[1]
+        if len(self.station_ids) > capacity:
+            self._widen(len(self.station_ids) + STATION_PADDING)
+        return np.asarray(columns)
+
+    @property
+    def _files(self):
+        if self._full is None:
+            self._full = {
+                column: np.load(os.path.join(self.root, filename), mmap_mode="r+")
+                for column, filename in VALUE_FILES.items()
+            }
+        return self._full
+
+    def _ensure_rows(self, n_slots):
+        capacity = self._files["free_bikes"].shape[0]
+        if n_slots <= capacity:
+            return
+        # Grow by a day of slots at a time rather than one row per snapshot
+        per_day = max(1, 86400 // self.slot_seconds)
+        rows = max(n_slots, capacity + per_day)
+        self._full = None
+        for filename in VALUE_FILES.values():
+            _grow_rows(os.path.join(self.root, filename), rows)
+
+    def _widen(self, columns):
+        """Rewrite the files with more station columns (rare: new stations)."""
+        rows = self._files["free_bikes"].shape[0]
+        for column, filename in VALUE_FILES.items():
+            path = os.path.join(self.root, filename)
+            old = self._files[column]
+            array = npy_format.open_memmap(path + ".tmp", mode="w+", dtype=DTYPE, shape=(rows, columns))
+            array[:] = MISSING
+            array[:, :old.shape[1]] = old
+            array.flush()
+            del array
+            os.replace(path + ".tmp", path)
+        self._full = None
+
+    def _reload(self):
+        n_slots, n_stations = self.meta["n_slots"], len(self.station_ids)
+        self._arrays = {
+            column: array[:n_slots, :n_stations] for column, array in self._files.items()
+        }
+
+    # ---- slicing -----------------------------------------------------------
+    def window(self, since=None, until=None):
+        """Views over the slots covering [since, until); stations unchanged."""
+        n_slots = self.meta["n_slots"]
+        lo = 0 if since is None else min(n_slots, max(0, self.slot_of(since)))
+        hi = n_slots if until is None else min(n_slots, max(lo, self._slot_after(until)))
+        meta = dict(self.meta, origin=self.origin + lo * self.slot_seconds, n_slots=hi - lo)
+        arrays = {column: array[lo:hi] for column, array in self._arrays.items()}
+        return StationTimeCube(self.root, meta, arrays)
+
+    # ---- reductions --------------------------------------------------------
+    def filled(self, column="free_bikes"):
+        """Forward-fill MISSING cells along time (leading gaps stay MISSING)."""
+        values = self._arrays[column]
+        valid = values != MISSING
+        last = np.where(valid, np.arange(len(values))[:, None], 0)
+        np.maximum.accumulate(last, axis=0, out=last)
+        filled = np.take_along_axis(values, last, axis=0)
+        seen = np.maximum.accumulate(valid, axis=0)
+        return np.where(seen, filled, MISSING).T
+
+    def movement(self):
+        """Per-station, per-slot |Δ free_bikes| against the previous sample."""
+        bikes = self.filled("free_bikes").astype(np.int32)
+        moves = np.zeros_like(bikes)
+        if bikes.shape[1] > 1:
+            counted = self.mask[:, 1:] & (bikes[:, :-1] != MISSING)
+            moves[:, 1:] = np.where(counted, np.abs(np.diff(bikes, axis=1)), 0)
+        return moves
+
+    def total_movement(self):
+        return pd.Series(self.movement().sum(axis=1), index=self.station_ids, name="movement")
+
+    def ranking(self, limit=10):
+        frame = pd.DataFrame({
+            "station_id": self.station_ids,
+            "name": self.names,
+            "movement": self.movement().sum(axis=1),
+        })
+        return frame.sort_values("movement", ascending=False).head(limit)
+
+    def citywide(self):
+        """Totals per slot, counting each station's samples only."""
+        mask = self.mask
+        frame = pd.DataFrame({
+            "timestamp": self.timestamps,
+            "samples": mask.sum(axis=0),
+            "free_bikes": np.where(mask, self.free_bikes, 0).sum(axis=0, dtype=np.int64),
+            "empty_slots": np.where(mask, self.empty_slots, 0).sum(axis=0, dtype=np.int64),
+            "movement": self.movement().sum(axis=0),
+        })
+        return frame[frame["samples"] > 0].reset_index(drop=True)
+
+    def weekday_hour_mean(self):
+        """Mean free bikes per (weekday, hour) over every station sample."""
+        mask = self.mask
+        sums = np.where(mask, self.free_bikes, 0).sum(axis=0, dtype=np.int64)
+        counts = mask.sum(axis=0)
+        stamps = self.timestamps
+        frame = pd.DataFrame({
+            "weekday": stamps.dayofweek,
+            "hour": stamps.hour,
+            "sum": sums,
+            "count": counts,
+        }).groupby(["weekday", "hour"]).sum()
+        frame = frame[frame["count"] > 0]
+        return (frame["sum"] / frame["count"]).unstack("hour")
+
+    def to_frame(self):
+        """Back to the long station_activity format (valid cells only)."""
+        stations, slots = np.nonzero(self.mask)
+        return pd.DataFrame({
+            "station_id": np.asarray(self.station_ids, dtype=object)[stations],
+            "name": np.asarray(self.names, dtype=object)[stations],
+            "free_bikes": self.free_bikes[stations, slots].astype(np.int64),
+            "empty_slots": self.empty_slots[stations, slots].astype(np.int64),
+            "latitude": np.asarray(self.meta["latitude"])[stations],
+            "longitude": np.asarray(self.meta["longitude"])[stations],
+            "timestamp": self.timestamps[slots],
+        })
+
+
+# -------------------------
+# Writer helpers
+# -------------------------
+def open_for_append(root=CUBE_ROOT, origin=None):
+    cube = StationTimeCube.open(root, writable=True)
+    return cube if cube is not None else StationTimeCube.create(root, origin=origin)
+
+
+def build_cube(df, root=CUBE_ROOT, slot_seconds=CUBE_SLOT_SECONDS):
+    """Create a cube from a long-format history frame (replaces any existing one)."""
+    if df.empty:
+        raise ValueError("no history to build the cube from")
+
+    stamps = pd.to_datetime(df["timestamp"], format="ISO8601", utc=True)
+    epoch = (stamps - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    df = df.assign(epoch=epoch).sort_values("epoch", kind="stable")
+    origin = int(df["epoch"].iloc[0])
+    origin -= origin % slot_seconds
+
+    codes, station_ids = pd.factorize(df["station_id"])
+    df = df.assign(column=codes, slot=(df["epoch"] - origin) // slot_seconds)
+    cells = df.drop_duplicates(["slot", "column"], keep="last")
+    stations = df.drop_duplicates("column", keep="last").sort_values("column")
+
+    os.makedirs(root, exist_ok=True)
+    rows, columns = int(df["slot"].max()) + 1, len(station_ids) + STATION_PADDING
+    for column, filename in VALUE_FILES.items():
+        path = os.path.join(root, filename)
+        _create_npy(path, rows, columns)
+        array = np.load(path, mmap_mode="r+")
+        values = cells[column].clip(0, np.iinfo(DTYPE).max).to_numpy()
+        array[cells["slot"].to_numpy(), cells["column"].to_numpy()] = values
+        array.flush()
+        del array
+
+    _write_json(os.path.join(root, META_FILE), {
+        "slot_seconds": slot_seconds,
+        "origin": origin,
+        "n_slots": rows,
+        "station_ids": [str(s) for s in station_ids],
+        "names": stations["name"].tolist(),
+        "latitude": stations["latitude"].tolist(),
+        "longitude": stations["longitude"].tolist(),
+    })
+    return StationTimeCube.open(root)
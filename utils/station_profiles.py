@@ -0,0 +1,233 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sklearn.cluster import MiniBatchKMeans
+
+from utils.rollups import GRAINS
+
+load_dotenv()
+
+PROFILE_CLUSTERS = int(os.getenv("PROFILE_CLUSTERS", 4))
+# Week hours are read in local time: commuting peaks are local
+PROFILE_TIMEZONE = os.getenv("PROFILE_TIMEZONE", "Europe/Paris")
+PROFILE_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_SIZE", 256))
+
+HOURLY = GRAINS["1h"]
+WEEK_HOURS = 7 * 24
+
+CLUSTER_COLUMNS = ["station_id", "cluster", "cluster_label"]
+
+
+def profile_rows_query(after_bucket=None, before_bucket=None):
+    """Closed hourly rollup buckets in (after_bucket, before_bucket)."""
+    sql = """
+        SELECT station_id, bucket, sum_bikes, sum_empty
+        FROM station_rollup
+        WHERE grain = ?
+    """
+    params = [HOURLY]
+    if after_bucket is not None:
+        sql += " AND bucket > ?"
+        params.append(int(after_bucket))
+    if before_bucket is not None:
+        sql += " AND bucket < ?"
+        params.append(int(before_bucket))
+    return sql, params
+
+
+def profile_version(conn, now=None):
+    """Last closed hourly bucket: profiles only change when an hour closes."""
+    now = int(pd.Timestamp.now(tz="UTC").timestamp()) if now is None else int(now)
+    current = now - now % HOURLY
+    row = conn.execute(
+        "SELECT MAX(bucket) FROM station_rollup WHERE grain = ? AND bucket < ?",
+        (HOURLY, current),
+    ).fetchone()
+    return row[0], current
+
+
+# -------------------------
+# Weekday × hour profiles
+# -------------------------
+class ProfileAccumulator:
+    """Running sums of bikes and capacity per (station, hour of the week).
+
+    Hourly rollups already hold sums, so folding new buckets in is a pair
+    of scatter-adds; no raw row is ever read.
+    """
+
+    def __init__(self, timezone=PROFILE_TIMEZONE):
+        self.timezone = timezone
+        self.station_ids = []
+        self._index = {}
+        self.bikes = np.zeros((0, WEEK_HOURS))
+        self.capacity = np.zeros((0, WEEK_HOURS))
+        self.through = None
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def _rows_for(self, station_ids):
+        new = [s for s in pd.unique(station_ids) if s not in self._index]
+        if new:
+            for station_id in new:
+                self._index[station_id] = len(self.station_ids)
+                self.station_ids.append(station_id)
+            pad = np.zeros((len(new), WEEK_HOURS))
+            self.bikes = np.vstack([self.bikes, pad])
+            self.capacity = np.vstack([self.capacity, pad])
+        return np.fromiter((self._index[s] for s in station_ids), dtype=np.int64, count=len(station_ids))
+
+    def add(self, rows):
+        """Fold rollup rows in; returns the indices of the stations touched."""
+        if rows.empty:
+            return np.array([], dtype=np.int64)
+        local = pd.to_datetime(rows["bucket"].to_numpy(), unit="s", utc=True).tz_convert(self.timezone)
+        week_hour = np.asarray(local.dayofweek * 24 + local.hour)
+        station_rows = self._rows_for(rows["station_id"].to_numpy())
+
+        bikes = rows["sum_bikes"].to_numpy(dtype=float)
+        np.add.at(self.bikes, (station_rows, week_hour), bikes)
+        np.add.at(self.capacity, (station_rows, week_hour), bikes + rows["sum_empty"].to_numpy(dtype=float))
+        self.through = int(rows["bucket"].max()) if self.through is None else max(self.through, int(rows["bucket"].max()))
+        return np.unique(station_rows)
+
+    def fill_ratio(self):
+        """Mean fill ratio per (station, week hour), NaN where never observed."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.capacity > 0, self.bikes / self.capacity, np.nan)
+
+    def features(self):
+        """Profiles centred on each station's own mean, unobserved hours at 0.
+
+        Centring keeps the shape (when a station fills and empties) and
+        drops its overall level, which mostly reflects its size.
+        """
+        ratio = self.fill_ratio()
+        observed = ~np.isnan(ratio)
+        counts = observed.sum(axis=1, keepdims=True)
+        means = np.where(observed, ratio, 0).sum(axis=1, keepdims=True) / np.maximum(counts, 1)
+        return np.where(observed, ratio - means, 0.0)
+
+
+def _hours(days, hours):
+    return np.array([d * 24 + h for d in days for h in hours])
+
+
+WEEKDAY_DAY = _hours(range(5), range(9, 17))
+WEEKDAY_NIGHT = _hours(range(5), list(range(0, 6)) + [22, 23])
+WEEKEND_DAY = _hours((5, 6), range(11, 19))
+
+
+def describe_clusters(centers, observed=None, margin=0.04):
+    """Readable label per cluster centre from its weekday/weekend shape.
+
+    `observed` masks the week hours with any data, so hours never seen do
+    not pull the day/night comparison towards zero.
+    """
+    observed = np.ones(WEEK_HOURS, dtype=bool) if observed is None else observed
+
+    def mean(center, hours):
+        hours = hours[observed[hours]]
+        return center[hours].mean() if len(hours) else np.nan
+
+    labels = []
+    for center in centers:
+        day, night, weekend = mean(center, WEEKDAY_DAY), mean(center, WEEKDAY_NIGHT), mean(center, WEEKEND_DAY)
+        if day - night > margin:
+            label = "Pôle d'activité"
+        elif night - day > margin:
+            label = "Résidentiel"
+        elif weekend - day > margin:
+            label = "Loisirs"
+        else:
+            label = "Mixte"
+        labels.append(label)
+
+    seen = {}
+    for i, label in enumerate(labels):
+        seen[label] = seen.get(label, 0) + 1
+        if seen[label] > 1:
+            labels[i] = f"{label} {seen[label]}"
+    return labels
+
+
+# -------------------------
+# Clustering
+# -------------------------
+class BehaviourClusters:
+    """Station clusters on weekday × hour profiles, memoized on the rollups.
+
+    `refresh` only does work when a new hourly bucket has closed: the new
+    buckets are folded into the profiles and the stations they touched feed
+    one MiniBatchKMeans.partial_fit step, so centres (and cluster ids) stay
+    stable from one hour to the next. Between hours it returns the cached
+    assignment.
+
+    A single new hour is not a profile, so each touched station is fed its
+    updated profile weighted by the share of its data that is new: centres
+    follow the new buckets instead of counting every station once more per
+    hour. The model is rebuilt when the first fit saw fewer stations than
+    `n_clusters` and more have appeared since.
+    """
+
+    def __init__(self, n_clusters=PROFILE_CLUSTERS, batch_size=PROFILE_BATCH_SIZE,
+                 timezone=PROFILE_TIMEZONE):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.timezone = timezone
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.profiles = ProfileAccumulator(self.timezone)
+        self.model = None
+        self.version = None
+        self._assignment = pd.DataFrame(columns=CLUSTER_COLUMNS)
+
+    def refresh(self, conn, now=None):
+        with self._lock:
+            version, current = profile_version(conn, now)
+            if version is None or version == self.version:
+                return self._assignment
+
+            sql, params = profile_rows_query(after_bucket=self.profiles.through, before_bucket=current)
+            before = self.profiles.capacity.sum(axis=1)
+            touched = self.profiles.add(pd.read_sql(sql, conn, params=params))
+            after = self.profiles.capacity.sum(axis=1)
+            # Share of each touched station's data that arrived with these buckets
+            before = np.pad(before, (0, len(after) - len(before)))[touched]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                new_share = np.where(after[touched] > 0, 1 - before / after[touched], 1.0)
+            features = self.profiles.features()
+            self._update_model(features, touched, new_share)
+            self.version = version
+
+            labels = self.model.predict(features)
+            names = describe_clusters(self.model.cluster_centers_, self.profiles.capacity.any(axis=0))
+            self._assignment = pd.DataFrame({
+                "station_id": self.profiles.station_ids,
+                "cluster": labels,
+                "cluster_label": [names[label] for label in labels],
+            })
+            return self._assignment
+
+    def _update_model(self, features, touched, new_share):
+        n_clusters = max(1, min(self.n_clusters, len(features)))
+        if self.model is None or self.model.n_clusters < n_clusters:
+            # First fit, or stations beyond the cluster count the model was built with
+            self.model = MiniBatchKMeans(
+                n_clusters=n_clusters, batch_size=self.batch_size, n_init=3, random_state=0
+            )
+            self.model.fit(features)
+        elif len(touched):
+            self.model.partial_fit(features[touched], sample_weight=new_share)
+
+    def centers(self):
+        """Cluster centres as a (cluster, week hour) frame of centred fill ratios."""
+        if self.model is None:
+            return pd.DataFrame()
+        return pd.DataFrame(self.model.cluster_centers_, columns=pd.RangeIndex(WEEK_HOURS, name="week_hour"))
@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fuzzy matches below this trigram similarity are dropped
+SEARCH_MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", 0.3))
+# How long a loader-backed index trusts its station list before re-reading it
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", 300))
+
+# Common short forms in station names, folded to one spelling
+ABBREVIATIONS = {
+    "st": "saint",
+    "ste": "sainte",
+    "pl": "place",
+    "av": "avenue",
+    "bd": "boulevard",
+    "bld": "boulevard",
+    "crs": "cours",
+}
+
+StationMatch = namedtuple("StationMatch", ["station_id", "name", "score", "prefix"])
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def fold_tokens(text):
+    """Lower-case, accent-free words of `text`, abbreviations expanded."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    plain = "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return [ABBREVIATIONS.get(word, word) for word in _WORD.findall(plain)]
+
+
+def fold(text):
+    """'Gare St-Jean' and 'gare saint jean' both fold to 'gare saint jean'."""
+    return " ".join(fold_tokens(text))
+
+
+def trigrams(tokens):
+    """pg_trgm-style trigrams: each word padded with two spaces before, one after."""
+    grams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# -------------------------
+# Index
+# -------------------------
+class StationSearchIndex:
+    """Accent-folded prefix lookup plus trigram ranking over station names.
+
+    Built once per station list. Every (word, station) pair sits in one
+    sorted array, so the stations with a word starting with a prefix are a
+    contiguous slice found by bisection; each query word must prefix some
+    word of the name. Fuzzy ranking is the trigram similarity
+    shared / (query + name − shared), where the shared counts for every
+    station come from one bincount over the query trigrams' posting lists.
+    Prefix matches rank first, then fuzzy ones.
+    """
+
+    def __init__(self, stations):
+        pairs = list(stations)
+        self.station_ids = [station_id for station_id, _ in pairs]
+        self.names = [str(name) for _, name in pairs]
+
+        words, owners = [], []
+        postings = {}
+        counts = np.zeros(len(pairs), dtype=np.int64)
+        for position, name in enumerate(self.names):
+            tokens = fold_tokens(name)
+            for token in set(tokens):
+                words.append(token)
+                owners.append(position)
+            grams = trigrams(tokens)
+            counts[position] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+
+        order = sorted(range(len(words)), key=words.__getitem__)
+        self._words = [words[i] for i in order]
+        self._owners = np.array([owners[i] for i in order], dtype=np.int64)
+        self._postings = {gram: np.array(owners, dtype=np.int64) for gram, owners in postings.items()}
+        self._trigram_counts = counts
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefixed(self, prefix):
+        lo = bisect_left(self._words, prefix)
+        hi = bisect_left(self._words, prefix + "\uffff", lo)
+        return self._owners[lo:hi]
+
+    def prefix_matches(self, tokens, raw_last=None):
+        """Mask of the stations where every token prefixes a word of the name.
+
+        `raw_last` is the last word as typed, before abbreviation expansion:
+        while it is being typed, "st" may as well be the start of "station".
+        """
+        hits = np.ones(len(self.names), dtype=bool)
+        for i, token in enumerate(tokens):
+            found = np.zeros(len(self.names), dtype=bool)
+            found[self._prefixed(token)] = True
+            if i == len(tokens) - 1 and raw_last and raw_last != token:
+                found[self._prefixed(raw_last)] = True
+            hits &= found
+        return hits
+
+    def similarity(self, tokens):
+        """Trigram similarity of the query to every station name."""
+        grams = trigrams(tokens)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return np.zeros(len(self.names))
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        return shared / (len(grams) + self._trigram_counts - shared)
+
+    def search(self, query, limit=10, min_similarity=SEARCH_MIN_SIMILARITY):
+        """Best `limit` StationMatch for `query`, prefix matches first."""
+        tokens = fold_tokens(query)
+        if not tokens or not self.names:
+            return []
+        raw = _WORD.findall(unicodedata.normalize("NFKD", str(query)).lower())
+        scores = self.similarity(tokens)
+        prefix = self.prefix_matches(tokens, raw[-1] if raw else None)
+
+        rank = scores + prefix
+        candidates = np.flatnonzero(prefix | (scores >= min_similarity))
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-rank[candidates], limit - 1)[:limit]]
+        candidates = sorted(candidates, key=lambda i: (-rank[i], self.names[i]))
+        return [
+            StationMatch(self.station_ids[i], self.names[i], round(float(scores[i]), 3), bool(prefix[i]))
+            for i in candidates
+        ]
+
+
+class StationSearchCache:
+    """One shared index, rebuilt only when the station list changes.
+
+    `index(stations)` compares a fingerprint of the (station_id, name)
+    pairs. Callers that have no snapshot in memory (the API) re-read the
+    list at most every `ttl_seconds`: through `get(loader)`, or by checking
+    `expired()` and passing what they read to `refresh`.
+    """
+
+    def __init__(self, ttl_seconds=SEARCH_INDEX_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._index = StationSearchIndex([])
+        self._loaded_at = 0.0
+
+    def index(self, stations):
+        pairs = sorted((str(station_id), str(name)) for station_id, name in stations)
+        fingerprint = hash(tuple(pairs))
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._index = StationSearchIndex(pairs)
+                self._fingerprint = fingerprint
+            return self._index
+
+    @property
+    def current(self):
+        return self._index
+
+    def expired(self):
+        return time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    def refresh(self, stations):
+        """`index(stations)` for a freshly read list: restarts the TTL."""
+        index = self.index(stations)
+        self._loaded_at = time.monotonic()
+        return index
+
+    def get(self, loader):
+        return self.refresh(loader()) if self.expired() else self.current